@@ -17,6 +17,66 @@ class Config:
     # 缓存配置
     CACHE_TYPE = 'simple'
     CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    CACHE_SWEEP_INTERVAL = float(os.environ.get('CACHE_SWEEP_INTERVAL', 60))
+    # 设置后启用SQLite共享缓存层，多个worker进程共享计算结果
+    CACHE_SHARED_PATH = os.environ.get('CACHE_SHARED_PATH')
+    # JWT校验结果缓存条目上限
+    TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 50000))
+    # 缓存的token重新核对用户版本号（table_versions中的user:<ID>行）的间隔秒数
+    TOKEN_VERSION_CHECK_SECONDS = float(os.environ.get('TOKEN_VERSION_CHECK_SECONDS', 1))
+    
+    # 推荐特征索引快照目录
+    FEATURE_INDEX_PATH = os.environ.get('FEATURE_INDEX_PATH', 'data/spot_features')
+    # 相似度检索后端：exact（精确）或 ivf（近似，适合百万级景点）
+    SIMILARITY_INDEX = os.environ.get('SIMILARITY_INDEX', 'exact')
+    SIMILARITY_N_PROBE = int(os.environ.get('SIMILARITY_N_PROBE', 8))
+    
+    # 协同过滤模型文件、隐因子数和每个用户预计算的推荐数
+    CF_MODEL_PATH = os.environ.get('CF_MODEL_PATH', 'data/cf_model.npz')
+    CF_FACTORS = int(os.environ.get('CF_FACTORS', 32))
+    CF_TOP_N = int(os.environ.get('CF_TOP_N', 50))
+    
+    # 路线规划局部搜索的时间预算（秒）
+    ROUTE_TIME_BUDGET = float(os.environ.get('ROUTE_TIME_BUDGET', 0.5))
+    # 行程规划：平均行驶速度（公里/小时）和景点未设置时的默认开放时间、游览时长
+    ROUTE_TRAVEL_SPEED_KMH = float(os.environ.get('ROUTE_TRAVEL_SPEED_KMH', 30))
+    DEFAULT_OPEN_HOUR = 8.0
+    DEFAULT_CLOSE_HOUR = 18.0
+    DEFAULT_VISIT_HOURS = 2.0
+    # 批量路线规划：共享距离矩阵目录、矩阵最多包含的景点数和worker进程数（默认CPU核数）
+    ROUTE_DISTANCE_CACHE_PATH = os.environ.get('ROUTE_DISTANCE_CACHE_PATH', 'data/route_distances')
+    ROUTE_DISTANCE_CACHE_MAX_SPOTS = int(os.environ.get('ROUTE_DISTANCE_CACHE_MAX_SPOTS', 10000))
+    # 未缓存（新增或坐标变化）的景点达到该数量且不少于已缓存景点数的该比例时才重建矩阵，否则临时计算
+    ROUTE_DISTANCE_CACHE_MIN_GROWTH = int(os.environ.get('ROUTE_DISTANCE_CACHE_MIN_GROWTH', 500))
+    ROUTE_DISTANCE_CACHE_GROWTH_RATIO = float(os.environ.get('ROUTE_DISTANCE_CACHE_GROWTH_RATIO', 0.25))
+    ROUTE_BATCH_WORKERS = int(os.environ.get('ROUTE_BATCH_WORKERS', 0)) or None
+    
+    # 地图聚合：聚合网格边长（像素，需整除256）和逐点显示的最大缩放级别
+    MAP_CLUSTER_CELL_PX = int(os.environ.get('MAP_CLUSTER_CELL_PX', 64))
+    MAP_MAX_CLUSTER_ZOOM = int(os.environ.get('MAP_MAX_CLUSTER_ZOOM', 16))
+    # 整体分布图和热力图最多发送到浏览器的要素数
+    MAP_MAX_FEATURES = int(os.environ.get('MAP_MAX_FEATURES', 500))
+    
+    # 景点聚类：模型版本目录（按簇数分子目录）和流式读取特征的块大小
+    CLUSTER_MODEL_PATH = os.environ.get('CLUSTER_MODEL_PATH', 'data/cluster_models')
+    CLUSTER_CHUNK_SIZE = int(os.environ.get('CLUSTER_CHUNK_SIZE', 10000))
+    # 自动选择簇数：拟合样本数、轮廓系数样本数和worker进程数（默认CPU核数）
+    CLUSTER_SELECTION_SAMPLE = int(os.environ.get('CLUSTER_SELECTION_SAMPLE', 20000))
+    CLUSTER_SILHOUETTE_SAMPLE = int(os.environ.get('CLUSTER_SILHOUETTE_SAMPLE', 5000))
+    CLUSTER_SELECTION_WORKERS = int(os.environ.get('CLUSTER_SELECTION_WORKERS', 0)) or None
+    
+    # 访客量批量预测：拟合使用的历史天数和预测天数
+    FORECAST_HISTORY_DAYS = int(os.environ.get('FORECAST_HISTORY_DAYS', 365))
+    FORECAST_HORIZON_DAYS = int(os.environ.get('FORECAST_HORIZON_DAYS', 30))
+    # 预测结果超过该小时数视为过期；景点近7天访客量相对预测时变化超过该比例时即时重算
+    FORECAST_MAX_AGE_HOURS = float(os.environ.get('FORECAST_MAX_AGE_HOURS', 24))
+    FORECAST_RECOMPUTE_THRESHOLD = float(os.environ.get('FORECAST_RECOMPUTE_THRESHOLD', 0.2))
+    # 单次读取请求最多当场重算的景点数，其余景点返回过期的预测
+    FORECAST_MAX_RECOMPUTE = int(os.environ.get('FORECAST_MAX_RECOMPUTE', 20))
+    # LSTM模型注册表目录（按景点和数据版本分子目录）
+    LSTM_MODEL_PATH = os.environ.get('LSTM_MODEL_PATH', 'data/lstm_models')
     
     # 日志配置
     LOG_LEVEL = 'INFO'
@@ -1,6 +1,10 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import logging
 
@@ -12,17 +16,90 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL not found in environment variables")
 
+class PoolMetrics:
+    """连接池签出次数和等待时间统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': self.total_wait / attempts * 1000 if attempts else 0.0,
+                'max_wait_ms': self.max_wait * 1000
+            }
+
+pool_metrics = PoolMetrics()
+
+class InstrumentedQueuePool(QueuePool):
+    """记录每次从池中取连接等待时间的QueuePool"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - start)
+        return connection
+
+def create_db_engine(url: str = DATABASE_URL, **overrides):
+    """按环境变量配置创建带连接池的数据库引擎"""
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'echo': os.getenv('DB_ECHO', 'false').lower() == 'true'
+    }
+    if url.startswith('sqlite'):
+        # 连接会在线程之间复用
+        options['connect_args'] = {'check_same_thread': False}
+    options.update(overrides)
+    return create_engine(url, **options)
+
+def get_pool_stats() -> dict:
+    """连接池当前状态和签出等待指标"""
+    pool = engine.pool
+    stats = pool_metrics.snapshot()
+    stats.update({
+        'pool_size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': pool.overflow()
+    })
+    return stats
+
 try:
     # 创建数据库引擎
-    engine = create_engine(DATABASE_URL)
-    
+    engine = create_db_engine()
+
     # 测试连接
     with engine.connect() as conn:
         pass
-        
+
 except Exception as e:
     logging.error(f"Database connection error: {str(e)}")
     raise
 
-# 创建Session类
-Session = sessionmaker(bind=engine) 
\ No newline at end of file
+# 按线程隔离的Session，在每个Flask请求或Streamlit运行结束时调用Session.remove()
+Session = scoped_session(sessionmaker(bind=engine))
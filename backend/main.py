@@ -1,14 +1,22 @@
 from flask import Flask, request
+from backend.database import Session
+from backend.routes.api import api_bp
 from backend.routes.auth import auth_bp
 from backend.utils.logger import request_logger
 
 app = Flask(__name__)
 app.register_blueprint(auth_bp, url_prefix='/auth')
+app.register_blueprint(api_bp, url_prefix='/api')
 
 @app.after_request
 def after_request(response):
     request_logger(request, response)
     return response
 
+@app.teardown_appcontext
+def remove_session(exception=None):
+    # 每个请求结束后归还连接并清空identity map
+    Session.remove()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -1,12 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import relationship
 from datetime import datetime
 
-# 创建数据库引擎
-engine = create_engine('sqlite:///tourism.db', echo=True)
 Base = declarative_base()
-Session = sessionmaker(bind=engine)
 
 class User(Base):
     __tablename__ = 'users'
@@ -30,15 +27,25 @@ class TouristSpot(Base):
     location = Column(String(200))
     latitude = Column(Float)
     longitude = Column(Float)
-    price = Column(Float)
+    # 价格分位数按价格顺序读取索引，地区中位数按(地区, 价格)索引读取
+    price = Column(Float, index=True)
     rating = Column(Float)
     description = Column(String(500))
-    user_id = Column(Integer, ForeignKey('users.id'))
+    # 开放时间（小时，如8.5表示8:30）和建议游览时长，为空时使用默认值
+    open_hour = Column(Float)
+    close_hour = Column(Float)
+    visit_hours = Column(Float)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
     
     user = relationship("User", back_populates="tourist_spots")
     visitor_data = relationship("VisitorData", back_populates="spot")
 
+    __table_args__ = (
+        Index('ix_tourist_spot_location_price', 'location', 'price'),
+    )
+
 class VisitorData(Base):
     __tablename__ = 'visitor_data'
     
@@ -50,8 +57,92 @@ class VisitorData(Base):
     
     spot = relationship("TouristSpot", back_populates="visitor_data")
 
+class VisitorRollup(Base):
+    """按景点和日/月/季度汇总的访客数据"""
+    __tablename__ = 'visitor_rollups'
+    
+    id = Column(Integer, primary_key=True)
+    spot_id = Column(Integer, ForeignKey('tourist_spots.id'), nullable=False)
+    granularity = Column(String(10), nullable=False)  # day / month / quarter
+    period_start = Column(DateTime, nullable=False)
+    visitor_count = Column(Integer, default=0)
+    revenue = Column(Float, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint('spot_id', 'granularity', 'period_start', name='uq_visitor_rollup'),
+        Index('ix_visitor_rollup_period', 'granularity', 'period_start'),
+    )
+
+class SpotVisitorStats(Base):
+    """每个景点的最新访客数据和滚动汇总，写入访客数据时维护"""
+    __tablename__ = 'spot_visitor_stats'
+    
+    spot_id = Column(Integer, ForeignKey('tourist_spots.id'), primary_key=True)
+    latest_visit_date = Column(DateTime)
+    latest_visitor_count = Column(Integer, default=0)
+    latest_revenue = Column(Float, default=0)
+    # 截至最新访客日期（含）的近7天、近30天访客量
+    visitors_7d = Column(Integer, default=0)
+    visitors_30d = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+
+class VisitorForecast(Base):
+    """预先计算的每个景点未来每日访客量，按景点和模型读取"""
+    __tablename__ = 'visitor_forecasts'
+    
+    spot_id = Column(Integer, ForeignKey('tourist_spots.id'), primary_key=True)
+    model = Column(String(20), primary_key=True)
+    forecast_date = Column(DateTime, primary_key=True)
+    horizon = Column(Integer)  # 预测日距最后有数据日期的天数，从1开始
+    visitor_count = Column(Float)
+    generated_at = Column(DateTime, default=datetime.now)
+
+class VisitorForecastMeta(Base):
+    """每个景点每个模型最近一次预测的生成信息和误差指标"""
+    __tablename__ = 'visitor_forecast_meta'
+    
+    spot_id = Column(Integer, ForeignKey('tourist_spots.id'), primary_key=True)
+    model = Column(String(20), primary_key=True)
+    horizon = Column(Integer)
+    generated_at = Column(DateTime, default=datetime.now, index=True)
+    # 预测使用的数据截止日期和截至当天近7天访客量，用于判断数据是否有明显变化
+    data_through = Column(DateTime)
+    recent_visitors = Column(Float)
+    mae = Column(Float)
+    mape = Column(Float)
+    r2 = Column(Float)
+
+class UserSpotInteraction(Base):
+    """用户对景点的浏览、到访等行为记录"""
+    __tablename__ = 'user_spot_interactions'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    spot_id = Column(Integer, ForeignKey('tourist_spots.id'), nullable=False, index=True)
+    kind = Column(String(10), nullable=False)  # view / visit
+    created_at = Column(DateTime, default=datetime.now)
+
+class UserRecommendation(Base):
+    """离线计算的用户个性化推荐结果（每个用户top-N）"""
+    __tablename__ = 'user_recommendations'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    spot_id = Column(Integer, ForeignKey('tourist_spots.id'), nullable=False)
+    score = Column(Float)
+    generated_at = Column(DateTime, default=datetime.now)
+
+class TableVersion(Base):
+    """每张表的变更版本号，用于生成ETag和使缓存失效"""
+    __tablename__ = 'table_versions'
+    
+    table_name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
+
 # 创建所有表
 def init_db():
+    from backend.database import engine
     Base.metadata.create_all(engine)
 
 if __name__ == "__main__":
@@ -1,17 +1,47 @@
+import json
 from functools import wraps
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, Response, stream_with_context
 from backend.utils.error_handler import APIError, DatabaseError, AuthenticationError, PermissionError, handle_error
 from backend.utils.validators import spot_schema
 from marshmallow import ValidationError
-from backend.services.auth import token_required, AuthService
+from backend.services.auth import AuthService
 from backend.services.data_manager import DataManager
 from backend.services.permission import PermissionService
+from backend.services.monitoring import MonitoringService
+from backend.services.analysis import AnalysisService
+from backend.services.route_planning import RoutePlanningService
+from backend.services.spatial_index import get_spatial_index
+from backend.services.map_aggregation import MapAggregationService
+from backend.services.spot_clustering import get_clustering_model
+from backend.services.forecast_store import ForecastStore
+from backend.utils.http import conditional, compress_response, to_json_safe
 
 api_bp = Blueprint('api', __name__)
 
+# 景点列表单页最大数量
+MAX_PAGE_SIZE = 1000
+# 单次批量路线规划的最大请求数
+MAX_ROUTE_BATCH = 1000
+# 单条路线的最大景点数
+MAX_ROUTE_SPOTS = 1000
+# 空间查询返回的最大景点数和最大搜索半径（公里）
+MAX_SPATIAL_RESULTS = 1000
+MAX_SEARCH_RADIUS_KM = 500
+# 单次聚类预测的最大景点数和允许的簇数范围
+MAX_CLUSTER_PREDICT = 1000
+MAX_CLUSTERS = 50
+# 单次读取预测的最大景点数
+MAX_FORECAST_SPOTS = 1000
+
 auth_service = AuthService()
 data_manager = DataManager()
 permission_service = PermissionService()
+monitoring_service = MonitoringService()
+analysis_service = AnalysisService()
+route_planning_service = RoutePlanningService()
+spatial_index = get_spatial_index()
+map_aggregation_service = MapAggregationService()
+forecast_store = ForecastStore()
 
 def token_required(f):
     @wraps(f)
@@ -34,14 +64,36 @@ def get_data(user):
         return jsonify({'message': '没有权限访问数据'}), 403
     # ... 处理请求 ... 
 
+@api_bp.after_request
+def compress(response):
+    return compress_response(response)
+
 @api_bp.route('/spots', methods=['GET'])
 @token_required
+@conditional(tables=('tourist_spots',))
 def get_spots(user):
+    limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_PAGE_SIZE)
+    after_id = request.args.get('after_id', type=int)
+    try:
+        columns = data_manager.resolve_spot_columns(request.args.get('fields'))
+    except ValueError as e:
+        raise APIError(str(e))
+
     try:
-        spots = data_manager.get_user_data(user.id)
+        # NDJSON模式逐行输出全部数据，不在内存中拼接整个结果
+        if request.args.get('format') == 'ndjson' or \
+                request.accept_mimetypes.best == 'application/x-ndjson':
+            rows = data_manager.iter_user_spots(user.id, columns, after_id)
+            return Response(
+                stream_with_context(json.dumps(row, ensure_ascii=False) + '\n' for row in rows),
+                mimetype='application/x-ndjson'
+            )
+
+        spots = data_manager.get_user_spots_page(user.id, limit, after_id, columns)
         return jsonify({
             'success': True,
-            'data': spots.to_dict('records')
+            'data': spots,
+            'next_after_id': spots[-1]['id'] if len(spots) == limit else None
         })
     except Exception as e:
         return jsonify({
@@ -79,4 +131,217 @@ def update_spot(user, spot_id):
         updated = data_manager.update_spot(spot_id, data)
         return jsonify({'success': True, 'data': updated})
     except Exception as e:
-        raise DatabaseError(str(e))
\ No newline at end of file
+        raise DatabaseError(str(e))
+
+@api_bp.route('/monitoring/db-pool', methods=['GET'])
+@token_required
+def get_db_pool_stats(user):
+    if not user.is_admin:
+        return jsonify({'message': '没有权限访问数据'}), 403
+    return jsonify({
+        'success': True,
+        'data': monitoring_service.get_db_pool_stats()
+    })
+
+@api_bp.route('/analysis/location-distribution', methods=['GET'])
+@token_required
+@conditional(tables=('tourist_spots',))
+def get_location_distribution(user):
+    return jsonify({
+        'success': True,
+        'data': to_json_safe(analysis_service.get_location_distribution())
+    })
+
+@api_bp.route('/analysis/price', methods=['GET'])
+@token_required
+@conditional(tables=('tourist_spots',))
+def get_price_analysis(user):
+    return jsonify({
+        'success': True,
+        'data': to_json_safe({
+            'summary': analysis_service.get_price_analysis(),
+            'bands': analysis_service.get_price_bands(),
+            'rating_buckets': analysis_service.get_rating_buckets()
+        })
+    })
+
+@api_bp.route('/analysis/time-series', methods=['GET'])
+@token_required
+@conditional(tables=('visitor_data', 'visitor_rollups'))
+def get_time_series(user):
+    spot_id = request.args.get('spot_id', type=int)
+    return jsonify({
+        'success': True,
+        'data': to_json_safe(analysis_service.time_series_analysis(spot_id))
+    })
+
+@api_bp.route('/routes/batch', methods=['POST'])
+@token_required
+def plan_routes_batch(user):
+    data = request.get_json() or {}
+    requests = data.get('requests')
+    if not isinstance(requests, list) or not requests:
+        raise APIError('requests不能为空')
+    if len(requests) > MAX_ROUTE_BATCH:
+        raise APIError(f'单次最多规划{MAX_ROUTE_BATCH}条路线')
+    for req in requests:
+        _validate_route_request(req)
+    return jsonify({
+        'success': True,
+        'data': to_json_safe(route_planning_service.plan_routes_batch(requests))
+    })
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _validate_route_request(req):
+    """检查单条路线请求：spot_ids为整数列表，start_point为范围内的[纬度, 经度]"""
+    if not isinstance(req, dict):
+        raise APIError('每条路线需要spot_ids和start_point')
+    spot_ids = req.get('spot_ids')
+    if (not isinstance(spot_ids, list) or not spot_ids
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in spot_ids)):
+        raise APIError('spot_ids需为非空的整数列表')
+    if len(spot_ids) > MAX_ROUTE_SPOTS:
+        raise APIError(f'每条路线最多包含{MAX_ROUTE_SPOTS}个景点')
+    start_point = req.get('start_point')
+    if (not isinstance(start_point, list) or len(start_point) != 2
+            or not all(_is_number(v) for v in start_point)
+            or not -90 <= start_point[0] <= 90 or not -180 <= start_point[1] <= 180):
+        raise APIError('start_point需为范围内的[纬度, 经度]')
+    if not isinstance(req.get('return_to_start', True), bool):
+        raise APIError('return_to_start需为布尔值')
+
+@api_bp.route('/clusters/predict', methods=['POST'])
+@token_required
+def predict_clusters(user):
+    """用已训练的聚类模型为新景点分配簇，不触发重新训练"""
+    data = request.get_json() or {}
+    spots = data.get('spots')
+    n_clusters = data.get('n_clusters', 3)
+    if not isinstance(spots, list) or not spots:
+        raise APIError('spots不能为空')
+    if len(spots) > MAX_CLUSTER_PREDICT:
+        raise APIError(f'单次最多预测{MAX_CLUSTER_PREDICT}个景点')
+    if not isinstance(n_clusters, int) or not 2 <= n_clusters <= MAX_CLUSTERS:
+        raise APIError(f'n_clusters需在2到{MAX_CLUSTERS}之间')
+    model = get_clustering_model(n_clusters)
+    # 只使用已训练的模型（包括其他进程训练的新版本），请求中不训练
+    model.reload_if_newer()
+    if model.kmeans is None:
+        raise APIError(f'簇数为{n_clusters}的聚类模型尚未训练', 503)
+    try:
+        features = [[spot.get('price'), spot.get('rating')] for spot in spots]
+        clusters = model.predict(features)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise APIError(f'无法预测聚类: {e}')
+    return jsonify({
+        'success': True,
+        'data': {'clusters': clusters, 'model_version': model.version}
+    })
+
+@api_bp.route('/forecasts', methods=['GET'])
+@token_required
+def get_forecasts(user):
+    """读取预先计算的访客量预测，结果带生成时间和是否过期"""
+    try:
+        spot_ids = [int(i) for i in request.args.get('spot_ids', '').split(',') if i.strip()]
+    except ValueError:
+        raise APIError('spot_ids格式错误')
+    if not spot_ids:
+        raise APIError('spot_ids不能为空')
+    if len(spot_ids) > MAX_FORECAST_SPOTS:
+        raise APIError(f'单次最多读取{MAX_FORECAST_SPOTS}个景点的预测')
+    model = request.args.get('model', ForecastStore.LINEAR_MODEL)
+    if model not in ForecastStore.MODELS:
+        raise APIError(f'model需为{"、".join(ForecastStore.MODELS)}之一')
+    days = request.args.get('days', type=int)
+    if days is not None and days < 1:
+        raise APIError('days必须大于0')
+    forecasts = forecast_store.get_many(list(dict.fromkeys(spot_ids)), model, days)
+    return jsonify({'success': True, 'data': to_json_safe(forecasts)})
+
+def _coordinate_arg(name: str, bound: float) -> float:
+    value = request.args.get(name, type=float)
+    if value is None or not -bound <= value <= bound:
+        raise APIError(f'{name}参数缺失或超出范围')
+    return value
+
+def _spatial_response(spot_ids, columns, distances=None):
+    """按查询结果顺序返回景点信息，有距离时附加distance_km"""
+    spots = data_manager.get_spots_by_ids(spot_ids, columns)
+    if distances:
+        for spot in spots:
+            spot['distance_km'] = round(distances[spot['id']], 3)
+    return jsonify({'success': True, 'data': spots})
+
+def _spot_columns():
+    try:
+        return data_manager.resolve_spot_columns(request.args.get('fields'))
+    except ValueError as e:
+        raise APIError(str(e))
+
+@api_bp.route('/spots/nearby', methods=['GET'])
+@token_required
+@conditional(tables=('tourist_spots',))
+def get_nearby_spots(user):
+    latitude, longitude = _coordinate_arg('lat', 90), _coordinate_arg('lon', 180)
+    radius_km = min(max(request.args.get('radius_km', 5, type=float), 0), MAX_SEARCH_RADIUS_KM)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_SPATIAL_RESULTS)
+    columns = _spot_columns()
+    spatial_index.refresh()
+    matches = spatial_index.radius(latitude, longitude, radius_km, limit)
+    return _spatial_response([i for i, _ in matches], columns, dict(matches))
+
+@api_bp.route('/spots/nearest', methods=['GET'])
+@token_required
+@conditional(tables=('tourist_spots',))
+def get_nearest_spots(user):
+    latitude, longitude = _coordinate_arg('lat', 90), _coordinate_arg('lon', 180)
+    k = min(max(request.args.get('k', 10, type=int), 1), MAX_SPATIAL_RESULTS)
+    columns = _spot_columns()
+    spatial_index.refresh()
+    matches = spatial_index.nearest(latitude, longitude, k)
+    return _spatial_response([i for i, _ in matches], columns, dict(matches))
+
+@api_bp.route('/spots/viewport', methods=['GET'])
+@token_required
+@conditional(tables=('tourist_spots',))
+def get_viewport_spots(user):
+    south, north = _coordinate_arg('south', 90), _coordinate_arg('north', 90)
+    west, east = _coordinate_arg('west', 180), _coordinate_arg('east', 180)
+    if south > north:
+        raise APIError('south不能大于north')
+    limit = min(max(request.args.get('limit', 500, type=int), 1), MAX_SPATIAL_RESULTS)
+    columns = _spot_columns()
+    spatial_index.refresh()
+    return _spatial_response(spatial_index.viewport(south, west, north, east, limit), columns)
+
+def _zoom_arg() -> int:
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None or not 0 <= zoom <= 22:
+        raise APIError('zoom参数缺失或超出范围')
+    return zoom
+
+@api_bp.route('/map/clusters', methods=['GET'])
+@token_required
+@conditional(tables=('tourist_spots',))
+def get_map_clusters(user):
+    zoom = _zoom_arg()
+    south, north = _coordinate_arg('south', 90), _coordinate_arg('north', 90)
+    west, east = _coordinate_arg('west', 180), _coordinate_arg('east', 180)
+    if south > north:
+        raise APIError('south不能大于north')
+    try:
+        features = map_aggregation_service.get_clusters(zoom, south, west, north, east)
+    except ValueError as e:
+        raise APIError(str(e))
+    return jsonify({'success': True, 'data': features})
+
+@api_bp.route('/map/tiles/<int:zoom>/<int:x>/<int:y>', methods=['GET'])
+@token_required
+@conditional(tables=('tourist_spots',))
+def get_map_tile(user, zoom, x, y):
+    if not 0 <= zoom <= 22 or not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+        raise APIError('瓦片坐标超出范围')
+    return jsonify({'success': True, 'data': map_aggregation_service.get_tile(zoom, x, y)})
@@ -1,105 +1,174 @@
+from typing import Union
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 import folium
 import tensorflow as tf
-from models import Session, TouristSpot, VisitorData
+from backend.database import Session
+from backend.models import VisitorData
+from backend.services.forecast_store import ForecastStore
+from backend.services.forecasting import BatchForecaster
+from backend.services.hotspots import dbscan_haversine, summarize_hotspots
+from backend.services.lstm_registry import get_lstm_registry
+from backend.services.map_aggregation import MapAggregationService
+from backend.services.spot_clustering import get_clustering_model, select_n_clusters
+from backend.utils.cache import cached
 
 class AdvancedAnalysis:
     def __init__(self):
-        self.session = Session()
-        
-    def cluster_analysis(self, n_clusters: int = 3) -> dict:
-        """景区聚类分析"""
-        spots = self.session.query(TouristSpot).all()
-        features = np.array([[s.price, s.rating] for s in spots])
-        
-        scaler = StandardScaler()
-        features_scaled = scaler.fit_transform(features)
-        
-        kmeans = KMeans(n_clusters=n_clusters)
-        clusters = kmeans.fit_predict(features_scaled)
-        
+        self.session = Session
+        self.map_aggregation = MapAggregationService()
+        self.lstm_registry = get_lstm_registry()
+        self.forecast_store = ForecastStore(self.session)
+        
+    def cluster_analysis(self, n_clusters: Union[int, str] = 3, mode: str = 'attributes',
+                         eps_km: float = 1.0, min_samples: int = 10) -> dict:
+        """景区聚类分析
+
+        Args:
+            n_clusters: 簇数，为'auto'时按select_n_clusters的推荐值，结果附带selection诊断信息
+            mode: attributes按价格和评分做KMeans聚类，只使用已发布的模型版本（包括其他进程
+                或离线任务训练的），数据变更时在后台线程增量训练，请求中不训练；
+                还没有任何模型时返回status为training的空结果。
+                spatial按坐标做密度聚类，返回旅游热点区域
+                （eps_km为邻域半径，min_samples为核心点的最少景点数）
+        """
+        if mode == 'spatial':
+            return self._hotspot_analysis(eps_km, min_samples)
+        selection = None
+        if n_clusters == 'auto':
+            selection = self.select_n_clusters()
+            if selection['recommended'] is None:
+                return {'spot_ids': [], 'clusters': [], 'centers': [], 'model_version': 0,
+                        'selection': selection}
+            n_clusters = selection['recommended']
+        model = get_clustering_model(n_clusters)
+        model.reload_if_newer()
+        training = model.schedule_refresh()
+        if model.kmeans is None:
+            result = {'status': 'training', 'spot_ids': [], 'clusters': [], 'centers': [],
+                      'model_version': 0}
+        else:
+            result = dict(self._cluster_assignments(n_clusters, model.version),
+                          status='training' if training else 'ready')
+        if selection is not None:
+            result['selection'] = selection
+        return result
+
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',))
+    def _cluster_assignments(self, n_clusters: int, model_version: int) -> dict:
+        """用指定版本的聚类模型为全部景点分配簇，按模型版本和景点表版本缓存"""
+        model = get_clustering_model(n_clusters)
+        spot_ids, clusters = model.predict_all()
         return {
-            'clusters': clusters.tolist(),
-            'centers': kmeans.cluster_centers_.tolist()
+            'spot_ids': spot_ids,
+            'clusters': clusters,
+            'centers': model.kmeans.cluster_centers_.tolist(),
+            'model_version': model.version
         }
-        
-    def spatial_analysis(self) -> folium.Map:
-        """地理空间分析"""
-        spots = self.session.query(TouristSpot).all()
-        
-        # 创建地图
-        center_lat = np.mean([spot.latitude for spot in spots])
-        center_lng = np.mean([spot.longitude for spot in spots])
-        
-        m = folium.Map(location=[center_lat, center_lng], zoom_start=5)
-        
-        # 添加景点标记
-        for spot in spots:
-            folium.Marker(
-                [spot.latitude, spot.longitude],
-                popup=f"{spot.name}\n价格: {spot.price}\n评分: {spot.rating}"
-            ).add_to(m)
+
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',))
+    def select_n_clusters(self, min_k: int = 2, max_k: int = 10) -> dict:
+        """并行评估min_k到max_k的簇数，返回推荐的k和各k的惯性、轮廓系数"""
+        return select_n_clusters(range(min_k, max_k + 1), session=self.session)
+        
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',))
+    def _hotspot_analysis(self, eps_km: float, min_samples: int) -> dict:
+        """基于球面距离的DBSCAN热点检测"""
+        index = self.map_aggregation.spatial_index
+        index.refresh()
+        ids, latitudes, longitudes, _ = index.snapshot()
+        labels = dbscan_haversine(latitudes, longitudes, eps_km, min_samples)
+        return {
+            'hotspots': summarize_hotspots(ids, latitudes, longitudes, labels, eps_km),
+            'noise': int((labels < 0).sum()),
+            'eps_km': eps_km,
+            'min_samples': min_samples
+        }
+
+    def spatial_analysis(self, zoom: int = 5) -> folium.Map:
+        """地理空间分析
+
+        景点在服务端按缩放级别聚合后再添加到地图，景点过多时自动降低缩放级别，
+        地图上的要素数不超过MAP_MAX_FEATURES。
+        """
+        overview = self.map_aggregation.get_overview(zoom)
+        features = overview['features']
+        if not features:
+            return folium.Map(zoom_start=zoom)
+        
+        # 创建地图，中心为所有景点的质心
+        counts = np.array([f['count'] for f in features])
+        center_lat = np.average([f['latitude'] for f in features], weights=counts)
+        center_lng = np.average([f['longitude'] for f in features], weights=counts)
+        
+        m = folium.Map(location=[center_lat, center_lng], zoom_start=overview['zoom'])
+        
+        # 单个景点显示标记，多个景点显示带数量的聚合圆点
+        popups = self.map_aggregation.get_spot_popups(
+            [f['spot_id'] for f in features if f['spot_id'] is not None])
+        for feature in features:
+            location = [feature['latitude'], feature['longitude']]
+            spot = popups.get(feature['spot_id'])
+            if spot is not None:
+                folium.Marker(
+                    location,
+                    popup=f"{spot.name}\n价格: {spot.price}\n评分: {spot.rating}"
+                ).add_to(m)
+            else:
+                folium.CircleMarker(
+                    location,
+                    radius=min(30, 8 + 4 * np.log2(feature['count'])),
+                    fill=True,
+                    popup=f"{feature['count']}个景点"
+                ).add_to(m)
             
         return m 
 
     def predict_visitors(self, spot_id: int, days: int = 30) -> dict:
-        """预测未来访客量"""
-        from sklearn.linear_model import LinearRegression
-        
-        historical_data = self.session.query(VisitorData)\
-            .filter_by(spot_id=spot_id)\
-            .order_by(VisitorData.visit_date).all()
-            
-        # 准备训练数据
-        X = np.array(range(len(historical_data))).reshape(-1, 1)
-        y = np.array([d.visitor_count for d in historical_data])
-        
-        # 训练模型
-        model = LinearRegression()
-        model.fit(X, y)
-        
-        # 预测
-        future_days = np.array(range(len(historical_data), len(historical_data) + days))
-        predictions = model.predict(future_days.reshape(-1, 1))
-        
+        """预测未来访客量（趋势+周季节模型）
+
+        直接读取预测存储，超出预存天数时按同一算法即时计算。
+        """
+        stored = self.forecast_store.get(spot_id, ForecastStore.LINEAR_MODEL, days)
+        if stored is not None and len(stored['forecasts']) >= days:
+            return {
+                'predictions': [f['visitor_count'] for f in stored['forecasts']],
+                'confidence': stored['metrics']['r2'],
+                'generated_at': stored['generated_at'],
+                'stale': stored['stale']
+            }
+        result = BatchForecaster(horizon=days, session=self.session).forecast([spot_id])
+        if not len(result['spot_ids']):
+            return {'predictions': [], 'confidence': None}
         return {
-            'predictions': predictions.tolist(),
-            'confidence': model.score(X, y)
-        } 
+            'predictions': result['predictions'][0].tolist(),
+            'confidence': float(result['r2'][0])
+        }
 
     def predict_with_lstm(self, spot_id: int, days: int = 30) -> dict:
-        """使用LSTM进行深度学习预测"""
-        # 获取历史数据
-        data = self.session.query(VisitorData)\
-            .filter_by(spot_id=spot_id)\
-            .order_by(VisitorData.visit_date).all()
-        
-        # 准备训练数据
-        sequence_length = 7
-        X, y = self._prepare_sequences(data, sequence_length)
-        
-        # 构建LSTM模型
-        model = tf.keras.Sequential([
-            tf.keras.layers.LSTM(50, activation='relu', input_shape=(sequence_length, 1)),
-            tf.keras.layers.Dense(1)
-        ])
-        
-        # 训练模型
-        model.compile(optimizer='adam', loss='mse')
-        model.fit(X, y, epochs=100, verbose=0)
-        
-        # 预测
-        last_sequence = X[-1:]
-        predictions = []
-        for _ in range(days):
-            pred = model.predict(last_sequence)
-            predictions.append(pred[0, 0])
-            last_sequence = np.roll(last_sequence, -1)
-            last_sequence[0, -1, 0] = pred[0, 0]
-        
+        """使用LSTM进行深度学习预测
+
+        优先读取预测存储；超出预存天数或还没有预存结果时用注册表中已训练的
+        模型推理，数据有更新时先返回旧模型的结果（stale为True）并在后台
+        重新训练，还没有模型时status为training。
+
+        未命中预测存储时的开销：首次读取该景点的权重文件（约50KB，之后在进程内
+        缓存），在共用模型中换入权重，再做ceil(days/HORIZON)次前向计算；共用模型
+        同一时间只服务一个景点，大量景点应由forecast_store.refresh_lstm离线预测。
+        """
+        stored = self.forecast_store.get(spot_id, ForecastStore.LSTM_MODEL, days)
+        if stored is not None and len(stored['forecasts']) >= days:
+            return {
+                'predictions': [f['visitor_count'] for f in stored['forecasts']],
+                'confidence': None,
+                'generated_at': stored['generated_at'],
+                'stale': stored['stale']
+            }
+        result = self.lstm_registry.predict([spot_id], days)[spot_id]
+        if result is None:
+            return {'predictions': [], 'confidence': None, 'status': 'training'}
         return {
-            'predictions': predictions,
-            'confidence': model.evaluate(X, y, verbose=0)
-        } 
\ No newline at end of file
+            'predictions': result['predictions'],
+            'confidence': result['loss'],
+            'model_version': result['version'],
+            'stale': result['stale']
+        }
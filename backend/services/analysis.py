@@ -1,64 +1,186 @@
+import sqlite3
 import pandas as pd
 import numpy as np
+from typing import Dict, List, Optional
 from sklearn.cluster import KMeans
+from sqlalchemy import case, func
 from backend.database import Session
 from backend.models import TouristSpot, VisitorData
 from datetime import datetime
-from .cache_manager import CacheManager
+from backend.utils.cache import CacheManager, cached
+from .rollup import RollupService
 
 class AnalysisService:
+    # 价格区间和评分分桶边界
+    PRICE_BANDS = [0, 50, 100, 200, 500]
+    RATING_BUCKETS = [0, 1, 2, 3, 4, 5]
+
     def __init__(self):
-        self.session = Session()
+        self.session = Session
         self.cache_manager = CacheManager()
     
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',),
+            key=lambda self: f"location_dist_{datetime.now().date()}")
     def get_location_distribution(self) -> dict:
         """获取景点地理分布统计"""
-        cache_key = f"location_dist_{datetime.now().date()}"
-        cached_data = self.cache_manager.get(cache_key)
-        if cached_data:
-            return cached_data
-        
-        spots = self.session.query(TouristSpot).all()
-        distribution = {}
-        for spot in spots:
-            if spot.location not in distribution:
-                distribution[spot.location] = 0
-            distribution[spot.location] += 1
-        
-        self.cache_manager.set(cache_key, distribution)
-        return distribution
+        rows = self.session.query(TouristSpot.location, func.count(TouristSpot.id))\
+            .group_by(TouristSpot.location).all()
+        return {location: count for location, count in rows}
+
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',))
+    def get_location_stats(self) -> dict:
+        """按地区统计景点数量、价格（含中位数）和评分"""
+        medians = self._location_price_medians()
+        rows = self.session.query(
+            TouristSpot.location,
+            func.count(TouristSpot.id),
+            func.avg(TouristSpot.price),
+            func.min(TouristSpot.price),
+            func.max(TouristSpot.price),
+            func.avg(TouristSpot.rating)
+        ).group_by(TouristSpot.location).all()
+
+        return {
+            location: {
+                'count': count,
+                'avg_price': avg_price,
+                'min_price': min_price,
+                'max_price': max_price,
+                'median_price': medians.get(location),
+                'avg_rating': avg_rating
+            }
+            for location, count, avg_price, min_price, max_price, avg_rating in rows
+        }
     
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',))
     def get_price_analysis(self) -> dict:
         """价格分析"""
-        prices = [spot.price for spot in self.session.query(TouristSpot).all()]
+        count, average, min_price, max_price = self.session.query(
+            func.count(TouristSpot.price),
+            func.avg(TouristSpot.price),
+            func.min(TouristSpot.price),
+            func.max(TouristSpot.price)
+        ).one()
+        return {
+            'average': average,
+            'median': self.get_price_percentile(0.5, count),
+            'max': max_price,
+            'min': min_price
+        }
+
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',))
+    def get_price_percentile(self, q: float, count: Optional[int] = None) -> Optional[float]:
+        """计算价格分位数（线性插值，与numpy.percentile一致）
+
+        SQLite和MySQL都没有PERCENTILE_CONT，这里按价格排序后用OFFSET只取插值所需的
+        两行。精确分位数必须按价格顺序走过约q*N行，价格列有索引时只读索引、不排序；
+        结果按tourist_spots的版本号缓存，每次数据变化只计算一次。
+        """
+        if count is None:
+            count = self.session.query(func.count(TouristSpot.price)).scalar()
+        if not count:
+            return None
+        return self._interpolate(self.session.query(TouristSpot.price)
+                                 .filter(TouristSpot.price.isnot(None)), q, count)
+
+    def _location_price_medians(self) -> Dict[str, float]:
+        """各地区价格中位数
+
+        支持窗口函数时（SQLite 3.25+、MySQL 8、MariaDB 10.2+）用一次查询按地区编号，
+        只取每个地区中间的一到两行求平均；否则逐个地区用OFFSET取中间行。
+        """
+        priced = TouristSpot.price.isnot(None)
+        if not self._supports_window_functions():
+            counts = self.session.query(TouristSpot.location, func.count(TouristSpot.price))\
+                .filter(priced).group_by(TouristSpot.location).all()
+            return {
+                location: self._interpolate(self.session.query(TouristSpot.price)
+                                            .filter(priced, TouristSpot.location == location), 0.5, count)
+                for location, count in counts
+            }
+
+        ranked = self.session.query(
+            TouristSpot.location.label('location'),
+            TouristSpot.price.label('price'),
+            func.row_number().over(partition_by=TouristSpot.location,
+                                   order_by=TouristSpot.price).label('price_rank'),
+            func.count().over(partition_by=TouristSpot.location).label('price_total')
+        ).filter(priced).subquery()
+        # 奇数行取第(n+1)/2行，偶数行取第n/2和n/2+1行，即2*rank落在[n, n+2]内
+        rows = self.session.query(ranked.c.location, func.avg(ranked.c.price))\
+            .filter(2 * ranked.c.price_rank >= ranked.c.price_total,
+                    2 * ranked.c.price_rank <= ranked.c.price_total + 2)\
+            .group_by(ranked.c.location).all()
+        return dict(rows)
+
+    def _interpolate(self, query, q: float, count: int) -> Optional[float]:
+        """按价格排序后用OFFSET取第q分位的两行并线性插值"""
+        position = q * (count - 1)
+        lower = int(position)
+        values = [row[0] for row in query.order_by(TouristSpot.price).offset(lower).limit(2).all()]
+        if not values:
+            return None
+        if len(values) == 1:
+            return values[0]
+        return values[0] + (values[1] - values[0]) * (position - lower)
+
+    def _supports_window_functions(self) -> bool:
+        dialect = self.session.get_bind().dialect
+        if dialect.name == 'sqlite':
+            return sqlite3.sqlite_version_info >= (3, 25)
+        if dialect.name == 'mysql':
+            return dialect.is_mariadb or (dialect.server_version_info or (0,)) >= (8,)
+        return True
+
+    def get_price_bands(self) -> dict:
+        """价格区间分布"""
+        band = self._bucket_expression(TouristSpot.price, self.PRICE_BANDS)
+        rows = self.session.query(band, func.count(TouristSpot.id))\
+            .filter(TouristSpot.price.isnot(None))\
+            .group_by(band).all()
+        return dict(rows)
+
+    def get_rating_buckets(self) -> dict:
+        """评分分段统计"""
+        bucket = self._bucket_expression(TouristSpot.rating, self.RATING_BUCKETS)
+        rows = self.session.query(bucket, func.count(TouristSpot.id), func.avg(TouristSpot.price))\
+            .filter(TouristSpot.rating.isnot(None))\
+            .group_by(bucket).all()
         return {
-            'average': np.mean(prices),
-            'median': np.median(prices),
-            'max': max(prices),
-            'min': min(prices)
+            label: {'count': count, 'avg_price': avg_price}
+            for label, count, avg_price in rows
         }
 
-    def time_series_analysis(self) -> dict:
-        """时间序列分析"""
-        visitor_data = self.session.query(VisitorData).all()
-        df = pd.DataFrame([{
-            'date': v.visit_date,
-            'count': v.visitor_count,
-            'revenue': v.revenue
-        } for v in visitor_data])
+    def _bucket_expression(self, column, edges: List[float]):
+        """按边界生成分桶标签的CASE表达式（SQLite/MySQL通用），低于下界的值单独成桶"""
+        whens = [(column < edges[0], f"<{edges[0]}")]
+        whens += [
+            (column < upper, f"{lower}-{upper}")
+            for lower, upper in zip(edges, edges[1:])
+        ]
+        return case(*whens, else_=f"{edges[-1]}+")
+
+    @cached(ttl=3600, stale_ttl=600, tables=('visitor_data', 'visitor_rollups'))
+    def time_series_analysis(self, spot_id: Optional[int] = None) -> dict:
+        """时间序列分析（只读取月/季度汇总表）"""
+        rollups = RollupService(self.session)
         
-        # 按月统计
-        monthly = df.set_index('date').resample('M').sum()
+        # 按月统计，补齐没有数据的月份
+        monthly = rollups.get_series('month', spot_id)
+        if not monthly.empty:
+            monthly = monthly.asfreq('MS', fill_value=0)
         
         # 计算环比增长
         monthly['growth_rate'] = monthly['count'].pct_change() * 100
         
         # 季节性分析
-        seasonal = df.set_index('date').resample('Q').sum()
+        seasonal = rollups.get_series('quarter', spot_id)
+        if not seasonal.empty:
+            seasonal = seasonal.asfreq('QS', fill_value=0)
         
         return {
             'monthly_stats': monthly.to_dict(),
             'seasonal_stats': seasonal.to_dict(),
-            'total_visitors': df['count'].sum(),
-            'total_revenue': df['revenue'].sum()
-        } 
\ No newline at end of file
+            'total_visitors': seasonal['count'].sum(),
+            'total_revenue': seasonal['revenue'].sum()
+        }
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+class ExactIndex:
+    """精确内积检索（向量已L2归一化时即余弦相似度）
+
+    同时作为近似索引的基线和评估召回率的参照。
+    """
+
+    kind = 'exact'
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self._sorted = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        """用全量数据重建索引"""
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self._invalidate()
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        """增量插入，已存在的ID会被覆盖"""
+        ids = np.asarray(ids, dtype=np.int64)
+        self.remove(ids)
+        self.ids = np.concatenate([self.ids, ids])
+        self.vectors = np.vstack([self.vectors, np.asarray(vectors, dtype=np.float32)])
+        self._invalidate()
+
+    def remove(self, ids: Sequence[int]):
+        """删除指定ID，不存在的ID忽略"""
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64))
+        if not keep.all():
+            self._keep(keep)
+            self._invalidate()
+
+    def vectors_for(self, ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """返回(存在的ID, 对应向量)"""
+        positions = self._positions(ids)
+        found = positions >= 0
+        return np.asarray(ids, dtype=np.int64)[found], self.vectors[positions[found]]
+
+    def search(self, queries: np.ndarray, k: int,
+               n_probe: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+        """返回每个查询向量内积最大的k个(ID, 分数)，n_probe仅对近似索引有效"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return [[] for _ in queries]
+        scores = queries @ self.vectors.T
+        return [self._top_k(self.ids, row, k) for row in scores]
+
+    def save(self, path: str):
+        """以.npy文件保存到新的目录，便于内存映射加载
+
+        目录写完后不再修改，由调用方整体发布（见backend.utils.snapshots），
+        读者不会读到新旧文件混合的快照。
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, array in self._arrays().items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self._meta(), f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """加载索引快照；mmap为True时数组按需从磁盘读取，修改时才复制到内存"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        index = _INDEX_TYPES[meta['kind']](**meta['params'])
+        mode = 'r' if mmap else None
+        arrays = {
+            name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode=mode)
+            for name in os.listdir(path) if name.endswith('.npy')
+        }
+        index._restore(arrays)
+        return index
+
+    def _top_k(self, ids: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _positions(self, ids: Sequence[int]) -> np.ndarray:
+        if self._sorted is None:
+            self._sorted = np.argsort(self.ids, kind='stable')
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1)
+        sorted_ids = self.ids[self._sorted]
+        slots = np.clip(np.searchsorted(sorted_ids, ids), 0, len(sorted_ids) - 1)
+        positions = self._sorted[slots]
+        positions[sorted_ids[slots] != ids] = -1
+        return positions
+
+    def _keep(self, mask: np.ndarray):
+        self.ids = np.asarray(self.ids)[mask]
+        self.vectors = np.asarray(self.vectors)[mask]
+
+    def _invalidate(self):
+        self._sorted = None
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        return {'ids': self.ids, 'vectors': self.vectors}
+
+    def _meta(self) -> dict:
+        return {'kind': self.kind, 'params': {'dim': self.dim}}
+
+    def _restore(self, arrays: Dict[str, np.ndarray]):
+        self.ids = arrays['ids']
+        self.vectors = arrays['vectors']
+        self._invalidate()
+
+class IVFIndex(ExactIndex):
+    """倒排文件(IVF)近似检索
+
+    用球面k-means把向量划分到n_lists个簇，查询时只扫描与查询向量
+    最接近的n_probe个簇；n_probe越大召回率越高、延迟越大。
+    新插入的向量直接分配到最近的簇中心，数据分布明显变化后调用build重训练。
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim: int, n_lists: Optional[int] = None, n_probe: int = 8,
+                 train_sample: int = 50000, n_iter: int = 20, seed: int = 0):
+        super().__init__(dim)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_sample = train_sample
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self._order = None
+        self._offsets = None
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray):
+        super().build(ids, vectors)
+        self.centroids = self._train(self.vectors)
+        self.assignments = self._assign(self.vectors)
+        logging.info(f"IVF index built: {len(self.ids)} vectors, {len(self.centroids)} lists")
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        super().add(ids, vectors)
+        if not len(self.centroids):
+            # 尚未训练时用全部数据训练
+            self.build(self.ids, self.vectors)
+            return
+        self.assignments = np.concatenate([np.asarray(self.assignments), self._assign(vectors)])
+        self._invalidate()
+
+    def search(self, queries: np.ndarray, k: int,
+               n_probe: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if not len(self.ids) or not len(self.centroids):
+            return super().search(queries, k)
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        order, offsets = self._inverted_lists()
+
+        probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+        results = []
+        for query, lists in zip(queries, probes):
+            candidates = np.concatenate([order[offsets[l]:offsets[l + 1]] for l in lists])
+            scores = self.vectors[candidates] @ query
+            results.append(self._top_k(self.ids[candidates], scores, k))
+        return results
+
+    def _train(self, vectors: np.ndarray) -> np.ndarray:
+        """球面k-means训练簇中心（只用采样数据）"""
+        n = len(vectors)
+        if n == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(n, min(n, self.train_sample), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            # 空簇保留原中心
+            filled = counts > 0
+            centroids[filled] = sums[filled]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            centroids = centroids / norms
+        return centroids.astype(np.float32)
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            block = vectors[start:start + batch_size]
+            labels[start:start + batch_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        # 按簇排序后的向量位置和每个簇的起止偏移，变更后延迟重算
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind='stable')
+            counts = np.bincount(self.assignments, minlength=len(self.centroids))
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self._order, self._offsets
+
+    def _keep(self, mask: np.ndarray):
+        super()._keep(mask)
+        self.assignments = np.asarray(self.assignments)[mask]
+
+    def _invalidate(self):
+        super()._invalidate()
+        self._order = None
+        self._offsets = None
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        arrays = super()._arrays()
+        arrays.update({'centroids': self.centroids, 'assignments': self.assignments})
+        return arrays
+
+    def _meta(self) -> dict:
+        return {
+            'kind': self.kind,
+            'params': {
+                'dim': self.dim,
+                'n_lists': self.n_lists,
+                'n_probe': self.n_probe,
+                'train_sample': self.train_sample,
+                'n_iter': self.n_iter,
+                'seed': self.seed
+            }
+        }
+
+    def _restore(self, arrays: Dict[str, np.ndarray]):
+        super()._restore(arrays)
+        self.centroids = arrays['centroids']
+        self.assignments = arrays['assignments']
+
+_INDEX_TYPES = {cls.kind: cls for cls in (ExactIndex, IVFIndex)}
+
+def create_index(kind: str, dim: int, **params) -> ExactIndex:
+    """按名称创建检索后端"""
+    if kind not in _INDEX_TYPES:
+        raise ValueError(f"Unknown similarity index: {kind}")
+    return _INDEX_TYPES[kind](dim, **params)
+
+def benchmark_recall(index: ExactIndex, queries: np.ndarray, k: int = 10,
+                     n_probes: Sequence[int] = (1, 2, 4, 8, 16, 32)) -> List[dict]:
+    """对比近似检索与精确检索，返回不同n_probe下的recall@k和平均延迟"""
+    exact = ExactIndex(index.dim)
+    exact.build(np.asarray(index.ids), np.asarray(index.vectors))
+
+    start = time.perf_counter()
+    truth = [{spot_id for spot_id, _ in row} for row in exact.search(queries, k)]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    report = []
+    for n_probe in n_probes:
+        start = time.perf_counter()
+        results = index.search(queries, k, n_probe=n_probe)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        hits = sum(len(expected & {spot_id for spot_id, _ in row})
+                   for expected, row in zip(truth, results))
+        report.append({
+            'n_probe': n_probe,
+            f'recall@{k}': hits / max(1, sum(len(expected) for expected in truth)),
+            'latency_ms': latency_ms,
+            'exact_latency_ms': exact_ms
+        })
+    return report
+
+if __name__ == '__main__':
+    # 用随机数据评估召回率和延迟：python -m backend.services.ann_index [向量数] [维度]
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(n, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    ivf = IVFIndex(dim)
+    ivf.build(np.arange(n), data)
+    for row in benchmark_recall(ivf, data[rng.choice(n, 200, replace=False)]):
+        print(row)
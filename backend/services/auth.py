@@ -1,15 +1,105 @@
-from models import Session, User
+from backend.database import Session
+from backend.models import User
 import bcrypt
 import datetime
+import hashlib
 import logging
+import threading
+import time
+from dataclasses import dataclass
 from typing import Tuple, Optional
 import jwt
 from datetime import timedelta
-from config import Config
+from backend.config import Config
+from backend.utils.cache import CacheManager
+from backend.utils.versioning import bump_table_versions, get_table_versions
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """token校验时缓存的用户信息快照"""
+    id: int
+    username: str
+    email: Optional[str]
+    is_admin: bool
+    data_access_level: int
+
+    @classmethod
+    def from_user(cls, user: User) -> 'UserSnapshot':
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            is_admin=bool(user.is_admin),
+            data_access_level=user.data_access_level
+        )
+
+def user_version_key(user_id: int) -> str:
+    """用户在table_versions中的版本号行"""
+    return f'user:{user_id}'
+
+class TokenCache:
+    """token -> (解码后的claims, 用户快照) 的有界缓存
+
+    条目在token过期时失效；用户信息变更时递增table_versions中该用户的
+    版本号（所有进程共享），旧版本的条目即使还在缓存中也不再命中。
+    各进程每个用户最多每check_interval秒读取一次版本号。
+    """
+
+    def __init__(self, max_entries: int = Config.TOKEN_CACHE_MAX_ENTRIES,
+                 check_interval: float = Config.TOKEN_VERSION_CHECK_SECONDS):
+        self._cache = CacheManager(max_entries=max_entries, shared=False)
+        self.check_interval = check_interval
+        # 用户ID -> (版本号, 读取时间)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def user_version(self, session, user_id: int) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._versions.get(user_id)
+        if entry is not None and now - entry[1] < self.check_interval:
+            return entry[0]
+        key = user_version_key(user_id)
+        version = get_table_versions(session, [key])[key]
+        with self._lock:
+            self._versions[user_id] = (version, now)
+        return version
+
+    def get(self, session, token: str) -> Optional[Tuple[dict, UserSnapshot]]:
+        entry = self._cache.get(self._key(token))
+        if entry is None:
+            return None
+        payload, snapshot, version = entry
+        if version != self.user_version(session, snapshot.id):
+            return None
+        return payload, snapshot
+
+    def set(self, token: str, payload: dict, snapshot: UserSnapshot, version: int):
+        ttl = payload.get('exp', 0) - time.time()
+        if ttl > 0:
+            self._cache.set(self._key(token), (payload, snapshot, version), ttl)
+
+    def forget_user(self, user_id: int):
+        """丢弃本进程缓存的用户版本号，下次校验时重新读取"""
+        with self._lock:
+            self._versions.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    def _key(self, token: str) -> str:
+        return 'token:' + hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+token_cache = TokenCache()
+
+def invalidate_user_tokens(session, user_id: int):
+    """用户信息或权限变更时调用（在提交之前），提交后所有进程中该用户的token缓存失效"""
+    bump_table_versions(session, [user_version_key(user_id)])
+    token_cache.forget_user(user_id)
 
 class AuthService:
     def __init__(self):
-        self.session = Session()
+        self.session = Session
         self.logger = logging.getLogger(__name__)
         self.secret_key = "your-secret-key"  # 在实际应用中应该使用环境变量
     
@@ -45,16 +135,28 @@ class AuthService:
             return True, "登录成功"
         return False, "用户名或密码错误"
         
-    def verify_token(self, token: str) -> Optional[User]:
-        """验证用户token"""
+    def verify_token(self, token: str) -> Optional[UserSnapshot]:
+        """验证用户token，命中缓存时只按间隔核对用户版本号，不查询用户表"""
+        if token.startswith('Bearer '):
+            token = token[len('Bearer '):]
+        
         try:
+            cached = token_cache.get(self.session, token)
+            if cached:
+                return cached[1]
             payload = jwt.decode(token, Config.SECRET_KEY, algorithms=['HS256'])
+            # 先取版本号再查库，查询期间发生的变更会让这条缓存直接失效
+            version = token_cache.user_version(self.session, payload['user_id'])
             user = self.session.query(User).get(payload['user_id'])
-            return user
+            if not user:
+                return None
+            snapshot = UserSnapshot.from_user(user)
+            token_cache.set(token, payload, snapshot, version)
+            return snapshot
         except:
             return None
 
-    def generate_token(self, user: User) -> str:
+    def generate_token(self, user) -> str:
         """
         生成JWT token
         """
@@ -0,0 +1,197 @@
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.linalg import svds
+from sqlalchemy import delete, insert, literal, union_all
+from backend.config import Config
+from backend.database import Session
+from backend.models import TouristSpot, UserRecommendation, UserSpotInteraction
+from backend.utils.versioning import bump_table_versions
+
+class CollaborativeFilteringModel:
+    """基于截断SVD的协同过滤
+
+    离线流式读取用户-景点行为（拥有、浏览、到访）构建CSR稀疏矩阵，
+    分解后按用户分块计算top-N写入user_recommendations表，在线只需按主键读取。
+    景点隐因子保存到磁盘，新用户可以用少量行为直接折叠(fold-in)计算推荐。
+    """
+
+    # 各类行为的权重
+    WEIGHTS = {'own': 3.0, 'visit': 2.0, 'view': 1.0}
+    # 按用户分块计算推荐时每块的用户数，限制打分矩阵内存
+    USER_BLOCK = 1024
+
+    def __init__(self, path: Optional[str] = Config.CF_MODEL_PATH,
+                 n_factors: int = Config.CF_FACTORS,
+                 top_n: int = Config.CF_TOP_N, session=None):
+        self.path = path
+        self.n_factors = n_factors
+        self.top_n = top_n
+        self.session = session or Session
+        self.spot_ids = None
+        self.item_factors = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def build_interaction_matrix(self, batch_size: int = 100000) -> Tuple[csr_matrix, np.ndarray, np.ndarray]:
+        """分批读取行为数据构建用户×景点CSR矩阵
+
+        Returns:
+            (矩阵, 行对应的用户ID, 列对应的景点ID)
+        """
+        owned = self.session.query(
+            TouristSpot.user_id.label('user_id'),
+            TouristSpot.id.label('spot_id'),
+            literal('own').label('kind')
+        ).filter(TouristSpot.user_id.isnot(None))
+        interacted = self.session.query(
+            UserSpotInteraction.user_id,
+            UserSpotInteraction.spot_id,
+            UserSpotInteraction.kind
+        )
+        stmt = union_all(owned.statement, interacted.statement)
+        result = self.session.execute(stmt, execution_options={'stream_results': True})
+
+        users, spots, weights = [], [], []
+        for partition in result.partitions(batch_size):
+            block = np.array([(row[0], row[1]) for row in partition], dtype=np.int64).reshape(-1, 2)
+            users.append(block[:, 0])
+            spots.append(block[:, 1])
+            weights.append(np.array([self.WEIGHTS.get(row[2], 0.0) for row in partition],
+                                    dtype=np.float32))
+
+        users = np.concatenate(users) if users else np.empty(0, dtype=np.int64)
+        spots = np.concatenate(spots) if spots else np.empty(0, dtype=np.int64)
+        weights = np.concatenate(weights) if weights else np.empty(0, dtype=np.float32)
+        user_ids, rows = np.unique(users, return_inverse=True)
+        spot_ids, cols = np.unique(spots, return_inverse=True)
+        matrix = coo_matrix((weights, (rows, cols)),
+                            shape=(len(user_ids), len(spot_ids))).tocsr()
+        matrix.sum_duplicates()
+        # 重复行为的收益递减
+        matrix.data = np.log1p(matrix.data)
+        return matrix, user_ids, spot_ids
+
+    def rebuild(self) -> int:
+        """重新训练并写入所有用户的推荐结果，返回用户数"""
+        start = time.perf_counter()
+        matrix, user_ids, spot_ids = self.build_interaction_matrix()
+        k = min(self.n_factors, min(matrix.shape) - 1)
+        if k < 1:
+            logging.warning("Not enough interactions to train collaborative filtering model")
+            return 0
+
+        u, s, vt = svds(matrix.astype(np.float64), k=k)
+        # 用户因子吸收奇异值，打分为 user_factors @ item_factors.T
+        user_factors = (u * s).astype(np.float32)
+        item_factors = vt.T.astype(np.float32)
+
+        table = UserRecommendation.__table__
+        generated_at = datetime.now()
+        try:
+            self.session.execute(delete(table))
+            for begin in range(0, len(user_ids), self.USER_BLOCK):
+                end = begin + self.USER_BLOCK
+                scores = user_factors[begin:end] @ item_factors.T
+                top = self._top_n(scores, matrix[begin:end])
+                records = [
+                    {
+                        'user_id': int(user_ids[begin + i]),
+                        'rank': rank,
+                        'spot_id': int(spot_ids[j]),
+                        'score': float(scores[i, j]),
+                        'generated_at': generated_at
+                    }
+                    for i, row in enumerate(top)
+                    for rank, j in enumerate(row)
+                ]
+                if records:
+                    self.session.execute(insert(table), records)
+            bump_table_versions(self.session, [UserRecommendation.__tablename__])
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logging.error(f"Collaborative filtering rebuild error: {e}")
+            raise
+
+        self.spot_ids, self.item_factors = spot_ids, item_factors
+        self.save()
+        logging.info(
+            f"Collaborative filtering model rebuilt: {len(user_ids)} users, "
+            f"{len(spot_ids)} spots, {matrix.nnz} interactions in {time.perf_counter() - start:.1f}s"
+        )
+        return len(user_ids)
+
+    def recommend(self, user_id: int, n: int) -> List[int]:
+        """读取预计算的推荐，没有结果（新用户）时用其行为折叠计算"""
+        rows = self.session.query(UserRecommendation.spot_id)\
+            .filter(UserRecommendation.user_id == user_id)\
+            .order_by(UserRecommendation.rank).limit(n).all()
+        if rows:
+            return [row[0] for row in rows]
+        return self.fold_in(user_id, n)
+
+    def fold_in(self, user_id: int, n: int) -> List[int]:
+        """用户不在训练数据中时，把其行为投影到景点隐因子空间计算推荐"""
+        if self.item_factors is None:
+            return []
+        interactions = self.session.query(UserSpotInteraction.spot_id, UserSpotInteraction.kind)\
+            .filter(UserSpotInteraction.user_id == user_id).all()
+        interactions += [(row[0], 'own') for row in self.session.query(TouristSpot.id)
+                         .filter(TouristSpot.user_id == user_id)]
+        if not interactions:
+            return []
+
+        row = np.zeros(len(self.spot_ids), dtype=np.float32)
+        positions = np.searchsorted(self.spot_ids, [spot_id for spot_id, _ in interactions])
+        for position, (spot_id, kind) in zip(positions, interactions):
+            if position < len(self.spot_ids) and self.spot_ids[position] == spot_id:
+                row[position] += self.WEIGHTS.get(kind, 0.0)
+        seen = row > 0
+        if not seen.any():
+            return []
+        row = np.log1p(row)
+
+        # 截断SVD下 u·Σ = r·V
+        scores = (row @ self.item_factors) @ self.item_factors.T
+        scores[seen] = -np.inf
+        top = self._top_n(scores[np.newaxis, :], None, n)[0]
+        return [int(self.spot_ids[j]) for j in top]
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, spot_ids=self.spot_ids, item_factors=self.item_factors)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        try:
+            with np.load(self.path) as data:
+                self.spot_ids = data['spot_ids']
+                self.item_factors = data['item_factors']
+        except Exception as e:
+            logging.error(f"Failed to load collaborative filtering model from {self.path}: {e}")
+
+    def _top_n(self, scores: np.ndarray, seen: Optional[csr_matrix],
+               n: Optional[int] = None) -> List[np.ndarray]:
+        """每行分数最高的n个列（排除已有行为的景点）"""
+        n = min(n or self.top_n, scores.shape[1])
+        if n <= 0:
+            return [np.empty(0, dtype=np.int64) for _ in range(scores.shape[0])]
+        if seen is not None:
+            rows, cols = seen.nonzero()
+            scores[rows, cols] = -np.inf
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return [row[np.isfinite(scores[i, row])] for i, row in enumerate(top)]
+
+if __name__ == '__main__':
+    # 夜间定时任务：python -m backend.services.collaborative_filtering
+    CollaborativeFilteringModel().rebuild()
@@ -1,12 +1,32 @@
 import pandas as pd
-from typing import List, Tuple
-from models import Session, TouristSpot, VisitorData
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+from backend.database import Session
+from backend.models import SpotVisitorStats, TouristSpot, VisitorData
+from backend.services.rollup import RollupService
+from backend.services.visitor_stats import VisitorStatsService
+from backend.utils.versioning import bump_table_versions
 import logging
 import json
+import os
+import time
 
 class DataManager:
+    # 流式导入时读取的列
+    IMPORT_COLUMNS = ['name', 'location', 'latitude', 'longitude', 'price']
+    # 景点列表接口可返回的列
+    SPOT_COLUMNS = ['id', 'name', 'location', 'latitude', 'longitude',
+                    'price', 'rating', 'description', 'open_hour', 'close_hour',
+                    'visit_hours', 'created_at']
+    # 单条IN查询的最大ID数量
+    IN_CLAUSE_BATCH = 1000
+    # 写入访客数据遇到死锁等可重试错误时的最多尝试次数
+    WRITE_ATTEMPTS = 3
+
     def __init__(self):
-        self.session = Session()
+        self.session = Session
     
     def import_csv_data(self, file_path: str, user_id: int) -> bool:
         try:
@@ -32,6 +52,99 @@ class DataManager:
             self.session.rollback()
             logging.error(f"Data import error: {e}")
             return False
+
+    def import_csv_stream(self, file_path: str, user_id: int,
+                          chunk_size: int = 10000,
+                          progress_callback: Optional[Callable[[dict], None]] = None,
+                          reject_path: Optional[str] = None) -> dict:
+        """分块流式导入CSV数据
+
+        按固定行数分块读取文件，每块用Core批量插入并单独提交，
+        峰值内存只取决于chunk_size，与文件大小无关。
+
+        Args:
+            file_path: CSV文件路径
+            user_id: 数据所有者ID
+            chunk_size: 每块行数
+            progress_callback: 每块处理完成后以当前统计信息回调
+            reject_path: 被拒绝行的输出文件（CSV），为空则只计数
+
+        Returns:
+            dict: 导入统计（读取行数、插入行数、拒绝行数、块数、耗时、每秒行数）
+        """
+        stats = {
+            'total_rows': 0,
+            'inserted': 0,
+            'rejected': 0,
+            'chunks': 0,
+            'failed_chunks': 0,
+            'elapsed': 0.0,
+            'rows_per_second': 0.0
+        }
+        if reject_path and os.path.exists(reject_path):
+            os.remove(reject_path)
+
+        insert_stmt = insert(TouristSpot.__table__)
+        start = time.perf_counter()
+        reader = pd.read_csv(
+            file_path,
+            chunksize=chunk_size,
+            usecols=lambda col: col in self.IMPORT_COLUMNS
+        )
+        for chunk in reader:
+            records, rejected = self._prepare_import_chunk(chunk, user_id)
+            stats['chunks'] += 1
+            stats['total_rows'] += len(chunk)
+
+            if records:
+                try:
+                    self.session.execute(insert_stmt, records)
+                    bump_table_versions(self.session, [TouristSpot.__tablename__])
+                    self.session.commit()
+                    stats['inserted'] += len(records)
+                except Exception as e:
+                    self.session.rollback()
+                    logging.error(f"Chunk {stats['chunks']} import error: {e}")
+                    stats['failed_chunks'] += 1
+                    rejected = chunk.reindex(columns=self.IMPORT_COLUMNS)
+
+            if len(rejected):
+                stats['rejected'] += len(rejected)
+                if reject_path:
+                    rejected.to_csv(reject_path, mode='a', index=False,
+                                    header=not os.path.exists(reject_path))
+
+            stats['elapsed'] = time.perf_counter() - start
+            stats['rows_per_second'] = stats['total_rows'] / stats['elapsed'] if stats['elapsed'] else 0.0
+            logging.info(
+                f"Import progress: {stats['total_rows']} rows, "
+                f"{stats['inserted']} inserted, {stats['rejected']} rejected, "
+                f"{stats['rows_per_second']:.0f} rows/s"
+            )
+            if progress_callback:
+                progress_callback(dict(stats))
+
+        return stats
+
+    def _prepare_import_chunk(self, chunk: pd.DataFrame,
+                              user_id: int) -> Tuple[List[dict], pd.DataFrame]:
+        """清洗一个数据块，返回待插入记录和被拒绝的行"""
+        chunk = chunk.reindex(columns=self.IMPORT_COLUMNS)
+        for col in ('latitude', 'longitude', 'price'):
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+
+        # 必填字段和长度校验
+        valid = chunk['name'].notna() & chunk['location'].notna()
+        valid &= chunk['name'].astype(str).str.len() <= 100
+        valid &= chunk['location'].astype(str).str.len() <= 200
+        # 坐标范围校验（允许为空）
+        valid &= chunk['latitude'].isna() | chunk['latitude'].between(-90, 90)
+        valid &= chunk['longitude'].isna() | chunk['longitude'].between(-180, 180)
+
+        accepted = chunk[valid].astype(object)
+        accepted = accepted.where(accepted.notna(), None)
+        accepted['user_id'] = user_id
+        return accepted.to_dict('records'), chunk[~valid]
             
     def clean_data(self, df: pd.DataFrame) -> pd.DataFrame:
         # 移除空值
@@ -69,14 +182,17 @@ class DataManager:
     def backup_data(self, backup_path: str) -> bool:
         """数据备份"""
         try:
-            df = pd.DataFrame([{
-                'id': spot.id,
-                'name': spot.name,
-                'location': spot.location,
-                'price': spot.price,
-                'rating': spot.rating,
-                'visitor_count': spot.visitor_data[-1].visitor_count if spot.visitor_data else 0
-            } for spot in self.session.query(TouristSpot).all()])
+            rows = self.session.query(
+                TouristSpot.id,
+                TouristSpot.name,
+                TouristSpot.location,
+                TouristSpot.price,
+                TouristSpot.rating,
+                func.coalesce(SpotVisitorStats.latest_visitor_count, 0).label('visitor_count')
+            ).outerjoin(SpotVisitorStats, SpotVisitorStats.spot_id == TouristSpot.id)\
+                .order_by(TouristSpot.id).all()
+            df = pd.DataFrame(rows, columns=['id', 'name', 'location', 'price',
+                                             'rating', 'visitor_count'])
             
             df.to_csv(backup_path, index=False)
             return True
@@ -101,6 +217,32 @@ class DataManager:
         self.session.commit()
         return success, failed 
 
+    def add_visitor_data(self, records: List[dict]) -> int:
+        """写入访客数据并增量更新汇总表
+
+        死锁、锁等待超时等可重试的错误最多尝试WRITE_ATTEMPTS次，
+        最终失败时回滚并抛出异常，不会静默丢弃这批数据。
+        """
+        for attempt in range(1, self.WRITE_ATTEMPTS + 1):
+            try:
+                visitor_data = [VisitorData(**record) for record in records]
+                self.session.add_all(visitor_data)
+                self.session.flush()
+                RollupService(self.session).apply(visitor_data)
+                VisitorStatsService(self.session).refresh_spots(v.spot_id for v in visitor_data)
+                self.session.commit()
+                return len(visitor_data)
+            except OperationalError as e:
+                self.session.rollback()
+                if attempt == self.WRITE_ATTEMPTS:
+                    logging.error(f"Visitor data write error after {attempt} attempts: {e}")
+                    raise
+                logging.warning(f"Visitor data write conflict, retrying ({attempt}): {e}")
+            except Exception as e:
+                self.session.rollback()
+                logging.error(f"Visitor data write error: {e}")
+                raise
+
     def get_user_data(self, user_id: int) -> pd.DataFrame:
         """获取用户的数据"""
         spots = self.session.query(TouristSpot)\
@@ -114,6 +256,64 @@ class DataManager:
             'rating': spot.rating
         } for spot in spots]) 
 
+    def resolve_spot_columns(self, fields: Optional[str]) -> List[str]:
+        """解析逗号分隔的字段列表，id始终返回（用作分页游标）"""
+        if not fields:
+            return list(self.SPOT_COLUMNS)
+        columns = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [c for c in columns if c not in self.SPOT_COLUMNS]
+        if unknown:
+            raise ValueError(f"未知字段: {', '.join(unknown)}")
+        return ['id'] + [c for c in columns if c != 'id']
+
+    def get_user_spots_page(self, user_id: int, limit: int = 100,
+                            after_id: Optional[int] = None,
+                            columns: Optional[Sequence[str]] = None) -> List[dict]:
+        """按ID游标分页获取用户的景点，只查询需要的列"""
+        stmt = self._user_spots_select(user_id, columns, after_id).limit(limit)
+        return [self._spot_row(row) for row in self.session.execute(stmt)]
+
+    def get_spots_by_ids(self, spot_ids: Sequence[int],
+                         columns: Optional[Sequence[str]] = None) -> List[dict]:
+        """按给定ID顺序返回景点，只查询需要的列"""
+        table = TouristSpot.__table__
+        columns = list(columns or self.SPOT_COLUMNS)
+        if 'id' not in columns:
+            columns = ['id'] + columns
+        rows = {}
+        spot_ids = list(spot_ids)
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            stmt = select(*[table.c[name] for name in columns])\
+                .where(table.c.id.in_(spot_ids[i:i + self.IN_CLAUSE_BATCH]))
+            rows.update((row.id, self._spot_row(row)) for row in self.session.execute(stmt))
+        return [rows[i] for i in spot_ids if i in rows]
+
+    def iter_user_spots(self, user_id: int, columns: Optional[Sequence[str]] = None,
+                        after_id: Optional[int] = None,
+                        batch_size: int = 1000) -> Iterator[dict]:
+        """通过服务端游标逐批读取用户的景点"""
+        stmt = self._user_spots_select(user_id, columns, after_id)
+        result = self.session.execute(stmt, execution_options={'stream_results': True})
+        for partition in result.partitions(batch_size):
+            for row in partition:
+                yield self._spot_row(row)
+
+    def _user_spots_select(self, user_id: int, columns: Optional[Sequence[str]],
+                           after_id: Optional[int]):
+        table = TouristSpot.__table__
+        stmt = select(*[table.c[name] for name in (columns or self.SPOT_COLUMNS)])\
+            .where(table.c.user_id == user_id)
+        if after_id is not None:
+            stmt = stmt.where(table.c.id > after_id)
+        return stmt.order_by(table.c.id)
+
+    def _spot_row(self, row) -> dict:
+        record = dict(row._mapping)
+        for key, value in record.items():
+            if isinstance(value, datetime):
+                record[key] = value.isoformat()
+        return record
+
     def save_sensitive_data(self, data: dict) -> bool:
         try:
             encrypted_data = self.encryption.encrypt_sensitive_data(
@@ -1,10 +1,17 @@
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy.orm import Query
 from backend.database import Session
 from backend.models import User, TouristSpot
+from backend.services.auth import invalidate_user_tokens
 
 class DataPermissionService:
+    # 各操作所需的最低权限级别
+    ACTION_LEVELS = {'read': 1, 'write': 2, 'delete': 3}
+    # 单条IN查询的最大ID数量
+    IN_CLAUSE_BATCH = 1000
+
     def __init__(self):
-        self.session = Session()
+        self.session = Session
     
     def check_permission(self, user_id: int, spot_id: int, action: str) -> bool:
         """检查用户是否有权限执行特定操作"""
@@ -14,40 +21,91 @@ class DataPermissionService:
         if not user or not spot:
             return False
             
+        return self._is_allowed(user, spot.user_id, action)
+
+    def check_permissions_bulk(self, user_id: int,
+                               spot_ids: List[int]) -> Dict[int, Dict[str, bool]]:
+        """批量判断用户对一组景点的读、写、删除权限
+
+        只查询景点ID和所有者两列，每批ID一次查询。
+
+        Returns:
+            Dict[int, Dict[str, bool]]: spot_id -> {'read': ..., 'write': ..., 'delete': ...}
+        """
+        denied = {action: False for action in self.ACTION_LEVELS}
+        user = self.session.query(User).get(user_id)
+        if not user:
+            return {spot_id: dict(denied) for spot_id in spot_ids}
+        
+        owners = {}
+        unique_ids = list(set(spot_ids))
+        for i in range(0, len(unique_ids), self.IN_CLAUSE_BATCH):
+            batch = unique_ids[i:i + self.IN_CLAUSE_BATCH]
+            owners.update(self.session.query(TouristSpot.id, TouristSpot.user_id)
+                          .filter(TouristSpot.id.in_(batch)).all())
+        
+        result = {}
+        for spot_id in spot_ids:
+            if spot_id not in owners:
+                result[spot_id] = dict(denied)
+            else:
+                result[spot_id] = {
+                    action: self._is_allowed(user, owners[spot_id], action)
+                    for action in self.ACTION_LEVELS
+                }
+        return result
+    
+    def get_accessible_spots(self, user_id: int, limit: int = 50,
+                             after_id: Optional[int] = None) -> List[TouristSpot]:
+        """按ID游标分页获取用户可访问的景点
+
+        Args:
+            user_id: 用户ID
+            limit: 每页数量
+            after_id: 上一页最后一个景点的ID，为空时从第一页开始
+        """
+        query = self.accessible_spots_query(user_id)
+        if query is None:
+            return []
+        if after_id is not None:
+            query = query.filter(TouristSpot.id > after_id)
+        return query.order_by(TouristSpot.id).limit(limit).all()
+
+    def iter_accessible_spots(self, user_id: int,
+                              batch_size: int = 1000) -> Iterator[TouristSpot]:
+        """流式遍历用户可访问的景点，每次只从游标取batch_size行"""
+        query = self.accessible_spots_query(user_id)
+        if query is None:
+            return iter(())
+        return query.order_by(TouristSpot.id).yield_per(batch_size)
+
+    def accessible_spots_query(self, user_id: int) -> Optional[Query]:
+        """构造用户可访问景点的查询，权限过滤在SQL中完成"""
+        user = self.session.query(User).get(user_id)
+        
+        if not user:
+            return None
+            
+        query = self.session.query(TouristSpot)
+        # 管理员和读写权限用户可以访问全部数据
+        if user.is_admin or user.data_access_level >= 2:
+            return query
+        return query.filter(TouristSpot.user_id == user_id)
+
+    def _is_allowed(self, user: User, owner_id: Optional[int], action: str) -> bool:
         # 管理员有所有权限
         if user.is_admin:
             return True
             
         # 数据所有者有所有权限
-        if spot.user_id == user_id:
+        if owner_id == user.id:
             return True
             
         # 其他用户根据access_level判断
-        if action == 'read':
-            return user.data_access_level >= 1
-        elif action == 'write':
-            return user.data_access_level >= 2
-        elif action == 'delete':
-            return user.data_access_level >= 3
-            
-        return False
-    
-    def get_accessible_spots(self, user_id: int) -> List[TouristSpot]:
-        """获取用户可访问的所有景点"""
-        user = self.session.query(User).get(user_id)
-        
-        if not user:
-            return []
-            
-        if user.is_admin:
-            return self.session.query(TouristSpot).all()
-            
-        # 根据用户权限级别返回数据
-        if user.data_access_level >= 2:
-            return self.session.query(TouristSpot).all()
-        else:
-            return self.session.query(TouristSpot)\
-                .filter(TouristSpot.user_id == user_id).all()
+        required = self.ACTION_LEVELS.get(action)
+        if required is None:
+            return False
+        return user.data_access_level >= required
     
     def grant_permission(self, admin_id: int, user_id: int, 
                         access_level: int) -> bool:
@@ -61,5 +119,6 @@ class DataPermissionService:
             return False
             
         user.data_access_level = access_level
+        invalidate_user_tokens(self.session, user_id)
         self.session.commit()
         return True 
\ No newline at end of file
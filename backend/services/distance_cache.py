@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import time
+from typing import Optional, Sequence, Tuple
+import numpy as np
+from backend.config import Config
+from backend.services.route_solver import solve_route
+from backend.utils.geo import haversine_matrix
+from backend.utils.snapshots import build_directory, current_snapshot, publish_snapshot, snapshot_lock
+
+class DistanceCache:
+    """按景点ID索引的两两距离矩阵，以.npy文件保存并内存映射读取
+
+    每次构建写入一个不可变的版本目录，再原子切换current指针，读者要么看到
+    完整的旧快照，要么看到完整的新快照。批量规划时把确切的快照目录传给
+    worker进程，重建期间正在运行的批次继续读取自己的版本。重建由文件锁串行化，
+    新增景点时只计算涉及新景点的距离，已缓存的部分直接从旧快照复制。
+
+    少量未缓存的景点不触发重建，求解时临时计算它们与路线中其他景点的距离；
+    未缓存的景点累积到已缓存数量的一定比例时才整体重建，矩阵按比例增长，
+    复制的总开销是均摊的。
+    """
+
+    # 矩阵按行分块计算写入，限制构建时的内存占用
+    BUILD_BLOCK = 1024
+
+    def __init__(self, path: str = Config.ROUTE_DISTANCE_CACHE_PATH, snapshot: Optional[str] = None):
+        self.path = path
+        self.snapshot = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.coordinates = np.empty((0, 2), dtype=np.float64)
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        snapshot = snapshot or (current_snapshot(path) if path else None)
+        if snapshot:
+            self.load(snapshot)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def cached_mask(self, ids: Sequence[int], coordinates: np.ndarray) -> np.ndarray:
+        """每个景点是否在当前快照中且坐标一致"""
+        positions = self.positions(ids)
+        cached = positions >= 0
+        cached[cached] = np.all(self.coordinates[positions[cached]]
+                                == np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)[cached], axis=1)
+        return cached
+
+    def covers(self, ids: Sequence[int], coordinates: np.ndarray) -> bool:
+        """当前快照是否包含给定景点且坐标一致"""
+        return bool(self.cached_mask(ids, coordinates).all())
+
+    def ensure(self, ids: Sequence[int], coordinates: np.ndarray) -> bool:
+        """未缓存的景点足够多时合并后重建，返回是否重建；其余情况由route_matrix临时计算"""
+        ids = np.asarray(ids, dtype=np.int64)
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        if not self._should_grow(ids, coordinates):
+            return False
+        with snapshot_lock(self.path):
+            # 等锁期间其他进程可能已经构建了包含这些景点的快照
+            latest = current_snapshot(self.path)
+            if latest and latest != self.snapshot:
+                self.load(latest)
+                if not self._should_grow(ids, coordinates):
+                    return False
+
+            # 保留坐标未变的已缓存景点，超出上限时只保留本次需要的景点；
+            # 旧快照目录保留到清理期限之后，正在使用它的批次不受影响
+            keep = ~np.isin(self.ids, ids)
+            merged_ids = np.concatenate([np.asarray(self.ids)[keep], ids])
+            merged_coordinates = np.vstack([np.asarray(self.coordinates)[keep], coordinates])
+            if len(merged_ids) > Config.ROUTE_DISTANCE_CACHE_MAX_SPOTS:
+                merged_ids, merged_coordinates = ids, coordinates
+            self.build(merged_ids, merged_coordinates)
+        return True
+
+    def build(self, ids: np.ndarray, coordinates: np.ndarray):
+        """计算距离矩阵并发布为新快照，调用方需持有snapshot_lock"""
+        start = time.perf_counter()
+        order = np.argsort(ids, kind='stable')
+        ids = np.asarray(ids, dtype=np.int64)[order]
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)[order]
+        os.makedirs(self.path, exist_ok=True)
+        directory = build_directory(self.path)
+
+        # 旧快照中坐标未变的景点之间的距离直接复制
+        old = self.positions(ids)
+        known = old >= 0
+        known[known] = np.all(self.coordinates[old[known]] == coordinates[known], axis=1)
+        known_idx, new_idx = np.flatnonzero(known), np.flatnonzero(~known)
+
+        matrix = np.lib.format.open_memmap(os.path.join(directory, 'matrix.npy'), mode='w+',
+                                           dtype=np.float32, shape=(len(ids), len(ids)))
+        for begin in range(0, len(ids), self.BUILD_BLOCK):
+            rows = np.arange(begin, min(begin + self.BUILD_BLOCK, len(ids)))
+            block = np.empty((len(rows), len(ids)), dtype=np.float32)
+            cached, fresh = rows[known[rows]], rows[~known[rows]]
+            if len(cached):
+                block[np.ix_(cached - begin, known_idx)] = self.matrix[np.ix_(old[cached], old[known_idx])]
+                block[np.ix_(cached - begin, new_idx)] = haversine_matrix(coordinates[cached],
+                                                                          coordinates[new_idx])
+            if len(fresh):
+                block[fresh - begin] = haversine_matrix(coordinates[fresh], coordinates)
+            matrix[begin:begin + len(rows)] = block
+        matrix.flush()
+        del matrix
+
+        np.save(os.path.join(directory, 'ids.npy'), ids)
+        np.save(os.path.join(directory, 'coordinates.npy'), coordinates)
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'spots': len(ids), 'reused': len(known_idx), 'built_at': time.time()}, f)
+        self.load(publish_snapshot(self.path, directory))
+        logging.info(f"Route distance cache built: {len(ids)} spots ({len(new_idx)} new) "
+                     f"in {time.perf_counter() - start:.2f}s")
+
+    def load(self, snapshot: str):
+        try:
+            self.ids = np.load(os.path.join(snapshot, 'ids.npy'))
+            self.coordinates = np.load(os.path.join(snapshot, 'coordinates.npy'))
+            self.matrix = np.load(os.path.join(snapshot, 'matrix.npy'), mmap_mode='r')
+            self.snapshot = snapshot
+        except Exception as e:
+            logging.error(f"Failed to load route distance cache from {snapshot}: {e}")
+
+    def positions(self, ids: Sequence[int]) -> np.ndarray:
+        """景点ID在矩阵中的行号，不存在的为-1"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1)
+        slots = np.clip(np.searchsorted(self.ids, ids), 0, len(self.ids) - 1)
+        return np.where(self.ids[slots] == ids, slots, -1)
+
+    def route_matrix(self, ids: Sequence[int], start_point: Tuple[float, float],
+                     coordinates: np.ndarray) -> np.ndarray:
+        """以起点为节点0、景点依次排列的距离矩阵
+
+        已缓存的景点之间读取矩阵，未缓存或坐标已变化的景点按coordinates临时计算。
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        positions = self.positions(ids)
+        cached = self.cached_mask(ids, coordinates)
+        known, fresh = np.flatnonzero(cached), np.flatnonzero(~cached)
+        dist = np.zeros((len(ids) + 1, len(ids) + 1))
+        inner = dist[1:, 1:]
+        inner[np.ix_(known, known)] = self.matrix[np.ix_(positions[known], positions[known])]
+        if len(fresh):
+            inner[fresh] = haversine_matrix(coordinates[fresh], coordinates)
+            inner[:, fresh] = inner[fresh].T
+        dist[0, 1:] = haversine_matrix([start_point], coordinates)[0]
+        dist[1:, 0] = dist[0, 1:]
+        return dist
+
+    def _should_grow(self, ids: np.ndarray, coordinates: np.ndarray) -> bool:
+        missing = int((~self.cached_mask(ids, coordinates)).sum())
+        return missing >= max(Config.ROUTE_DISTANCE_CACHE_MIN_GROWTH,
+                              Config.ROUTE_DISTANCE_CACHE_GROWTH_RATIO * len(self))
+
+# worker进程内打开的缓存，按任务中的快照目录切换
+_worker_cache: Optional[DistanceCache] = None
+
+def plan_route_worker(task: tuple) -> dict:
+    """在worker进程中求解一条路线，task为(快照目录, 景点ID列表, 景点坐标, 起点, 是否回到起点, 时间预算)"""
+    global _worker_cache
+    snapshot = task[0]
+    if _worker_cache is None or _worker_cache.snapshot != snapshot:
+        _worker_cache = DistanceCache(path=None, snapshot=snapshot)
+    return plan_route_task(_worker_cache, task[1:])
+
+def plan_route_task(cache: DistanceCache, task: tuple) -> dict:
+    """用给定的距离缓存求解一条路线
+
+    task为(景点ID列表, 景点坐标, 起点, 是否回到起点, 时间预算)，返回访问顺序、总距离和耗时。
+    """
+    spot_ids, coordinates, start_point, return_to_start, time_budget = task
+    start = time.perf_counter()
+    try:
+        dist = cache.route_matrix(spot_ids, start_point, coordinates)
+        order = solve_route(dist, time_budget, return_to_start)
+        path = [0] + order + ([0] if return_to_start else [])
+        return {
+            'route': [int(spot_ids[node - 1]) for node in order],
+            'total_distance': float(dist[path[:-1], path[1:]].sum()) if len(path) > 1 else 0.0,
+            'elapsed_ms': (time.perf_counter() - start) * 1000
+        }
+    except Exception as e:
+        logging.error(f"Batch route planning error: {e}")
+        return {'error': str(e), 'elapsed_ms': (time.perf_counter() - start) * 1000}
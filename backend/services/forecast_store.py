@@ -0,0 +1,272 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import delete
+from backend.config import Config
+from backend.database import Session
+from backend.models import SpotVisitorStats, VisitorForecast, VisitorForecastMeta, VisitorRollup
+from backend.services.forecasting import BatchForecaster
+from backend.utils.upsert import upsert
+from backend.utils.versioning import bump_table_versions
+
+# 本进程正在按需重算的景点
+_recomputing = set()
+_recompute_lock = threading.Lock()
+
+class ForecastStore:
+    """预先计算的访客量预测
+
+    定时任务重新计算所有景点的预测，写入visitor_forecasts（每个预测日一行）和
+    visitor_forecast_meta（生成时间、数据截止日期和误差指标），API按主键直接读取。
+    读取结果带生成时间和是否过期；景点有新数据且近7天访客量相对预测时的变化
+    超过FORECAST_RECOMPUTE_THRESHOLD时，线性模型当场只重算这些景点（每次请求
+    最多FORECAST_MAX_RECOMPUTE个，失败时返回已存储的结果），LSTM则等待模型注册表的后台训练和下一次定时刷新。
+    """
+
+    LINEAR_MODEL = BatchForecaster.MODEL
+    LSTM_MODEL = 'lstm'
+    MODELS = (LINEAR_MODEL, LSTM_MODEL)
+    TABLES = ('visitor_forecasts', 'visitor_forecast_meta')
+    # 单条IN查询的最大ID数量和每次批量写入的景点数
+    IN_CLAUSE_BATCH = 1000
+    WRITE_BLOCK = 2000
+
+    def __init__(self, session=None):
+        self.session = session or Session
+
+    def refresh_all(self, lstm: bool = True) -> Dict[str, int]:
+        """定时任务：重新计算所有景点的预测，返回每个模型写入的景点数"""
+        written = {self.LINEAR_MODEL: self.refresh_linear()}
+        if lstm:
+            written[self.LSTM_MODEL] = self.refresh_lstm()
+        return written
+
+    def refresh_linear(self, spot_ids: Optional[List[int]] = None) -> int:
+        """用批量线性模型重新预测指定景点（默认全部），返回写入的景点数"""
+        result = BatchForecaster(session=self.session).forecast(spot_ids)
+        records = [
+            {
+                'spot_id': int(spot_id),
+                'start_date': start_date,
+                'predictions': predictions,
+                'data_through': data_through,
+                'recent_visitors': float(recent),
+                'mae': _finite(mae),
+                'mape': _finite(mape),
+                'r2': _finite(r2)
+            }
+            for spot_id, start_date, predictions, data_through, recent, mae, mape, r2 in zip(
+                result['spot_ids'], result['start_dates'], result['predictions'].tolist(), result['data_through'],
+                result['recent_visitors'], result['mae'], result['mape'], result['r2'])
+        ]
+        return self.save(self.LINEAR_MODEL, records,
+                         spot_ids=None if spot_ids is None else [int(i) for i in spot_ids])
+
+    def refresh_lstm(self) -> int:
+        """用注册表中已训练的LSTM模型预测所有景点，不触发训练"""
+        # 按需导入，API进程读取预测时不加载TensorFlow
+        from backend.services.lstm_registry import get_lstm_registry
+        registry = get_lstm_registry()
+        spot_ids = [row[0] for row in self.session.query(VisitorRollup.spot_id)
+                    .filter(VisitorRollup.granularity == 'day').distinct()]
+        records = []
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            batch = spot_ids[i:i + self.IN_CLAUSE_BATCH]
+            for spot_id, result in registry.predict(batch, Config.FORECAST_HORIZON_DAYS, retrain=False).items():
+                if result is None or result['data_through'] is None:
+                    continue
+                data_through = datetime.fromisoformat(result['data_through'])
+                records.append({
+                    'spot_id': spot_id,
+                    'start_date': data_through + timedelta(days=1),
+                    'predictions': result['predictions'],
+                    'data_through': data_through,
+                    'recent_visitors': None,
+                    'mae': None,
+                    'mape': None,
+                    'r2': None
+                })
+        return self.save(self.LSTM_MODEL, records)
+
+    def save(self, model: str, records: List[dict], spot_ids: Optional[List[int]] = None) -> int:
+        """写入模型的预测结果；spot_ids为None时替换全部景点，否则只替换这些景点
+
+        按主键upsert后再删除本次没有写到的旧行，并发写入同一景点不会主键冲突。
+        """
+        start = time.perf_counter()
+        forecasts, meta = VisitorForecast.__table__, VisitorForecastMeta.__table__
+        # 取整到秒，与MySQL DATETIME存储的值一致，删除旧行时不会误删本次写入的行
+        generated_at = datetime.now().replace(microsecond=0)
+        try:
+            connection = self.session.connection()
+            for i in range(0, len(records), self.WRITE_BLOCK):
+                block = records[i:i + self.WRITE_BLOCK]
+                upsert(connection, meta, [
+                    {
+                        'spot_id': record['spot_id'],
+                        'model': model,
+                        'horizon': len(record['predictions']),
+                        'generated_at': generated_at,
+                        'data_through': record['data_through'],
+                        'recent_visitors': record['recent_visitors'],
+                        'mae': record['mae'],
+                        'mape': record['mape'],
+                        'r2': record['r2']
+                    }
+                    for record in block
+                ], ('spot_id', 'model'))
+                rows = []
+                for record in block:
+                    for offset, value in enumerate(record['predictions']):
+                        date = record['start_date'] + timedelta(days=offset)
+                        rows.append({
+                            'spot_id': record['spot_id'],
+                            'model': model,
+                            'forecast_date': date,
+                            'horizon': (date - record['data_through']).days,
+                            'visitor_count': value,
+                            'generated_at': generated_at
+                        })
+                upsert(connection, forecasts, rows, ('spot_id', 'model', 'forecast_date'))
+            # 本次没有重写的行（预测窗口移出的日期、已没有数据的景点）属于更早的结果
+            for table in (forecasts, meta):
+                stale = (table.c.model == model, table.c.generated_at < generated_at)
+                if spot_ids is None:
+                    self.session.execute(delete(table).where(*stale))
+                    continue
+                for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+                    self.session.execute(delete(table).where(
+                        *stale, table.c.spot_id.in_(spot_ids[i:i + self.IN_CLAUSE_BATCH])))
+            bump_table_versions(self.session, list(self.TABLES))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logging.error(f"Forecast store write error ({model}): {e}")
+            raise
+        logging.info(f"Forecast store: {len(records)} spots written for {model} "
+                     f"in {time.perf_counter() - start:.1f}s")
+        return len(records)
+
+    def get(self, spot_id: int, model: str = LINEAR_MODEL, days: Optional[int] = None) -> Optional[dict]:
+        return self.get_many([spot_id], model, days)[spot_id]
+
+    def get_many(self, spot_ids: List[int], model: str = LINEAR_MODEL,
+                 days: Optional[int] = None) -> Dict[int, Optional[dict]]:
+        """读取多个景点的预测，没有预测的景点为None
+
+        Returns:
+            {景点ID: {'model', 'generated_at', 'data_through', 'age_hours', 'stale',
+                      'new_data', 'metrics', 'forecasts': [{'date', 'horizon', 'visitor_count'}]}}
+        """
+        metas = self._load_meta(spot_ids, model)
+        stats = self._load_stats(spot_ids)
+        if model == self.LINEAR_MODEL:
+            recompute = self._claim([i for i in spot_ids if self._needs_recompute(metas.get(i), stats.get(i))])
+            if recompute:
+                try:
+                    self.refresh_linear(recompute)
+                    metas.update(self._load_meta(recompute, model))
+                except Exception as e:
+                    # 重算失败时返回已存储的预测，有新数据的景点仍标记为过期
+                    logging.warning(f"Forecast recompute for {len(recompute)} spots failed: {e}")
+                finally:
+                    self._release(recompute)
+        forecasts = self._load_forecasts(list(metas), model, days)
+
+        now = datetime.now()
+        results = {}
+        for spot_id in spot_ids:
+            meta = metas.get(spot_id)
+            if meta is None:
+                results[spot_id] = None
+                continue
+            age_hours = (now - meta.generated_at).total_seconds() / 3600
+            new_data = self._has_new_data(meta, stats.get(spot_id))
+            results[spot_id] = {
+                'model': model,
+                'generated_at': meta.generated_at,
+                'data_through': meta.data_through,
+                'age_hours': round(age_hours, 2),
+                'stale': new_data or age_hours > Config.FORECAST_MAX_AGE_HOURS,
+                'new_data': new_data,
+                'metrics': {'mae': meta.mae, 'mape': meta.mape, 'r2': meta.r2},
+                'forecasts': forecasts.get(spot_id, [])
+            }
+        return results
+
+    def _claim(self, spot_ids: List[int]) -> List[int]:
+        """领取本次请求要重算的景点：跳过本进程其他请求正在重算的，最多FORECAST_MAX_RECOMPUTE个"""
+        claimed = []
+        with _recompute_lock:
+            for spot_id in spot_ids:
+                if len(claimed) >= Config.FORECAST_MAX_RECOMPUTE:
+                    break
+                if spot_id not in _recomputing:
+                    _recomputing.add(spot_id)
+                    claimed.append(spot_id)
+        return claimed
+
+    def _release(self, spot_ids: List[int]):
+        with _recompute_lock:
+            _recomputing.difference_update(spot_ids)
+
+    def _needs_recompute(self, meta, stat) -> bool:
+        """景点有数据但没有预测，或有新数据且近7天访客量变化明显"""
+        if stat is None or stat.latest_visit_date is None:
+            return False
+        if meta is None:
+            return True
+        if not self._has_new_data(meta, stat) or meta.recent_visitors is None:
+            return False
+        change = abs((stat.visitors_7d or 0) - meta.recent_visitors) / max(meta.recent_visitors, 1)
+        return change > Config.FORECAST_RECOMPUTE_THRESHOLD
+
+    def _has_new_data(self, meta, stat) -> bool:
+        if stat is None or stat.latest_visit_date is None or meta.data_through is None:
+            return False
+        latest = stat.latest_visit_date
+        return datetime(latest.year, latest.month, latest.day) > meta.data_through
+
+    def _load_meta(self, spot_ids: Iterable[int], model: str) -> dict:
+        spot_ids = list(spot_ids)
+        metas = {}
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            rows = self.session.query(VisitorForecastMeta)\
+                .filter(VisitorForecastMeta.model == model,
+                        VisitorForecastMeta.spot_id.in_(spot_ids[i:i + self.IN_CLAUSE_BATCH]))
+            metas.update((row.spot_id, row) for row in rows)
+        return metas
+
+    def _load_stats(self, spot_ids: List[int]) -> dict:
+        stats = {}
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            rows = self.session.query(SpotVisitorStats.spot_id, SpotVisitorStats.latest_visit_date,
+                                      SpotVisitorStats.visitors_7d)\
+                .filter(SpotVisitorStats.spot_id.in_(spot_ids[i:i + self.IN_CLAUSE_BATCH]))
+            stats.update((row.spot_id, row) for row in rows)
+        return stats
+
+    def _load_forecasts(self, spot_ids: List[int], model: str, days: Optional[int]) -> dict:
+        forecasts = {}
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            rows = self.session.query(VisitorForecast.spot_id, VisitorForecast.forecast_date,
+                                      VisitorForecast.horizon, VisitorForecast.visitor_count)\
+                .filter(VisitorForecast.model == model,
+                        VisitorForecast.spot_id.in_(spot_ids[i:i + self.IN_CLAUSE_BATCH]))\
+                .order_by(VisitorForecast.spot_id, VisitorForecast.forecast_date)
+            for spot_id, date, horizon, count in rows:
+                spot_forecasts = forecasts.setdefault(spot_id, [])
+                if days is None or len(spot_forecasts) < days:
+                    spot_forecasts.append({'date': date, 'horizon': horizon, 'visitor_count': count})
+        return forecasts
+
+def _finite(value) -> Optional[float]:
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+if __name__ == '__main__':
+    # 定时任务：python -m backend.services.forecast_store
+    logging.info(f"Forecast store refreshed: {ForecastStore().refresh_all()}")
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+import numpy as np
+from sqlalchemy import func
+from backend.config import Config
+from backend.database import Session
+from backend.models import VisitorRollup
+
+# 周季节项的谐波阶数（3阶即可表示任意的星期几效应）
+WEEKLY_HARMONICS = 3
+
+def design_matrix(days: np.ndarray, history_days: int) -> np.ndarray:
+    """截距、线性趋势和周季节谐波组成的设计矩阵，days为相对历史窗口起点的天数"""
+    t = np.asarray(days, dtype=np.float64)
+    columns = [np.ones_like(t), t / history_days]
+    for k in range(1, WEEKLY_HARMONICS + 1):
+        angle = 2 * np.pi * k * t / 7
+        columns += [np.sin(angle), np.cos(angle)]
+    return np.column_stack(columns)
+
+def fit_batch(values: np.ndarray, mask: np.ndarray, X: np.ndarray,
+              ridge: float = 1e-3) -> Tuple[np.ndarray, np.ndarray]:
+    """对一批序列同时求闭式最小二乘解
+
+    每个序列只用mask为True的观测，除截距外的系数加ridge正则，
+    观测很少的序列也有唯一解（退化为均值）。
+
+    Args:
+        values, mask: (序列数, 天数)
+        X: (天数, 特征数) 设计矩阵
+
+    Returns:
+        (系数 (序列数, 特征数), 拟合优度R² (序列数,))
+    """
+    w = mask.astype(np.float64)
+    y = np.where(mask, values, 0.0)
+    penalty = np.full(X.shape[1], ridge)
+    penalty[0] = 1e-9
+    gram = np.einsum('nt,tp,tq->npq', w, X, X, optimize=True) + np.diag(penalty)
+    coef = np.linalg.solve(gram, (y @ X)[:, :, None])[:, :, 0]
+
+    n_obs = w.sum(axis=1)
+    mean = y.sum(axis=1) / np.maximum(n_obs, 1)
+    rss = (w * (y - coef @ X.T) ** 2).sum(axis=1)
+    tss = (w * (y - mean[:, None]) ** 2).sum(axis=1)
+    r2 = np.where(tss > 0, 1 - rss / np.where(tss > 0, tss, 1), 0.0)
+    return coef, r2
+
+def backtest_batch(values: np.ndarray, mask: np.ndarray, X: np.ndarray,
+                   holdout: int) -> Tuple[np.ndarray, np.ndarray]:
+    """留出最后holdout天重新拟合并预测，返回每个序列的(MAE, MAPE)，留出期没有观测时为NaN"""
+    coef, _ = fit_batch(values[:, :-holdout], mask[:, :-holdout], X[:-holdout])
+    error = np.abs(values[:, -holdout:] - np.maximum(coef @ X[-holdout:].T, 0))
+    observed = mask[:, -holdout:]
+    n_obs = observed.sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        mae = np.where(observed, error, 0).sum(axis=1) / n_obs
+        mape = np.where(observed, error / np.maximum(values[:, -holdout:], 1), 0).sum(axis=1) / n_obs
+    return mae, mape
+
+class BatchForecaster:
+    """所有景点访客量的批量预测
+
+    一次查询读取全部景点最近FORECAST_HISTORY_DAYS天的日汇总数据，按景点
+    分块排成稠密矩阵（缺失的日期不参与拟合），对整块序列同时求解
+    趋势+周季节模型的闭式最小二乘，并留出最后BACKTEST_DAYS天回测误差。
+    每个景点的序列以它自己最后有数据的一天为窗口终点对齐，数据截止较早的
+    景点第一个预测日也是截止日期的下一天（只是窗口前部读不到的日期按缺失处理）。
+    结果由ForecastStore写入预测表。
+    """
+
+    MODEL = 'linear_weekly'
+    # 每次拟合的景点数
+    SPOT_BLOCK = 2000
+    # 回测留出的天数
+    BACKTEST_DAYS = 14
+
+    def __init__(self, history_days: Optional[int] = None, horizon: Optional[int] = None, session=None):
+        self.history_days = history_days or Config.FORECAST_HISTORY_DAYS
+        self.horizon = horizon or Config.FORECAST_HORIZON_DAYS
+        self.session = session or Session
+
+    def forecast(self, spot_ids: Optional[Iterable[int]] = None) -> dict:
+        """预测指定景点（默认全部）未来horizon天的访客量
+
+        Returns:
+            {'spot_ids': 有历史数据的景点ID, 'start_dates': 每个景点的第一个预测日,
+             'predictions': (景点数, horizon) 预测值, 'r2': 每个景点的拟合优度,
+             'mae'/'mape': 回测误差, 'data_through': 每个景点最后有数据的日期,
+             'recent_visitors': 截至该日期近7天的访客量}
+        """
+        spots, days, counts, start = self._load_history(spot_ids)
+        if not len(spots):
+            return {'spot_ids': np.empty(0, dtype=np.int64), 'start_dates': [],
+                    'predictions': np.empty((0, self.horizon)), 'r2': np.empty(0),
+                    'mae': np.empty(0), 'mape': np.empty(0), 'data_through': [],
+                    'recent_visitors': np.empty(0)}
+
+        unique_spots, boundaries = np.unique(spots, return_index=True)
+        boundaries = np.append(boundaries, len(spots))
+        X = design_matrix(np.arange(self.history_days), self.history_days)
+        X_future = design_matrix(np.arange(self.history_days, self.history_days + self.horizon),
+                                 self.history_days)
+
+        # 每个景点最后有数据的一天和截至当天近7天的访客量
+        row_spot = np.repeat(np.arange(len(unique_spots)), np.diff(boundaries))
+        last_day = np.maximum.reduceat(days, boundaries[:-1])
+        recent = np.bincount(row_spot, counts * (days > last_day[row_spot] - 7), len(unique_spots))
+        # 把每个景点最后有数据的一天对齐到窗口最后一天
+        days = days + (self.history_days - 1 - last_day)[row_spot]
+
+        predictions = np.empty((len(unique_spots), self.horizon))
+        r2, mae, mape = (np.empty(len(unique_spots)) for _ in range(3))
+        for begin in range(0, len(unique_spots), self.SPOT_BLOCK):
+            end = min(begin + self.SPOT_BLOCK, len(unique_spots))
+            rows = slice(boundaries[begin], boundaries[end])
+            local = np.repeat(np.arange(end - begin), np.diff(boundaries[begin:end + 1]))
+            values = np.zeros((end - begin, self.history_days))
+            mask = np.zeros((end - begin, self.history_days), dtype=bool)
+            values[local, days[rows]] = counts[rows]
+            mask[local, days[rows]] = True
+            coef, r2[begin:end] = fit_batch(values, mask, X)
+            predictions[begin:end] = np.maximum(coef @ X_future.T, 0)
+            mae[begin:end], mape[begin:end] = backtest_batch(values, mask, X, self.BACKTEST_DAYS)
+
+        data_through = [start + timedelta(days=int(d)) for d in last_day]
+        return {
+            'spot_ids': unique_spots,
+            'start_dates': [date + timedelta(days=1) for date in data_through],
+            'predictions': predictions,
+            'r2': r2,
+            'mae': mae,
+            'mape': mape,
+            'data_through': data_through,
+            'recent_visitors': recent
+        }
+
+    def _load_history(self, spot_ids: Optional[Iterable[int]] = None) -> tuple:
+        """一次查询读取历史窗口内的日汇总，返回按景点排序的(景点ID, 天序号, 访客量, 窗口起点)"""
+        base = self.session.query(VisitorRollup.spot_id, VisitorRollup.period_start,
+                                  VisitorRollup.visitor_count)\
+            .filter(VisitorRollup.granularity == 'day')
+        if spot_ids is not None:
+            base = base.filter(VisitorRollup.spot_id.in_(list(spot_ids)))
+        # 窗口以最新一天为终点
+        latest = base.with_entities(func.max(VisitorRollup.period_start)).scalar()
+        if latest is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), None
+        start = datetime(latest.year, latest.month, latest.day) - timedelta(days=self.history_days - 1)
+
+        stmt = base.filter(VisitorRollup.period_start >= start)\
+            .order_by(VisitorRollup.spot_id).statement
+        result = self.session.execute(stmt, execution_options={'stream_results': True})
+        spots, days, counts = [], [], []
+        first_day = start.toordinal()
+        for partition in result.partitions(100000):
+            for spot_id, date, count in partition:
+                spots.append(spot_id)
+                # 用序数日计算天序号，比转换为datetime64快一个数量级
+                days.append(date.toordinal() - first_day)
+                counts.append(count or 0)
+        return (np.array(spots, dtype=np.int64), np.array(days, dtype=np.int64),
+                np.array(counts, dtype=np.float64), start)
@@ -0,0 +1,102 @@
+from typing import List
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.neighbors import BallTree
+from backend.utils.geo import EARTH_RADIUS_KM, haversine_matrix
+
+def dbscan_haversine(latitudes: np.ndarray, longitudes: np.ndarray, eps_km: float,
+                     min_samples: int, chunk_size: int = 5000) -> np.ndarray:
+    """按球面距离的DBSCAN，返回每个点的簇编号（噪声为-1）
+
+    坐标转换为单位球面上的三维向量，在欧氏BallTree上按弦长查询：
+    弦长与球面距离单调对应，邻域与haversine度量完全一致，但查询快数倍。
+    邻域按块查询，任何时刻只保存一个块的邻居列表，内存随点数线性增长：
+    1. 统计每个点eps内的邻居数，确定核心点；
+    2. 逐块合并相邻的核心点（并查集，每块合并后压缩路径）；
+    3. 非核心点归入eps内最近核心点所在的簇。
+    """
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    points = np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+    n = len(points)
+    labels = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return labels
+    tree = BallTree(points)
+    radius = 2 * np.sin(eps_km / EARTH_RADIUS_KM / 2)
+
+    counts = np.concatenate([
+        tree.query_radius(points[start:start + chunk_size], radius, count_only=True)
+        for start in range(0, n, chunk_size)
+    ])
+    core = counts >= min_samples
+    core_idx = np.flatnonzero(core)
+    if not len(core_idx):
+        return labels
+
+    parent = np.arange(n)
+    for start in range(0, len(core_idx), chunk_size):
+        chunk = core_idx[start:start + chunk_size]
+        neighbors = tree.query_radius(points[chunk], radius)
+        src = np.repeat(chunk, [len(row) for row in neighbors])
+        dst = np.concatenate(neighbors)
+        edge_core = core[dst]
+        src, dst = parent[src[edge_core]], parent[dst[edge_core]]
+        if not len(src):
+            continue
+        # 只在本块涉及的根节点之间求连通分量，每个分量合并到编号最小的根
+        roots, compact = np.unique(np.concatenate([src, dst]), return_inverse=True)
+        graph = coo_matrix((np.ones(len(src), dtype=np.int8),
+                            (compact[:len(src)], compact[len(src):])),
+                           shape=(len(roots), len(roots)))
+        _, component = connected_components(graph, directed=False)
+        new_root = np.full(component.max() + 1, n, dtype=np.int64)
+        np.minimum.at(new_root, component, roots)
+        parent[roots] = new_root[component]
+        # 指针跳跃直到每个点直接指向根
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+    _, labels[core_idx] = np.unique(parent[core_idx], return_inverse=True)
+
+    # 边界点：eps内有核心点的非核心点，归入最近核心点的簇
+    border_idx = np.flatnonzero(~core & (counts > 1))
+    if len(border_idx):
+        core_tree = BallTree(points[core_idx])
+        for start in range(0, len(border_idx), chunk_size):
+            chunk = border_idx[start:start + chunk_size]
+            distance, nearest = core_tree.query(points[chunk], k=1)
+            within = distance[:, 0] <= radius
+            labels[chunk[within]] = labels[core_idx[nearest[within, 0]]]
+    return labels
+
+def summarize_hotspots(ids: np.ndarray, latitudes: np.ndarray, longitudes: np.ndarray,
+                       labels: np.ndarray, eps_km: float) -> List[dict]:
+    """每个簇的质心、成员、半径和密度（景点数/平方公里），按规模降序"""
+    hotspots = []
+    order = np.argsort(labels, kind='stable')
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    for members in np.split(order, boundaries):
+        if not len(members) or labels[members[0]] < 0:
+            continue
+        lat, lon = latitudes[members], longitudes[members]
+        # 用单位向量求平均，跨越180度经线的簇质心也正确
+        lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+        x = np.mean(np.cos(lat_rad) * np.cos(lon_rad))
+        y = np.mean(np.cos(lat_rad) * np.sin(lon_rad))
+        z = np.mean(np.sin(lat_rad))
+        centroid = (float(np.degrees(np.arctan2(z, np.hypot(x, y)))),
+                    float(np.degrees(np.arctan2(y, x))))
+        radius_km = max(float(haversine_matrix([centroid], np.column_stack([lat, lon])).max()), eps_km)
+        hotspots.append({
+            'centroid': {'latitude': centroid[0], 'longitude': centroid[1]},
+            'size': int(len(members)),
+            'radius_km': radius_km,
+            'density': len(members) / (np.pi * radius_km ** 2),
+            'members': ids[members].tolist()
+        })
+    hotspots.sort(key=lambda h: -h['size'])
+    return hotspots
@@ -0,0 +1,227 @@
+import random
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+
+class ItinerarySolver:
+    """多日行程求解（带时间窗的多路线问题）
+
+    节点0是住宿起点，每天从起点出发并回到起点；每个景点有游览时长和
+    开放时间窗，每天有出发和最晚返回时间。先按时间窗由紧到松做最便宜
+    可行插入得到初始解，再在时间预算内不断尝试移动、交换、段翻转和
+    插入未安排景点，随时可以返回当前最好的方案。
+
+    目标值（越小越好）= 行驶小时数 + WAIT_WEIGHT × 等待开门小时数
+                      + UNSCHEDULED_PENALTY × 未安排景点数
+    """
+
+    # 未安排一个景点的惩罚（小时），保证优先排进更多景点
+    UNSCHEDULED_PENALTY = 100.0
+    # 等待景点开门的时间也计入目标，但权重低于行驶时间
+    WAIT_WEIGHT = 0.1
+    # 连续这么多次尝试都没有找到更好的方案时提前结束
+    STALL_ITERATIONS = 5000
+
+    def __init__(self, travel_hours: np.ndarray, visit_hours: np.ndarray,
+                 open_hours: np.ndarray, close_hours: np.ndarray,
+                 n_days: int, day_start: float, day_end: float, seed: int = 0):
+        """
+        Args:
+            travel_hours: (n+1, n+1) 行驶时间矩阵，节点0为起点
+            visit_hours: 长度n+1的游览时长，下标0不使用
+            open_hours: 长度n+1的开门时间（小时）
+            close_hours: 长度n+1的关门时间，游览必须在关门前结束
+        """
+        self.travel = np.asarray(travel_hours, dtype=np.float64)
+        self.visit = np.asarray(visit_hours, dtype=np.float64)
+        self.open = np.asarray(open_hours, dtype=np.float64)
+        self.close = np.asarray(close_hours, dtype=np.float64)
+        self.n_days = n_days
+        self.day_start = day_start
+        self.day_end = day_end
+        self.random = random.Random(seed)
+
+    def solve(self, time_limit: float) -> dict:
+        """在time_limit秒内求解，返回当前最好的方案
+
+        Returns:
+            {'days': 每天的节点顺序, 'unscheduled': 未安排的节点,
+             'objective': 目标值, 'iterations': 局部搜索次数}
+        """
+        deadline = time.perf_counter() + time_limit
+        days, unscheduled = self._construct()
+        costs = [self._day_cost(route) for route in days]
+        best = self._objective(costs, unscheduled)
+        best_plan = ([list(route) for route in days], list(unscheduled))
+
+        moves = (self._relocate, self._swap, self._reverse, self._insert_unscheduled)
+        iterations = stalled = 0
+        while len(self.visit) > 1 and stalled < self.STALL_ITERATIONS \
+                and time.perf_counter() < deadline:
+            iterations += 1
+            stalled += 1
+            move = self.random.choice(moves)
+            if move(days, costs, unscheduled):
+                objective = self._objective(costs, unscheduled)
+                if objective < best - 1e-9:
+                    best = objective
+                    best_plan = ([list(route) for route in days], list(unscheduled))
+                    stalled = 0
+
+        return {
+            'days': best_plan[0],
+            'unscheduled': best_plan[1],
+            'objective': best,
+            'iterations': iterations
+        }
+
+    def schedule(self, route: List[int]) -> List[dict]:
+        """计算一天中每个景点的到达、开始游览和离开时间"""
+        stops, now, position = [], self.day_start, 0
+        for node in route:
+            arrival = now + self.travel[position, node]
+            start = max(arrival, self.open[node])
+            now = start + self.visit[node]
+            stops.append({'node': node, 'arrival': arrival, 'start': start, 'leave': now})
+            position = node
+        return stops
+
+    def day_duration(self, route: List[int]) -> float:
+        """一天从出发到回到起点的小时数"""
+        if not route:
+            return 0.0
+        return self.schedule(route)[-1]['leave'] + self.travel[route[-1], 0] - self.day_start
+
+    def _day_cost(self, route: List[int]) -> Optional[float]:
+        """一天路线的目标值，不满足时间窗或当天时长时返回None"""
+        now, position, travel, wait = self.day_start, 0, 0.0, 0.0
+        for node in route:
+            leg = self.travel[position, node]
+            arrival = now + leg
+            start = max(arrival, self.open[node])
+            now = start + self.visit[node]
+            if now > self.close[node]:
+                return None
+            travel += leg
+            wait += start - arrival
+            position = node
+        leg = self.travel[position, 0]
+        if now + leg > self.day_end:
+            return None
+        return travel + leg + self.WAIT_WEIGHT * wait
+
+    def _objective(self, costs: List[float], unscheduled: List[int]) -> float:
+        return sum(costs) + self.UNSCHEDULED_PENALTY * len(unscheduled)
+
+    def _best_insertion(self, route: List[int], node: int) -> Optional[Tuple[float, int]]:
+        """按行驶时间增量从小到大尝试插入位置，返回第一个可行位置(新目标值, 位置)"""
+        previous = np.array([0] + route)
+        following = np.array(route + [0])
+        delta = (self.travel[previous, node] + self.travel[node, following]
+                 - self.travel[previous, following])
+        for position in np.argsort(delta, kind='stable'):
+            candidate = route[:position] + [node] + route[position:]
+            cost = self._day_cost(candidate)
+            if cost is not None:
+                return cost, int(position)
+        return None
+
+    def _construct(self) -> Tuple[List[List[int]], List[int]]:
+        days = [[] for _ in range(self.n_days)]
+        costs = [0.0] * self.n_days
+        unscheduled = []
+        nodes = range(1, len(self.visit))
+        # 时间窗越紧的景点越先安排
+        for node in sorted(nodes, key=lambda n: (self.close[n] - self.open[n] - self.visit[n], n)):
+            best = None
+            for day, route in enumerate(days):
+                found = self._best_insertion(route, node)
+                if found and (best is None or found[0] - costs[day] < best[0]):
+                    best = (found[0] - costs[day], day, found[1], found[0])
+            if best is None:
+                unscheduled.append(node)
+                continue
+            _, day, position, cost = best
+            days[day].insert(position, node)
+            costs[day] = cost
+        return days, unscheduled
+
+    def _relocate(self, days, costs, unscheduled) -> bool:
+        """把一个景点移到另一天（或同一天）的最佳可行位置"""
+        source = self._random_nonempty_day(days)
+        if source is None:
+            return False
+        target = self.random.randrange(len(days))
+        index = self.random.randrange(len(days[source]))
+        node = days[source][index]
+        remaining = days[source][:index] + days[source][index + 1:]
+        source_cost = self._day_cost(remaining)
+        if source_cost is None:
+            return False
+
+        base = remaining if target == source else days[target]
+        found = self._best_insertion(base, node)
+        if found is None:
+            return False
+        cost, position = found
+        before = costs[source] + (costs[target] if target != source else 0.0)
+        after = cost + (source_cost if target != source else 0.0)
+        if after > before + 1e-9:
+            return False
+
+        days[source] = remaining
+        costs[source] = source_cost
+        days[target] = base[:position] + [node] + base[position:]
+        costs[target] = cost
+        return True
+
+    def _swap(self, days, costs, unscheduled) -> bool:
+        """交换两天中的各一个景点"""
+        first, second = self._random_nonempty_day(days), self._random_nonempty_day(days)
+        if first is None or first == second:
+            return False
+        i = self.random.randrange(len(days[first]))
+        j = self.random.randrange(len(days[second]))
+        route1, route2 = list(days[first]), list(days[second])
+        route1[i], route2[j] = route2[j], route1[i]
+        cost1, cost2 = self._day_cost(route1), self._day_cost(route2)
+        if cost1 is None or cost2 is None or cost1 + cost2 > costs[first] + costs[second] + 1e-9:
+            return False
+        days[first], days[second] = route1, route2
+        costs[first], costs[second] = cost1, cost2
+        return True
+
+    def _reverse(self, days, costs, unscheduled) -> bool:
+        """翻转一天中的一段路线（2-opt）"""
+        day = self._random_nonempty_day(days)
+        if day is None or len(days[day]) < 2:
+            return False
+        i, j = sorted(self.random.sample(range(len(days[day])), 2))
+        route = days[day][:i] + days[day][i:j + 1][::-1] + days[day][j + 1:]
+        cost = self._day_cost(route)
+        if cost is None or cost > costs[day] + 1e-9:
+            return False
+        days[day], costs[day] = route, cost
+        return True
+
+    def _insert_unscheduled(self, days, costs, unscheduled) -> bool:
+        """尝试把未安排的景点插入任意一天"""
+        if not unscheduled:
+            return False
+        node = self.random.choice(unscheduled)
+        best = None
+        for day, route in enumerate(days):
+            found = self._best_insertion(route, node)
+            if found and (best is None or found[0] - costs[day] < best[0]):
+                best = (found[0] - costs[day], day, found[1], found[0])
+        if best is None:
+            return False
+        _, day, position, cost = best
+        days[day].insert(position, node)
+        costs[day] = cost
+        unscheduled.remove(node)
+        return True
+
+    def _random_nonempty_day(self, days) -> Optional[int]:
+        candidates = [day for day, route in enumerate(days) if route]
+        return self.random.choice(candidates) if candidates else None
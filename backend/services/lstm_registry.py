@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import tensorflow as tf
+from sqlalchemy import func
+from backend.config import Config
+from backend.database import Session
+from backend.models import VisitorRollup
+
+class LSTMModelRegistry:
+    """按景点和数据版本保存的LSTM访客量预测模型
+
+    数据版本由景点日汇总数据的最新日期、天数和访客总量组成，数据不变时
+    版本不变。请求时只加载已训练的模型做推理：版本落后时先用旧模型返回
+    并在后台线程重新训练，没有模型时只安排训练。模型一次输出HORIZON天，
+    预测不超过HORIZON天只需一次前向计算。
+
+    所有景点的模型结构相同，只有权重不同：每个版本另存一份权重文件，推理时
+    进程内共用一个Keras模型，逐个景点换入权重，不为每个景点反序列化完整模型。
+    内存中只缓存权重（每个景点约50KB），大批量预测时不会反复加载模型。
+    """
+
+    SEQUENCE_LENGTH = 7
+    HORIZON = 30
+    EPOCHS = 100
+    UNITS = 50
+    # 每个景点保留的模型版本数和内存中缓存的权重数
+    KEEP_VERSIONS = 2
+    CACHE_SIZE = 4096
+
+    def __init__(self, path: Optional[str] = None, session=None):
+        self.path = path or Config.LSTM_MODEL_PATH
+        self.session = session or Session
+        self._weights = OrderedDict()
+        self._lock = threading.Lock()
+        # 推理共用的模型，换入权重和前向计算期间持有_template_lock
+        self._template = None
+        self._template_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._worker = None
+
+    def data_versions(self, spot_ids: Iterable[int]) -> Dict[int, str]:
+        """一次查询计算各景点当前的数据版本，没有数据的景点不返回"""
+        rows = self.session.query(
+            VisitorRollup.spot_id,
+            func.max(VisitorRollup.period_start),
+            func.count(VisitorRollup.id),
+            func.sum(VisitorRollup.visitor_count)
+        ).filter(VisitorRollup.granularity == 'day', VisitorRollup.spot_id.in_(list(spot_ids)))\
+            .group_by(VisitorRollup.spot_id).all()
+        return {spot_id: f'{latest:%Y%m%d}-{days}-{total or 0}'
+                for spot_id, latest, days, total in rows}
+
+    def predict(self, spot_ids: List[int], days: int = 30, retrain: bool = True) -> Dict[int, dict]:
+        """用已注册的模型预测多个景点未来days天的访客量
+
+        Args:
+            retrain: 模型落后于数据版本时是否安排后台训练
+
+        Returns:
+            {景点ID: {'predictions', 'loss', 'version', 'stale', 'data_through'}}，
+            没有可用模型的景点为None
+        """
+        versions = self.data_versions(spot_ids)
+        results = dict.fromkeys(spot_ids)
+        loaded = {}
+        for spot_id in spot_ids:
+            version = versions.get(spot_id)
+            latest = self._latest_version(spot_id)
+            if retrain and version is not None and latest != version:
+                self.schedule_retrain(spot_id)
+            if latest is None:
+                continue
+            try:
+                loaded[spot_id] = (latest, version) + self._load(spot_id, latest)
+            except Exception as e:
+                # 模型文件被其他进程清理或损坏时按没有模型处理
+                logging.warning(f"Failed to load LSTM model {latest} for spot {spot_id}: {e}")
+
+        with self._template_lock:
+            model = self._shared_model() if loaded else None
+            for spot_id, (latest, version, weights, meta) in loaded.items():
+                model.set_weights(weights)
+                results[spot_id] = {
+                    'predictions': self._rollout(model, meta, days),
+                    'loss': meta['loss'],
+                    'version': latest,
+                    'stale': latest != version,
+                    'data_through': meta.get('data_through')
+                }
+        return results
+
+    def schedule_retrain(self, spot_id: int):
+        """安排后台训练，同一景点排队中的任务只保留一个"""
+        with self._lock:
+            if spot_id in self._pending:
+                return
+            self._pending.add(spot_id)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._train_loop, name='lstm-trainer', daemon=True)
+                self._worker.start()
+        self._queue.put(spot_id)
+
+    def retrain_stale(self) -> int:
+        """同步重新训练数据版本有变化的所有景点，返回训练的模型数"""
+        spot_ids = [row[0] for row in self.session.query(VisitorRollup.spot_id)
+                    .filter(VisitorRollup.granularity == 'day').distinct()]
+        trained = 0
+        for spot_id, version in self.data_versions(spot_ids).items():
+            if self._latest_version(spot_id) != version and self.train(spot_id, version):
+                trained += 1
+        return trained
+
+    def train(self, spot_id: int, version: Optional[str] = None) -> bool:
+        """训练并注册景点的模型，历史数据不足时返回False
+
+        版本目录一旦发布就不再修改；其他进程已训练同一版本时直接采用它。
+        """
+        start = time.perf_counter()
+        version = version or self.data_versions([spot_id]).get(spot_id)
+        if version is not None and os.path.isdir(os.path.join(self._spot_path(spot_id), version)):
+            self._publish_latest(spot_id, version)
+            return True
+        series, data_through = self._load_series(spot_id)
+        if version is None or len(series) < self.SEQUENCE_LENGTH + self.HORIZON:
+            return False
+
+        mean, std = float(series.mean()), float(series.std()) or 1.0
+        normalized = (series - mean) / std
+        X, y = self._prepare_sequences(normalized)
+        model = self._build_model()
+        model.compile(optimizer='adam', loss='mse')
+        history = model.fit(X, y, epochs=self.EPOCHS, batch_size=32, verbose=0,
+                            callbacks=[tf.keras.callbacks.EarlyStopping(monitor='loss', patience=10)])
+
+        directory = os.path.join(self._spot_path(spot_id), version)
+        tmp = f'{directory}.tmp{os.getpid()}-{threading.get_ident()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)  # 同时创建景点目录
+        model.save(os.path.join(tmp, 'model.keras'))
+        np.savez(os.path.join(tmp, 'weights.npz'), *model.get_weights())
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({
+                'mean': mean,
+                'std': std,
+                # 训练数据最后一个窗口，推理时不需要再读数据库
+                'window': normalized[-self.SEQUENCE_LENGTH:].tolist(),
+                'loss': float(history.history['loss'][-1]),
+                'data_through': data_through.isoformat(),
+                'trained_at': datetime.now().isoformat()
+            }, f)
+        try:
+            # 目标目录已存在（其他进程同时训练完成）时rename失败，保留先发布的版本
+            os.rename(tmp, directory)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(directory):
+                raise
+        self._publish_latest(spot_id, version)
+        self._prune(spot_id, version)
+        logging.info(f"LSTM model for spot {spot_id} trained as {version} "
+                     f"in {time.perf_counter() - start:.1f}s")
+        return True
+
+    def _build_model(self):
+        return tf.keras.Sequential([
+            tf.keras.layers.LSTM(self.UNITS, activation='relu', input_shape=(self.SEQUENCE_LENGTH, 1)),
+            tf.keras.layers.Dense(self.HORIZON)
+        ])
+
+    def _shared_model(self):
+        """推理共用的模型，调用方需持有_template_lock"""
+        if self._template is None:
+            self._template = self._build_model()
+        return self._template
+
+    def _publish_latest(self, spot_id: int, version: str):
+        pointer = os.path.join(self._spot_path(spot_id), 'latest')
+        with open(f'{pointer}.tmp{os.getpid()}', 'w') as f:
+            f.write(version)
+        os.replace(f'{pointer}.tmp{os.getpid()}', pointer)
+
+    def _rollout(self, model, meta: dict, days: int) -> List[float]:
+        """从训练数据的最后窗口出发，每次前向计算输出HORIZON天"""
+        window = np.array(meta['window'], dtype=np.float32)
+        outputs = []
+        while sum(len(o) for o in outputs) < days:
+            step = model(window[-self.SEQUENCE_LENGTH:].reshape(1, -1, 1), training=False).numpy()[0]
+            outputs.append(step)
+            window = np.concatenate([window, step])
+        predictions = np.concatenate(outputs)[:days] * meta['std'] + meta['mean']
+        return np.maximum(predictions, 0).tolist()
+
+    def _prepare_sequences(self, series: np.ndarray) -> tuple:
+        """滑动窗口切分：前SEQUENCE_LENGTH天为输入，之后HORIZON天为输出"""
+        n = len(series) - self.SEQUENCE_LENGTH - self.HORIZON + 1
+        index = np.arange(n)[:, None]
+        X = series[index + np.arange(self.SEQUENCE_LENGTH)]
+        y = series[index + self.SEQUENCE_LENGTH + np.arange(self.HORIZON)]
+        return X[:, :, None].astype(np.float32), y.astype(np.float32)
+
+    def _load_series(self, spot_id: int) -> tuple:
+        """最近FORECAST_HISTORY_DAYS天的日访客量（没有记录的日期为0）和最后一天的日期"""
+        rows = self.session.query(VisitorRollup.period_start, VisitorRollup.visitor_count)\
+            .filter(VisitorRollup.granularity == 'day', VisitorRollup.spot_id == spot_id)\
+            .order_by(VisitorRollup.period_start.desc())\
+            .limit(Config.FORECAST_HISTORY_DAYS).all()
+        if not rows:
+            return np.empty(0), None
+        first = rows[-1][0].toordinal()
+        series = np.zeros(rows[0][0].toordinal() - first + 1)
+        for date, count in rows:
+            series[date.toordinal() - first] = count or 0
+        return series[-Config.FORECAST_HISTORY_DAYS:], rows[0][0]
+
+    def _load(self, spot_id: int, version: str) -> tuple:
+        key = (spot_id, version)
+        with self._lock:
+            if key in self._weights:
+                self._weights.move_to_end(key)
+                return self._weights[key]
+        directory = os.path.join(self._spot_path(spot_id), version)
+        weights_path = os.path.join(directory, 'weights.npz')
+        if os.path.exists(weights_path):
+            with np.load(weights_path) as arrays:
+                weights = [arrays[f'arr_{i}'] for i in range(len(arrays.files))]
+        else:
+            # 没有单独权重文件的旧版本从完整模型中取出权重
+            weights = tf.keras.models.load_model(os.path.join(directory, 'model.keras')).get_weights()
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        with self._lock:
+            self._weights[key] = (weights, meta)
+            while len(self._weights) > self.CACHE_SIZE:
+                self._weights.popitem(last=False)
+        return weights, meta
+
+    def _latest_version(self, spot_id: int) -> Optional[str]:
+        try:
+            with open(os.path.join(self._spot_path(spot_id), 'latest')) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _spot_path(self, spot_id: int) -> str:
+        return os.path.join(self.path, f'spot_{spot_id}')
+
+    def _prune(self, spot_id: int, current: str):
+        path = self._spot_path(spot_id)
+        versions = sorted(
+            # 跳过其他进程正在写入的临时目录
+            (name for name in os.listdir(path)
+             if os.path.isdir(os.path.join(path, name)) and name != current and '.tmp' not in name),
+            key=lambda name: os.path.getmtime(os.path.join(path, name))
+        )
+        for name in versions[:max(0, len(versions) - self.KEEP_VERSIONS + 1)]:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    def _train_loop(self):
+        while True:
+            spot_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(spot_id)
+            try:
+                self.train(spot_id)
+            except Exception as e:
+                logging.error(f"LSTM training for spot {spot_id} failed: {e}")
+            finally:
+                # 后台线程使用独立的会话，每个任务结束后归还连接
+                Session.remove()
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_lstm_registry() -> LSTMModelRegistry:
+    """进程内共享的模型注册表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LSTMModelRegistry()
+    return _registry
+
+if __name__ == '__main__':
+    # 定时任务：python -m backend.services.lstm_registry
+    logging.info(f"Retrained {get_lstm_registry().retrain_stale()} LSTM models")
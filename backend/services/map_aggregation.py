@@ -0,0 +1,113 @@
+from typing import List
+import numpy as np
+from backend.config import Config
+from backend.database import Session
+from backend.models import TouristSpot
+from backend.services.spatial_index import get_spatial_index
+from backend.utils.cache import cached
+from backend.utils.geo import TILE_SIZE, fit_grid_bins, grid_bins, lonlat_to_pixel, tile_bounds
+
+class MapAggregationService:
+    """按缩放级别在服务端聚合景点，地图在任何缩放级别只需渲染数百个要素
+
+    每个瓦片内按MAP_CLUSTER_CELL_PX像素的网格聚合，网格与瓦片对齐，
+    因此可以按(z, x, y)分别缓存；景点表版本号变化后缓存自动失效。
+    超过MAP_MAX_CLUSTER_ZOOM时直接返回单个景点。
+    """
+
+    # 一次视窗查询最多覆盖的瓦片数
+    MAX_TILES = 64
+    # 单条IN查询的最大ID数量
+    IN_CLAUSE_BATCH = 1000
+
+    def __init__(self):
+        self.session = Session
+        self.spatial_index = get_spatial_index()
+
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',))
+    def get_tile(self, zoom: int, x: int, y: int) -> List[dict]:
+        """单个瓦片的聚合结果，count为1时带spot_id"""
+        self.spatial_index.refresh()
+        south, west, north, east = tile_bounds(zoom, x, y)
+        ids, latitudes, longitudes = self.spatial_index.points_in(south, west, north, east)
+        if not len(ids):
+            return []
+        # 边界上的点只归入一个瓦片
+        px, py = lonlat_to_pixel(latitudes, longitudes, zoom)
+        inside = (px // TILE_SIZE == x) & (py // TILE_SIZE == y)
+        ids, latitudes, longitudes = ids[inside], latitudes[inside], longitudes[inside]
+        return self._aggregate(ids, latitudes, longitudes, zoom)
+
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots',))
+    def get_overview(self, max_zoom: int) -> dict:
+        """全部景点的整体分布，用于生成静态分布图
+
+        选择要素数不超过MAP_MAX_FEATURES的最大缩放级别（不超过max_zoom）。
+
+        Returns:
+            {'zoom': 实际聚合使用的缩放级别, 'features': 聚合结果}
+        """
+        self.spatial_index.refresh()
+        ids, latitudes, longitudes = self.spatial_index.points_in(-90, -180, 90, 180)
+        if not len(ids):
+            return {'zoom': max_zoom, 'features': []}
+        zoom, bins = fit_grid_bins(latitudes, longitudes, min(max_zoom, Config.MAP_MAX_CLUSTER_ZOOM),
+                                   Config.MAP_CLUSTER_CELL_PX, Config.MAP_MAX_FEATURES)
+        return {'zoom': zoom, 'features': self._features(ids, bins)}
+
+    def get_clusters(self, zoom: int, south: float, west: float,
+                     north: float, east: float) -> List[dict]:
+        """地图视窗内的聚合结果，由覆盖视窗的各瓦片结果拼接"""
+        features = []
+        for x, y in self.tiles_for(zoom, south, west, north, east):
+            features.extend(self.get_tile(zoom, x, y))
+        return features
+
+    def tiles_for(self, zoom: int, south: float, west: float,
+                  north: float, east: float) -> List[tuple]:
+        """覆盖经纬度范围的瓦片(x, y)列表，west大于east时跨越180度经线"""
+        n = 2 ** zoom
+        (x0, x1), (y1, y0) = [
+            (int(v[0] // TILE_SIZE), int(v[1] // TILE_SIZE))
+            for v in lonlat_to_pixel([south, north], [west, east], zoom)
+        ]
+        columns = list(range(x0, x1 + 1)) if x0 <= x1 else list(range(x0, n)) + list(range(0, x1 + 1))
+        tiles = [(x, y) for x in columns for y in range(y0, y1 + 1)]
+        if len(tiles) > self.MAX_TILES:
+            raise ValueError(f"视窗覆盖的瓦片过多（{len(tiles)}），请提高缩放级别")
+        return tiles
+
+    def get_spot_popups(self, spot_ids: List[int]) -> dict:
+        """单景点要素的弹窗信息"""
+        popups = {}
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            rows = self.session.query(TouristSpot.id, TouristSpot.name,
+                                      TouristSpot.price, TouristSpot.rating)\
+                .filter(TouristSpot.id.in_(spot_ids[i:i + self.IN_CLAUSE_BATCH]))
+            popups.update((row.id, row) for row in rows)
+        return popups
+
+    def _aggregate(self, ids: np.ndarray, latitudes: np.ndarray,
+                   longitudes: np.ndarray, zoom: int) -> List[dict]:
+        if not len(ids):
+            return []
+        if zoom > Config.MAP_MAX_CLUSTER_ZOOM:
+            return [{'latitude': float(lat), 'longitude': float(lon), 'count': 1, 'spot_id': int(i)}
+                    for i, lat, lon in zip(ids, latitudes, longitudes)]
+
+        return self._features(ids, grid_bins(latitudes, longitudes, zoom, Config.MAP_CLUSTER_CELL_PX))
+
+    def _features(self, ids: np.ndarray, bins: dict) -> List[dict]:
+        # 每个网格任取一个景点ID，只有单个景点的网格才返回
+        representative = np.empty(len(bins['count']), dtype=np.int64)
+        representative[bins['inverse']] = ids
+        return [
+            {
+                'latitude': float(lat),
+                'longitude': float(lon),
+                'count': int(count),
+                'spot_id': int(spot_id) if count == 1 else None
+            }
+            for lat, lon, count, spot_id in zip(bins['latitude'], bins['longitude'],
+                                                bins['count'], representative)
+        ]
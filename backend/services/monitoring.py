@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
 import pandas as pd
-from models import Session, TouristSpot, VisitorData
+from backend.database import Session, get_pool_stats
+from backend.models import TouristSpot, VisitorData
 import random
 
 class MonitoringService:
     def __init__(self):
-        self.session = Session()
+        self.session = Session
     
     def get_real_time_stats(self):
         """
@@ -26,6 +27,10 @@ class MonitoringService:
             ]
         }
     
+    def get_db_pool_stats(self) -> dict:
+        """获取数据库连接池状态和签出等待时间"""
+        return get_pool_stats()
+    
     def _calculate_growth(self, today_data: list, yesterday_data: list) -> float:
         """计算同比增长率"""
         today_count = sum(d.visitor_count for d in today_data)
@@ -3,7 +3,7 @@ from backend.models import User
 
 class PermissionService:
     def __init__(self):
-        self.session = Session()
+        self.session = Session
     
     def check_permission(self, user_id: int, resource_id: int = None, action: str = 'read') -> bool:
         user = self.session.query(User).get(user_id)
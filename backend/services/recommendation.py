@@ -1,32 +1,73 @@
+import logging
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import Dict, List
 from backend.database import Session
-from backend.models import User, TouristSpot, VisitorData
+from backend.models import SpotVisitorStats, TouristSpot, UserSpotInteraction
+from backend.services.collaborative_filtering import CollaborativeFilteringModel
+from backend.services.spot_features import get_feature_index
+from backend.utils.cache import cached
 
 class RecommendationService:
     def __init__(self):
-        pass
+        self.session = Session
+        self.feature_index = get_feature_index()
+        self.cf_model = CollaborativeFilteringModel()
     
     def get_similar_spots(self, spot_id: int, n_recommendations: int = 5) -> list:
         """基于景点特征的相似景点推荐"""
-        spots = self.session.query(TouristSpot).all()
-        
-        # 构建特征矩阵（价格、评分、访客量等）
-        features = np.array([[
-            s.price,
-            s.rating,
-            s.visitor_data[-1].visitor_count if s.visitor_data else 0
-        ] for s in spots])
-        
-        # 计算相似度
-        similarities = cosine_similarity(features)
-        spot_idx = next(i for i, s in enumerate(spots) if s.id == spot_id)
-        
-        # 获取最相似的景点
-        similar_indices = similarities[spot_idx].argsort()[-n_recommendations-1:-1][::-1]
-        return [spots[i] for i in similar_indices]
+        # 只缓存景点ID，ORM对象每次从当前会话加载
+        similar_ids = self._similar_spot_ids(spot_id, n_recommendations)
+        spots = self.session.query(TouristSpot).filter(TouristSpot.id.in_(similar_ids)).all()
+        spots_by_id = {spot.id: spot for spot in spots}
+        return [spots_by_id[i] for i in similar_ids if i in spots_by_id]
+
+    def get_similar_spots_batch(self, spot_ids: List[int],
+                                n_recommendations: int = 5) -> Dict[int, list]:
+        """批量获取多个景点的相似景点"""
+        self.feature_index.refresh()
+        results = self.feature_index.query_batch(spot_ids, n_recommendations)
+        needed = {similar_id for matches in results.values() for similar_id, _ in matches}
+        spots_by_id = {}
+        needed = list(needed)
+        batch_size = self.feature_index.IN_CLAUSE_BATCH
+        for i in range(0, len(needed), batch_size):
+            spots_by_id.update(
+                (spot.id, spot) for spot in self.session.query(TouristSpot)
+                .filter(TouristSpot.id.in_(needed[i:i + batch_size]))
+            )
+        return {
+            spot_id: [spots_by_id[i] for i, _ in matches if i in spots_by_id]
+            for spot_id, matches in results.items()
+        }
+
+    @cached(ttl=3600, stale_ttl=600, tables=('tourist_spots', 'visitor_data', 'spot_visitor_stats'))
+    def _similar_spot_ids(self, spot_id: int, n_recommendations: int) -> list:
+        """计算相似景点ID列表"""
+        self.feature_index.refresh()
+        return [similar_id for similar_id, _ in
+                self.feature_index.query(spot_id, n_recommendations)]
     
     def get_personalized_recommendations(self, user_id: int, n_recommendations: int = 5) -> list:
-        """基于用户历史行为的个性化推荐"""
-        # 这里可以实现协同过滤算法
-        pass 
\ No newline at end of file
+        """基于用户历史行为的个性化推荐（读取离线协同过滤结果）"""
+        spot_ids = self.cf_model.recommend(user_id, n_recommendations)
+        if not spot_ids:
+            # 没有任何行为的用户推荐近30天最热门的景点
+            spot_ids = [row[0] for row in self.session.query(SpotVisitorStats.spot_id)
+                        .order_by(SpotVisitorStats.visitors_30d.desc())
+                        .limit(n_recommendations)]
+        spots = self.session.query(TouristSpot).filter(TouristSpot.id.in_(spot_ids)).all()
+        spots_by_id = {spot.id: spot for spot in spots}
+        return [spots_by_id[i] for i in spot_ids if i in spots_by_id]
+
+    def record_interaction(self, user_id: int, spot_id: int, kind: str = 'view') -> bool:
+        """记录用户浏览或到访景点，供下次离线训练使用"""
+        if kind not in CollaborativeFilteringModel.WEIGHTS:
+            return False
+        try:
+            self.session.add(UserSpotInteraction(user_id=user_id, spot_id=spot_id, kind=kind))
+            self.session.commit()
+            return True
+        except Exception as e:
+            self.session.rollback()
+            logging.error(f"Record interaction error: {e}")
+            return False
@@ -0,0 +1,151 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+import logging
+import pandas as pd
+from sqlalchemy import and_, func, insert, or_
+from backend.database import Session
+from backend.models import VisitorData, VisitorRollup
+from backend.utils.upsert import upsert
+from backend.utils.versioning import bump_table_versions
+
+GRANULARITIES = ('day', 'month', 'quarter')
+
+def period_start(date: datetime, granularity: str) -> datetime:
+    """计算日期所在统计周期的起始时间"""
+    if granularity == 'day':
+        return datetime(date.year, date.month, date.day)
+    if granularity == 'month':
+        return datetime(date.year, date.month, 1)
+    if granularity == 'quarter':
+        return datetime(date.year, (date.month - 1) // 3 * 3 + 1, 1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+class RollupService:
+    """维护访客数据的日/月/季度汇总表
+
+    新增访客数据时调用apply增量累加；汇总表损坏或口径变化时
+    调用rebuild从原始数据全量重建。
+    """
+
+    def __init__(self, session=None):
+        self.session = session or Session
+
+    def apply(self, records: Iterable[VisitorData]) -> int:
+        """把新增的访客记录增量累加到汇总表（由调用方提交事务）"""
+        deltas = self._aggregate(
+            (r.spot_id, r.visit_date, r.visitor_count, r.revenue) for r in records
+        )
+        table = VisitorRollup.__table__
+        # 一条upsert完成插入或原子的 x = x + delta 累加，并发写入同一个新周期时
+        # 不会因唯一键冲突失败；按键排序，减少并发事务间的死锁
+        upsert(self.session.connection(), table, [
+            {
+                'spot_id': spot_id,
+                'granularity': granularity,
+                'period_start': start,
+                'visitor_count': count,
+                'revenue': revenue
+            }
+            for (spot_id, granularity, start), (count, revenue) in sorted(deltas.items())
+        ], ('spot_id', 'granularity', 'period_start'), updates=lambda new: {
+            'visitor_count': table.c.visitor_count + new.visitor_count,
+            'revenue': table.c.revenue + new.revenue
+        })
+        return len(deltas)
+
+    def rebuild(self, batch_size: int = 10000) -> int:
+        """从原始访客数据全量重建汇总表
+
+        原始数据按(景点, ID)键集分页读取，每页读完后再写出其中已完整的景点的
+        汇总行，读写不会交错在同一个连接的未读完的游标上；内存只与单页和
+        单个景点的周期数有关。
+        """
+        table = VisitorRollup.__table__
+        base = self.session.query(
+            VisitorData.spot_id,
+            VisitorData.id,
+            VisitorData.visit_date,
+            VisitorData.visitor_count,
+            VisitorData.revenue
+        ).filter(VisitorData.visit_date.isnot(None), VisitorData.spot_id.isnot(None))
+
+        try:
+            self.session.execute(table.delete())
+            written = 0
+            current_spot = None
+            pending = []
+            last = None
+            while True:
+                query = base
+                if last is not None:
+                    query = query.filter(or_(
+                        VisitorData.spot_id > last[0],
+                        and_(VisitorData.spot_id == last[0], VisitorData.id > last[1])
+                    ))
+                page = [tuple(row) for row in
+                        query.order_by(VisitorData.spot_id, VisitorData.id).limit(batch_size)]
+                if not page:
+                    break
+                for spot_id, _, visit_date, count, revenue in page:
+                    if spot_id != current_spot and pending:
+                        written += self._write_rollups(pending)
+                        pending = []
+                    current_spot = spot_id
+                    pending.append((spot_id, visit_date, count, revenue))
+                last = page[-1][:2]
+            if pending:
+                written += self._write_rollups(pending)
+            bump_table_versions(self.session, [VisitorRollup.__tablename__])
+            self.session.commit()
+            logging.info(f"Visitor rollups rebuilt: {written} rows")
+            return written
+        except Exception as e:
+            self.session.rollback()
+            logging.error(f"Rollup rebuild error: {e}")
+            raise
+
+    def get_series(self, granularity: str, spot_id: Optional[int] = None) -> pd.DataFrame:
+        """读取汇总序列，未指定景点时按周期合计所有景点"""
+        query = self.session.query(
+            VisitorRollup.period_start,
+            func.sum(VisitorRollup.visitor_count),
+            func.sum(VisitorRollup.revenue)
+        ).filter(VisitorRollup.granularity == granularity)
+        if spot_id is not None:
+            query = query.filter(VisitorRollup.spot_id == spot_id)
+        rows = query.group_by(VisitorRollup.period_start)\
+            .order_by(VisitorRollup.period_start).all()
+
+        df = pd.DataFrame(rows, columns=['date', 'count', 'revenue'])
+        df['count'] = df['count'].astype(float)
+        df['revenue'] = df['revenue'].astype(float)
+        return df.set_index('date')
+
+    def _write_rollups(self, rows) -> int:
+        deltas = self._aggregate(rows)
+        self.session.execute(insert(VisitorRollup.__table__), [
+            {
+                'spot_id': spot_id,
+                'granularity': granularity,
+                'period_start': start,
+                'visitor_count': count,
+                'revenue': revenue
+            }
+            for (spot_id, granularity, start), (count, revenue) in deltas.items()
+        ])
+        return len(deltas)
+
+    def _aggregate(self, rows) -> Dict[Tuple[int, str, datetime], Tuple[int, float]]:
+        """把(spot_id, visit_date, visitor_count, revenue)按周期累加"""
+        deltas = {}
+        for spot_id, visit_date, count, revenue in rows:
+            if visit_date is None:
+                continue
+            for granularity in GRANULARITIES:
+                key = (spot_id, granularity, period_start(visit_date, granularity))
+                total_count, total_revenue = deltas.get(key, (0, 0.0))
+                deltas[key] = (total_count + (count or 0), total_revenue + (revenue or 0.0))
+        return deltas
+
+if __name__ == '__main__':
+    RollupService().rebuild()
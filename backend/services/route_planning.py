@@ -1,61 +1,211 @@
-from typing import List, Tuple
-import networkx as nx
-from models import Session, TouristSpot
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from backend.config import Config
+from backend.database import Session
+from backend.models import TouristSpot
+from backend.services.distance_cache import DistanceCache, plan_route_task, plan_route_worker
+from backend.services.itinerary import ItinerarySolver
+from backend.services.route_solver import solve_route
+from backend.utils.geo import haversine_matrix
+
+# 批量路线规划的常驻进程池，各请求共用，避免每次请求重新创建进程
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def _route_pool(workers: int) -> ProcessPoolExecutor:
+    """按进程数获取常驻进程池；用spawn启动，不从多线程的Web进程fork"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+def _reset_route_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
 
 class RoutePlanningService:
+    # 单条IN查询的最大ID数量
+    IN_CLAUSE_BATCH = 1000
+
     def __init__(self):
-        pass
-    
-    def plan_optimal_route(self, spot_ids: List[int], start_point: Tuple[float, float]) -> dict:
-        """规划最优游览路线"""
+        self.session = Session
+
+    def plan_optimal_route(self, spot_ids: List[int], start_point: Tuple[float, float],
+                           return_to_start: bool = True,
+                           time_budget: Optional[float] = None) -> dict:
+        """规划从起点出发的最优游览路线"""
         spots = self.session.query(TouristSpot).filter(TouristSpot.id.in_(spot_ids)).all()
-        
-        # 创建图
-        G = nx.Graph()
-        
-        # 添加节点和边
-        for i, spot1 in enumerate(spots):
-            G.add_node(spot1.id, 
-                      pos=(spot1.latitude, spot1.longitude),
-                      name=spot1.name)
-            
-            # 计算景点间距离作为边权重
-            for spot2 in spots[i+1:]:
-                distance = self._calculate_distance(
-                    (spot1.latitude, spot1.longitude),
-                    (spot2.latitude, spot2.longitude)
-                )
-                G.add_edge(spot1.id, spot2.id, weight=distance)
-        
-        # 使用TSP算法计算最优路径
-        path = nx.approximation.traveling_salesman_problem(G, cycle=True)
-        
+        spots = [spot for spot in spots if spot.latitude is not None and spot.longitude is not None]
+        if len(spots) < len(set(spot_ids)):
+            logging.warning(f"Route planning skipped {len(set(spot_ids)) - len(spots)} spots without coordinates")
+
+        # 节点0是起点，其余依次为景点
+        points = np.array([start_point] + [(spot.latitude, spot.longitude) for spot in spots])
+        dist = haversine_matrix(points)
+        order = solve_route(dist, time_budget or Config.ROUTE_TIME_BUDGET, return_to_start)
+        route = [spots[node - 1] for node in order]
+
         return {
-            'route': path,
-            'spots': [{'id': spot_id, 'name': G.nodes[spot_id]['name']} 
-                     for spot_id in path],
-            'total_distance': self._calculate_total_distance(G, path)
+            'route': [spot.id for spot in route],
+            'spots': [{'id': spot.id, 'name': spot.name,
+                       'latitude': spot.latitude, 'longitude': spot.longitude}
+                      for spot in route],
+            'total_distance': self._calculate_total_distance(
+                dist, [0] + order + ([0] if return_to_start else []))
         }
-    
-    def _calculate_distance(self, point1: Tuple[float, float], 
+
+    def plan_routes_batch(self, requests: List[dict], max_workers: Optional[int] = None,
+                          time_budget: Optional[float] = None) -> dict:
+        """并行规划多条路线
+
+        所有请求涉及的景点距离从共享的内存映射距离矩阵读取，再由常驻进程池中的
+        worker各自求解；矩阵中没有的少量景点在求解时临时计算，积累足够多时才重建矩阵。
+
+        Args:
+            requests: 每项包含spot_ids、start_point，可选return_to_start（默认True）
+            max_workers: worker进程数，默认使用配置或CPU核数
+
+        Returns:
+            {'results': 与requests顺序一致的结果（含每条路线耗时elapsed_ms）,
+             'workers': 进程数, 'elapsed_ms': 总耗时}
+        """
+        start = time.perf_counter()
+        time_budget = time_budget or Config.ROUTE_TIME_BUDGET
+        spots = self._load_spot_points({i for req in requests for i in req['spot_ids']})
+
+        cache = DistanceCache()
+        ids = sorted(spots)
+        cache.ensure(ids, np.array([(spots[i].latitude, spots[i].longitude) for i in ids]).reshape(-1, 2))
+
+        tasks = []
+        for req in requests:
+            # 去重并忽略不存在或没有坐标的景点
+            route_ids = [i for i in dict.fromkeys(req['spot_ids']) if i in spots]
+            coordinates = np.array([(spots[i].latitude, spots[i].longitude) for i in route_ids]).reshape(-1, 2)
+            tasks.append((route_ids, coordinates, tuple(req['start_point']),
+                          req.get('return_to_start', True), time_budget))
+        workers = min(max_workers or Config.ROUTE_BATCH_WORKERS or os.cpu_count() or 1,
+                      max(1, len(tasks)))
+        if workers == 1 or cache.snapshot is None:
+            # 单进程时直接使用本次请求的缓存对象，不经过worker的进程级缓存
+            workers = 1
+            solved = [plan_route_task(cache, task) for task in tasks]
+        else:
+            # 任务带上确切的快照目录，其他请求同时重建缓存也不影响本批次
+            snapshot_tasks = [(cache.snapshot,) + task for task in tasks]
+            chunksize = max(1, len(tasks) // (workers * 4))
+            try:
+                solved = list(_route_pool(workers).map(plan_route_worker, snapshot_tasks, chunksize=chunksize))
+            except BrokenProcessPool:
+                logging.warning("Route planning pool broken, restarting")
+                _reset_route_pool()
+                solved = list(_route_pool(workers).map(plan_route_worker, snapshot_tasks, chunksize=chunksize))
+
+        results = []
+        for result in solved:
+            if 'route' in result:
+                result['spots'] = [{'id': i, 'name': spots[i].name,
+                                    'latitude': spots[i].latitude, 'longitude': spots[i].longitude}
+                                   for i in result['route']]
+            results.append(result)
+        return {
+            'results': results,
+            'workers': workers,
+            'elapsed_ms': (time.perf_counter() - start) * 1000
+        }
+
+    def _load_spot_points(self, spot_ids) -> Dict[int, tuple]:
+        """分批读取景点名称和坐标，跳过没有坐标的景点"""
+        spot_ids = sorted(spot_ids)
+        spots = {}
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            rows = self.session.query(
+                TouristSpot.id, TouristSpot.name, TouristSpot.latitude, TouristSpot.longitude
+            ).filter(TouristSpot.id.in_(spot_ids[i:i + self.IN_CLAUSE_BATCH]))
+            spots.update({row.id: row for row in rows
+                          if row.latitude is not None and row.longitude is not None})
+        return spots
+
+    def plan_itinerary(self, spot_ids: List[int], start_point: Tuple[float, float],
+                       n_days: int = 1, day_start: float = 9.0, day_end: float = 18.0,
+                       time_limit: float = 1.0) -> dict:
+        """把景点分配到多天并安排每天的游览顺序
+
+        每天从起点出发并在day_end前返回，景点必须在开放时间内游览完。
+        在time_limit秒内返回找到的最好方案，排不下的景点放在unscheduled中。
+        """
+        start = time.perf_counter()
+        spots = self.session.query(TouristSpot).filter(TouristSpot.id.in_(spot_ids)).all()
+        spots = [spot for spot in spots if spot.latitude is not None and spot.longitude is not None]
+
+        points = np.array([start_point] + [(spot.latitude, spot.longitude) for spot in spots])
+        dist = haversine_matrix(points)
+        visit_hours = [0.0] + [spot.visit_hours or Config.DEFAULT_VISIT_HOURS for spot in spots]
+        open_hours = [day_start] + [
+            spot.open_hour if spot.open_hour is not None else Config.DEFAULT_OPEN_HOUR
+            for spot in spots
+        ]
+        close_hours = [day_end] + [
+            spot.close_hour if spot.close_hour is not None else Config.DEFAULT_CLOSE_HOUR
+            for spot in spots
+        ]
+        solver = ItinerarySolver(dist / Config.ROUTE_TRAVEL_SPEED_KMH, visit_hours,
+                                 open_hours, close_hours, n_days, day_start, day_end)
+        result = solver.solve(max(0.0, time_limit - (time.perf_counter() - start)))
+
+        days = []
+        for day, route in enumerate(result['days'], start=1):
+            stops = [
+                {
+                    'id': spots[stop['node'] - 1].id,
+                    'name': spots[stop['node'] - 1].name,
+                    'latitude': spots[stop['node'] - 1].latitude,
+                    'longitude': spots[stop['node'] - 1].longitude,
+                    'arrival': round(float(stop['arrival']), 2),
+                    'start': round(float(stop['start']), 2),
+                    'leave': round(float(stop['leave']), 2)
+                }
+                for stop in solver.schedule(route)
+            ]
+            days.append({
+                'day': day,
+                'spots': stops,
+                'distance': self._calculate_total_distance(dist, [0] + route + [0]) if route else 0.0,
+                'hours': float(solver.day_duration(route))
+            })
+
+        return {
+            'days': days,
+            'unscheduled': [spots[node - 1].id for node in result['unscheduled']],
+            'total_distance': sum(day['distance'] for day in days),
+            'total_hours': sum(day['hours'] for day in days),
+            'objective': float(result['objective']),
+            'iterations': result['iterations'],
+            'elapsed': time.perf_counter() - start
+        }
+
+    def _calculate_distance(self, point1: Tuple[float, float],
                           point2: Tuple[float, float]) -> float:
         """计算两点间距离"""
-        from math import radians, sin, cos, sqrt, atan2
-        
-        lat1, lon1 = map(radians, point1)
-        lat2, lon2 = map(radians, point2)
-        
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        
-        return 6371 * c  # 地球半径（公里）
-    
-    def _calculate_total_distance(self, G: nx.Graph, path: List[int]) -> float:
+        return float(haversine_matrix([point1], [point2])[0, 0])
+
+    def _calculate_total_distance(self, dist: np.ndarray, path: List[int]) -> float:
         """计算路径总距离"""
-        total = 0
-        for i in range(len(path)-1):
-            total += G[path[i]][path[i+1]]['weight']
-        return total 
\ No newline at end of file
+        if len(path) < 2:
+            return 0.0
+        return float(dist[path[:-1], path[1:]].sum())
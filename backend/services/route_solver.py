@@ -0,0 +1,105 @@
+import time
+from typing import List, Tuple
+import numpy as np
+from backend.config import Config
+
+# 小于该值的改进视为浮点误差
+_EPS = 1e-9
+
+def _path_matrix(dist: np.ndarray, return_to_start: bool) -> np.ndarray:
+    """在距离矩阵末尾追加终点节点
+
+    回到起点时终点是起点的副本；不回起点时终点到任何节点的距离都为0。
+    这样路线始终是首尾固定的路径，局部搜索只需要处理中间节点。
+    """
+    n = len(dist)
+    matrix = np.zeros((n + 1, n + 1))
+    matrix[:n, :n] = dist
+    if return_to_start:
+        matrix[n, :n] = dist[0]
+        matrix[:n, n] = dist[:, 0]
+    return matrix
+
+def nearest_neighbor_path(dist: np.ndarray) -> np.ndarray:
+    """从节点0出发每次走向最近的未访问节点，末尾接上终点节点"""
+    n = len(dist) - 1
+    path = np.empty(n + 1, dtype=np.int64)
+    path[0], path[n] = 0, n
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    current = 0
+    for position in range(1, n):
+        candidates = np.where(visited, np.inf, dist[current, :n])
+        current = int(np.argmin(candidates))
+        visited[current] = True
+        path[position] = current
+    return path
+
+def two_opt(dist: np.ndarray, path: np.ndarray, deadline: float) -> bool:
+    """2-opt：翻转路径片段消除交叉边，返回是否有改进"""
+    improved = False
+    n = len(path) - 1
+    for i in range(n - 1):
+        if time.perf_counter() > deadline:
+            break
+        a, b = path[i], path[i + 1]
+        # 同时评估边(a,b)与之后所有边(c,d)的交换收益
+        c, d = path[i + 2:n], path[i + 3:n + 1]
+        if not len(c):
+            continue
+        gains = dist[a, b] + dist[c, d] - dist[a, c] - dist[b, d]
+        best = int(np.argmax(gains))
+        if gains[best] > _EPS:
+            j = i + 2 + best
+            path[i + 1:j + 1] = path[i + 1:j + 1][::-1].copy()
+            improved = True
+    return improved
+
+def or_opt(dist: np.ndarray, path: np.ndarray, deadline: float,
+           max_segment: int = 3) -> Tuple[np.ndarray, bool]:
+    """Or-opt：把1~max_segment个连续节点（可反向）移到路径其他位置"""
+    improved = False
+    for length in range(1, max_segment + 1):
+        i = 1
+        while i + length < len(path):
+            if time.perf_counter() > deadline:
+                return path, improved
+            prev, first, last, after = path[i - 1], path[i], path[i + length - 1], path[i + length]
+            removal_gain = dist[prev, first] + dist[last, after] - dist[prev, after]
+
+            rest = np.concatenate([path[:i], path[i + length:]])
+            u, v = rest[:-1], rest[1:]
+            forward = dist[u, first] + dist[last, v] - dist[u, v]
+            backward = dist[u, last] + dist[first, v] - dist[u, v]
+            costs = np.minimum(forward, backward)
+            # 放回原位置没有意义
+            costs[i - 1] = np.inf
+            best = int(np.argmin(costs))
+            if removal_gain - costs[best] > _EPS:
+                segment = path[i:i + length]
+                if backward[best] < forward[best]:
+                    segment = segment[::-1]
+                path = np.concatenate([rest[:best + 1], segment, rest[best + 1:]])
+                improved = True
+            else:
+                i += 1
+    return path, improved
+
+def solve_route(dist: np.ndarray, time_budget: float = Config.ROUTE_TIME_BUDGET,
+                return_to_start: bool = True) -> List[int]:
+    """固定起点（节点0）的路线求解：最近邻构造初始解，再交替2-opt和Or-opt改进
+
+    超出时间预算时返回当前最好的解。
+
+    Returns:
+        除起点外的节点访问顺序
+    """
+    deadline = time.perf_counter() + time_budget
+    matrix = _path_matrix(np.asarray(dist, dtype=np.float64), return_to_start)
+    path = nearest_neighbor_path(matrix)
+    while time.perf_counter() < deadline:
+        improved = two_opt(matrix, path, deadline)
+        path, moved = or_opt(matrix, path, deadline)
+        if not (improved or moved):
+            break
+    return [int(node) for node in path[1:-1]]
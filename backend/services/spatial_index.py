@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+from sklearn.neighbors import BallTree
+from backend.database import Session
+from backend.models import TouristSpot
+from backend.utils.geo import EARTH_RADIUS_KM, haversine_matrix
+from backend.utils.versioning import get_table_versions
+
+class SpatialIndex:
+    """景点坐标的内存空间索引
+
+    半径和k近邻查询使用haversine距离的BallTree；视窗查询在按纬度排序的
+    坐标数组上二分定位纬度范围，再筛选经度。景点表版本号变化时整体重建，
+    百万级景点重建约一秒。
+    """
+
+    TABLES = ('tourist_spots',)
+
+    def __init__(self, session=None):
+        self.session = session or Session
+        # (ID, 纬度, 经度, BallTree)，按纬度排序；整体替换保证查询看到一致的数据
+        self._state = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), None)
+        self.versions = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._state[0])
+
+    def refresh(self) -> bool:
+        """景点表有变更时重建索引，返回是否重建"""
+        versions = get_table_versions(self.session, self.TABLES)
+        if versions == self.versions:
+            return False
+        with self._lock:
+            if versions == self.versions:
+                return False
+            self.rebuild(versions)
+            return True
+
+    def rebuild(self, versions: Optional[dict] = None, batch_size: int = 100000):
+        """从数据库分批读取坐标重建索引"""
+        start = time.perf_counter()
+        versions = versions or get_table_versions(self.session, self.TABLES)
+        stmt = self.session.query(TouristSpot.id, TouristSpot.latitude, TouristSpot.longitude)\
+            .filter(TouristSpot.latitude.isnot(None), TouristSpot.longitude.isnot(None))\
+            .statement
+        result = self.session.execute(stmt, execution_options={'stream_results': True})
+        # 先转成元组，直接用Row对象构造数组非常慢
+        blocks = [np.array([tuple(row) for row in partition], dtype=np.float64).reshape(-1, 3)
+                  for partition in result.partitions(batch_size)]
+        rows = np.vstack(blocks) if blocks else np.empty((0, 3))
+        rows = rows[np.argsort(rows[:, 1], kind='stable')]
+
+        ids, latitudes, longitudes = rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2]
+        tree = BallTree(np.radians(rows[:, 1:3]), metric='haversine') if len(rows) else None
+        self._state = (ids, latitudes, longitudes, tree)
+        self.versions = versions
+        logging.info(f"Spatial index rebuilt: {len(ids)} spots in {time.perf_counter() - start:.2f}s")
+
+    def snapshot(self) -> tuple:
+        """当前索引的(ID, 纬度, 经度, BallTree)，按纬度排序，调用方不应修改"""
+        return self._state
+
+    def radius(self, latitude: float, longitude: float, radius_km: float,
+               limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """半径范围内的景点(ID, 距离公里)，按距离升序"""
+        ids, _, _, tree = self._state
+        if tree is None:
+            return []
+        indices, distances = tree.query_radius(
+            np.radians([[latitude, longitude]]), r=radius_km / EARTH_RADIUS_KM,
+            return_distance=True, sort_results=True
+        )
+        indices, distances = indices[0][:limit], distances[0][:limit]
+        return [(int(ids[i]), float(d * EARTH_RADIUS_KM)) for i, d in zip(indices, distances)]
+
+    def nearest(self, latitude: float, longitude: float, k: int = 10) -> List[Tuple[int, float]]:
+        """距离最近的k个景点(ID, 距离公里)"""
+        ids, _, _, tree = self._state
+        k = min(k, len(ids))
+        if tree is None or k <= 0:
+            return []
+        distances, indices = tree.query(np.radians([[latitude, longitude]]), k=k)
+        return [(int(ids[i]), float(d * EARTH_RADIUS_KM))
+                for i, d in zip(indices[0], distances[0])]
+
+    def viewport(self, south: float, west: float, north: float, east: float,
+                 limit: Optional[int] = None) -> List[int]:
+        """地图视窗内的景点ID；west大于east时视窗跨越180度经线
+
+        超过limit时按到视窗中心的距离取最近的景点，结果不偏向视窗南部。
+        """
+        ids, latitudes, longitudes = self.points_in(south, west, north, east)
+        if limit is None or len(ids) <= limit:
+            return ids.tolist()
+        if limit <= 0:
+            return []
+        center_lon = (west + east) / 2 if west <= east else (west + east + 360) / 2
+        center_lon = (center_lon + 180) % 360 - 180
+        distances = haversine_matrix([(south + north) / 2, center_lon],
+                                     np.column_stack([latitudes, longitudes]))[0]
+        nearest = np.argpartition(distances, limit - 1)[:limit]
+        return ids[nearest[np.argsort(distances[nearest], kind='stable')]].tolist()
+
+    def points_in(self, south: float, west: float, north: float,
+                  east: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """经纬度范围内景点的(ID, 纬度, 经度)数组"""
+        ids, latitudes, longitudes, _ = self._state
+        begin = np.searchsorted(latitudes, south, side='left')
+        end = np.searchsorted(latitudes, north, side='right')
+        lon = longitudes[begin:end]
+        if west <= east:
+            inside = (lon >= west) & (lon <= east)
+        else:
+            inside = (lon >= west) | (lon <= east)
+        return ids[begin:end][inside], latitudes[begin:end][inside], lon[inside]
+
+_spatial_index = None
+_spatial_index_lock = threading.Lock()
+
+def get_spatial_index() -> SpatialIndex:
+    """进程内共享的空间索引实例"""
+    global _spatial_index
+    if _spatial_index is None:
+        with _spatial_index_lock:
+            if _spatial_index is None:
+                _spatial_index = SpatialIndex()
+    return _spatial_index
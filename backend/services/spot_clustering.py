@@ -0,0 +1,434 @@
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import StandardScaler
+from sqlalchemy import func
+from backend.config import Config
+from backend.database import Session
+from backend.models import TouristSpot
+from backend.utils.snapshots import file_lock
+from backend.utils.versioning import get_table_versions
+
+# 聚类特征列
+FEATURE_COLUMNS = (TouristSpot.price, TouristSpot.rating)
+
+def iter_spot_features(session, since: Optional[datetime] = None,
+                       chunk_size: int = Config.CLUSTER_CHUNK_SIZE) -> Iterator[Tuple[List[int], np.ndarray]]:
+    """通过服务端游标分块读取(景点ID, 特征矩阵)，缺失值为NaN"""
+    query = session.query(TouristSpot.id, *FEATURE_COLUMNS)
+    if since is not None:
+        query = query.filter(TouristSpot.updated_at >= since)
+    result = session.execute(query.order_by(TouristSpot.id).statement,
+                             execution_options={'stream_results': True})
+    for partition in result.partitions(chunk_size):
+        # 先转成元组，直接用Row对象构造数组非常慢
+        rows = [tuple(row) for row in partition]
+        features = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, len(FEATURE_COLUMNS))
+        yield [row[0] for row in rows], features
+
+class SpotClusteringModel:
+    """按价格和评分对景点聚类的增量模型
+
+    特征从数据库分块流式读取：全量训练时第一遍partial_fit标准化器，第二遍
+    partial_fit MiniBatchKMeans；已有模型时用旧簇中心初始化（warm start）。
+    景点有变更时只把变更的景点增量partial_fit进现有模型（在副本上训练后
+    替换，预测不会读到训练到一半的模型），有景点被删除时改为全量重训。每次训练保存为
+    新版本的joblib文件，latest.json指向当前版本，预测时不需要重新训练。
+    版本号在文件锁内按磁盘上已有的最大版本号分配，多个进程训练同一模型
+    不会写出相同的版本；其他进程发布了更新的版本时refresh先加载它。
+    """
+
+    TABLES = ('tourist_spots',)
+    # 保留的历史版本数
+    KEEP_VERSIONS = 5
+    # 增量训练读取变更时与上次训练时间重叠的秒数，避免与训练同时提交的写入被漏掉
+    UPDATE_OVERLAP_SECONDS = 5
+
+    def __init__(self, n_clusters: int = 3, path: Optional[str] = None, session=None):
+        self.n_clusters = n_clusters
+        self.path = path or os.path.join(Config.CLUSTER_MODEL_PATH, f'k{n_clusters}')
+        self.session = session or Session
+        self.scaler = None
+        self.kmeans = None
+        self.version = 0
+        self.versions = None
+        self.trained_at = None
+        self.n_samples = 0
+        # 已训练景点的最大ID，和重叠时间窗内已训练景点的{ID: 更新时间}，增量训练时跳过
+        self.max_id = None
+        self.fed = {}
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._trainer = None
+        if os.path.exists(os.path.join(self.path, 'latest.json')):
+            self.load()
+
+    def refresh(self) -> bool:
+        """景点表有变更时更新模型，返回是否产生了新版本"""
+        versions = get_table_versions(self.session, self.TABLES)
+        if versions == self.versions:
+            return False
+        with self._lock:
+            self.reload_if_newer()
+            if versions == self.versions:
+                return False
+            if self.kmeans is None:
+                return self.rebuild() > 0
+            return self.update(versions) > 0
+
+    def schedule_refresh(self) -> bool:
+        """景点表有变更时在后台线程中refresh，同一时间只运行一个，返回是否正在训练"""
+        with self._lock:
+            if self._trainer is not None and self._trainer.is_alive():
+                return True
+        if get_table_versions(self.session, self.TABLES) == self.versions:
+            return False
+        with self._lock:
+            if self._trainer is None or not self._trainer.is_alive():
+                self._trainer = threading.Thread(target=self._refresh_in_background,
+                                                 name=f'cluster-trainer-k{self.n_clusters}', daemon=True)
+                self._trainer.start()
+        return True
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"Background clustering refresh (k={self.n_clusters}) failed: {e}")
+        finally:
+            # 后台线程使用独立的会话，结束后归还连接
+            Session.remove()
+
+    def reload_if_newer(self) -> bool:
+        """latest.json指向比内存中更新的版本（其他进程训练的）时重新加载，返回是否加载"""
+        if self._latest_version() > self.version:
+            self.load()
+            return True
+        return False
+
+    def rebuild(self, epochs: int = 3, chunk_size: int = Config.CLUSTER_CHUNK_SIZE) -> int:
+        """全量训练，返回训练样本数"""
+        started_at = datetime.now()
+        versions = get_table_versions(self.session, self.TABLES)
+
+        scaler = StandardScaler()
+        n_samples, max_id = 0, 0
+        for ids, features in self._iter_features(chunk_size=chunk_size):
+            scaler.partial_fit(features)
+            n_samples += len(features)
+            max_id = max(max_id, max(ids))
+        if n_samples < self.n_clusters:
+            logging.warning(f"Not enough spots to train {self.n_clusters} clusters")
+            return 0
+
+        kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, init=self._warm_start_centers(scaler),
+                                 n_init=1, batch_size=chunk_size, random_state=0)
+        pending = np.empty((0, len(FEATURE_COLUMNS)))
+        for _ in range(epochs):
+            for _, features in self._iter_features(chunk_size=chunk_size):
+                # 第一次partial_fit的样本数不能少于簇数
+                pending = np.vstack([pending, scaler.transform(features)])
+                if len(pending) >= self.n_clusters:
+                    kmeans.partial_fit(pending)
+                    pending = pending[:0]
+        if len(pending):
+            kmeans.partial_fit(pending)
+
+        with self._swap_lock:
+            self.scaler, self.kmeans = scaler, kmeans
+        self.n_samples, self.max_id, self.fed = n_samples, max_id, {}
+        self._commit_version(versions, started_at)
+        return n_samples
+
+    def update(self, versions: Optional[dict] = None) -> int:
+        """只用上次训练后新增或变更的景点继续训练，标准化器保持不变
+
+        在模型副本上partial_fit后再替换；有景点被删除时全量重训，返回训练样本数。
+        """
+        started_at = datetime.now()
+        versions = versions or get_table_versions(self.session, self.TABLES)
+        if self.max_id is None or self._has_deletions():
+            # 增量训练无法去掉已删除景点的影响
+            logging.info(f"Clustering model k={self.n_clusters}: spots deleted, rebuilding")
+            return self.rebuild()
+
+        since = self.trained_at - timedelta(seconds=self.UPDATE_OVERLAP_SECONDS)
+        overlap_start = started_at - timedelta(seconds=self.UPDATE_OVERLAP_SECONDS)
+        kmeans = copy.deepcopy(self.kmeans)
+        max_id, inserted, updated, fed = self.max_id, 0, 0, {}
+        for ids, updated_at, features in self._iter_changes(since):
+            stamps = [stamp.isoformat() for stamp in updated_at]
+            # 上次训练的重叠时间窗内已经训练过的同一版本景点不再重复训练
+            new = np.array([self.fed.get(str(i)) != stamp for i, stamp in zip(ids, stamps)], dtype=bool)
+            if new.any():
+                kmeans.partial_fit(self.scaler.transform(features[new]))
+            updated += int(new.sum())
+            inserted += sum(1 for i in ids if i > self.max_id)
+            max_id = max(max_id, max(ids))
+            fed.update((str(i), stamp) for i, stamp, moment in zip(ids, stamps, updated_at)
+                       if moment >= overlap_start)
+
+        with self._swap_lock:
+            self.kmeans = kmeans
+        # 样本数按不同景点计算，变更的已有景点不重复计数
+        self.n_samples += inserted
+        self.max_id, self.fed = max_id, fed
+        self._commit_version(versions, started_at)
+        return updated
+
+    def predict(self, features: Sequence[Sequence[Optional[float]]]) -> List[int]:
+        """为新的景点特征（价格、评分）分配簇，缺失值按均值处理"""
+        scaler, kmeans = self._artifacts()
+        if kmeans is None:
+            raise ValueError("聚类模型尚未训练")
+        features = self._clean(np.array(features, dtype=np.float64).reshape(-1, len(FEATURE_COLUMNS)), scaler)
+        return kmeans.predict(scaler.transform(features)).tolist()
+
+    def predict_all(self, chunk_size: int = Config.CLUSTER_CHUNK_SIZE) -> Tuple[List[int], List[int]]:
+        """分块为全部景点分配簇，返回(景点ID, 簇编号)"""
+        ids, labels = [], []
+        scaler, kmeans = self._artifacts()
+        if kmeans is None:
+            return ids, labels
+        for chunk_ids, features in iter_spot_features(self.session, chunk_size=chunk_size):
+            ids.extend(chunk_ids)
+            labels.extend(kmeans.predict(scaler.transform(self._clean(features, scaler))).tolist())
+        return ids, labels
+
+    def save(self):
+        """保存当前模型并把latest.json指向它，调用方需持有模型目录的文件锁"""
+        os.makedirs(self.path, exist_ok=True)
+        target = os.path.join(self.path, f'v{self.version}.joblib')
+        joblib.dump({'scaler': self.scaler, 'kmeans': self.kmeans}, target + '.tmp')
+        os.replace(target + '.tmp', target)
+        meta = {
+            'version': self.version,
+            'n_clusters': self.n_clusters,
+            'n_samples': self.n_samples,
+            'max_id': self.max_id,
+            'fed': self.fed,
+            'versions': self.versions,
+            'trained_at': self.trained_at.isoformat()
+        }
+        latest = os.path.join(self.path, 'latest.json')
+        with open(latest + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(latest + '.tmp', latest)
+        self._prune()
+
+    def load(self, version: Optional[int] = None):
+        """加载指定版本，默认加载latest.json指向的版本"""
+        try:
+            with open(os.path.join(self.path, 'latest.json')) as f:
+                meta = json.load(f)
+            version = version or meta['version']
+            artifacts = joblib.load(os.path.join(self.path, f'v{version}.joblib'))
+            with self._swap_lock:
+                self.scaler, self.kmeans = artifacts['scaler'], artifacts['kmeans']
+            self.version = version
+            self.n_samples = meta['n_samples']
+            self.max_id = meta.get('max_id')
+            self.fed = meta.get('fed', {})
+            self.versions = meta['versions']
+            self.trained_at = datetime.fromisoformat(meta['trained_at'])
+        except Exception as e:
+            logging.error(f"Failed to load clustering model from {self.path}: {e}")
+
+    def _commit_version(self, versions: dict, started_at: datetime):
+        start = time.perf_counter()
+        self.versions = versions
+        self.trained_at = started_at
+        with file_lock(os.path.join(self.path, '.lock')):
+            # 版本号取磁盘上已有的最大版本号加一，分配和写入latest.json在同一把锁内
+            self.version = max(self._latest_version(), *self._disk_versions(), self.version) + 1
+            self.save()
+        logging.info(
+            f"Clustering model k={self.n_clusters} saved as v{self.version} "
+            f"({self.n_samples} samples) in {time.perf_counter() - start:.2f}s"
+        )
+
+    def _latest_version(self) -> int:
+        """latest.json指向的版本号，没有时为0"""
+        try:
+            with open(os.path.join(self.path, 'latest.json')) as f:
+                return int(json.load(f)['version'])
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _disk_versions(self) -> List[int]:
+        if not os.path.isdir(self.path):
+            return []
+        return [int(name[1:-len('.joblib')]) for name in os.listdir(self.path)
+                if name.startswith('v') and name.endswith('.joblib') and name[1:-len('.joblib')].isdigit()]
+
+    def _artifacts(self) -> tuple:
+        """同一时刻的(标准化器, 模型)，训练线程替换模型时不会读到新旧混合的一对"""
+        with self._swap_lock:
+            return self.scaler, self.kmeans
+
+    def _has_deletions(self) -> bool:
+        """景点总数少于已训练景点数加上之后新增的景点数时，说明有景点被删除"""
+        total = self.session.query(func.count(TouristSpot.id)).scalar()
+        inserted = self.session.query(func.count(TouristSpot.id)).filter(TouristSpot.id > self.max_id).scalar()
+        return total < self.n_samples + inserted
+
+    def _iter_changes(self, since: datetime, chunk_size: int = Config.CLUSTER_CHUNK_SIZE
+                      ) -> Iterator[Tuple[List[int], List[datetime], np.ndarray]]:
+        """分块读取since之后变更的(景点ID, 更新时间, 特征矩阵)"""
+        query = self.session.query(TouristSpot.id, TouristSpot.updated_at, *FEATURE_COLUMNS)\
+            .filter(TouristSpot.updated_at >= since).order_by(TouristSpot.id)
+        result = self.session.execute(query.statement, execution_options={'stream_results': True})
+        for partition in result.partitions(chunk_size):
+            rows = [tuple(row) for row in partition]
+            features = np.array([row[2:] for row in rows], dtype=np.float64).reshape(-1, len(FEATURE_COLUMNS))
+            yield [row[0] for row in rows], [row[1] for row in rows], self._clean(features)
+
+    def _warm_start_centers(self, scaler: StandardScaler):
+        """旧簇中心换算到新的标准化空间作为初始中心，没有旧模型时用k-means++"""
+        if self.kmeans is None:
+            return 'k-means++'
+        centers = self.scaler.inverse_transform(self.kmeans.cluster_centers_)
+        return scaler.transform(centers)
+
+    def _iter_features(self, since: Optional[datetime] = None,
+                       chunk_size: int = Config.CLUSTER_CHUNK_SIZE) -> Iterator[Tuple[List[int], np.ndarray]]:
+        for ids, features in iter_spot_features(self.session, since, chunk_size):
+            yield ids, self._clean(features)
+
+    def _clean(self, features: np.ndarray, scaler: Optional[StandardScaler] = None) -> np.ndarray:
+        # 缺失值用标准化器的均值填充（标准化后为0），尚未拟合时用0
+        scaler = scaler or self.scaler
+        missing = np.isnan(features)
+        if missing.any():
+            fill = scaler.mean_ if scaler is not None else np.zeros(features.shape[1])
+            features[missing] = np.broadcast_to(fill, features.shape)[missing]
+        return features
+
+    def _prune(self):
+        for version in self._disk_versions():
+            if version <= self.version - self.KEEP_VERSIONS:
+                os.remove(os.path.join(self.path, f'v{version}.joblib'))
+
+def sample_spot_features(session, sample_size: int, seed: int = 0) -> Tuple[np.ndarray, int]:
+    """流式读取时按比例随机抽样特征完整的景点，返回(样本, 景点总数)"""
+    total = session.query(TouristSpot.id).count()
+    rate = min(1.0, sample_size / max(total, 1))
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for _, features in iter_spot_features(session):
+        features = features[~np.isnan(features).any(axis=1)]
+        blocks.append(features[rng.random(len(features)) < rate])
+    sample = np.vstack(blocks) if blocks else np.empty((0, len(FEATURE_COLUMNS)))
+    return sample[:sample_size], total
+
+# 选择簇数的worker进程中的样本，由进程池initializer设置一次
+_selection_features = None
+
+def init_selection_worker(features: np.ndarray):
+    global _selection_features
+    _selection_features = features
+
+def evaluate_selection_task(task: tuple) -> dict:
+    """进程池worker：在initializer传入的样本上评估一个k"""
+    k, silhouette_size, seed = task
+    return evaluate_cluster_count((k, _selection_features, silhouette_size, seed))
+
+def evaluate_cluster_count(task: tuple) -> dict:
+    """在标准化后的样本上拟合k个簇，返回惯性和抽样轮廓系数"""
+    k, features, silhouette_size, seed = task
+    start = time.perf_counter()
+    kmeans = MiniBatchKMeans(n_clusters=k, n_init=3, batch_size=4096, random_state=seed).fit(features)
+    labels = kmeans.predict(features)
+    if len(np.unique(labels)) > 1:
+        silhouette = float(silhouette_score(features, labels, sample_size=min(silhouette_size, len(features)),
+                                            random_state=seed))
+    else:
+        silhouette = -1.0
+    return {
+        'k': k,
+        'inertia': float(kmeans.inertia_),
+        'silhouette': silhouette,
+        'elapsed_ms': (time.perf_counter() - start) * 1000
+    }
+
+def elbow_point(k_values: Sequence[int], inertias: Sequence[float]) -> int:
+    """惯性曲线的拐点：两轴归一化后距首尾连线最远的点"""
+    k = np.asarray(k_values, dtype=np.float64)
+    inertia = np.asarray(inertias, dtype=np.float64)
+    if len(k) < 3:
+        return int(k[0])
+    x = (k - k[0]) / (k[-1] - k[0])
+    y = (inertia - inertia[-1]) / max(inertia[0] - inertia[-1], 1e-12)
+    # 首尾连线为x + y = 1，点到直线的距离与1 - x - y成正比
+    return int(k[np.argmax(1 - x - y)])
+
+def select_n_clusters(k_values: Iterable[int], sample_size: int = Config.CLUSTER_SELECTION_SAMPLE,
+                      silhouette_size: int = Config.CLUSTER_SILHOUETTE_SAMPLE,
+                      max_workers: Optional[int] = None, session=None) -> dict:
+    """在进程池中并行评估多个簇数，推荐抽样轮廓系数最高的k
+
+    特征抽样到sample_size行后标准化，每个k在样本上拟合一次，
+    轮廓系数再抽样silhouette_size行计算，耗时与景点总数基本无关。
+
+    Returns:
+        {'recommended': 推荐簇数（景点不足时为None）, 'elbow': 惯性曲线拐点,
+         'scores': 每个k的惯性、轮廓系数和耗时, 'sample_size': 样本数,
+         'total': 景点总数, 'elapsed_ms': 总耗时}
+    """
+    start = time.perf_counter()
+    sample, total = sample_spot_features(session or Session, sample_size)
+    k_values = sorted({k for k in k_values if 2 <= k < len(sample)})
+    if not k_values:
+        return {'recommended': None, 'elbow': None, 'scores': [], 'sample_size': len(sample),
+                'total': total, 'elapsed_ms': (time.perf_counter() - start) * 1000}
+
+    features = StandardScaler().fit_transform(sample)
+    tasks = [(k, silhouette_size, 0) for k in k_values]
+    workers = min(max_workers or Config.CLUSTER_SELECTION_WORKERS or os.cpu_count() or 1, len(tasks))
+    if workers == 1:
+        scores = [evaluate_cluster_count((k, features, silhouette_size, 0)) for k in k_values]
+    else:
+        # 用spawn启动，不从加载了TensorFlow/OpenMP的多线程进程fork；样本每个worker只传一次
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_selection_worker, initargs=(features,)) as executor:
+            scores = list(executor.map(evaluate_selection_task, tasks))
+
+    # 轮廓系数相同时取较小的k
+    best = max(scores, key=lambda score: (score['silhouette'], -score['k']))
+    return {
+        'recommended': best['k'],
+        'elbow': elbow_point(k_values, [score['inertia'] for score in scores]),
+        'scores': scores,
+        'sample_size': len(sample),
+        'total': total,
+        'elapsed_ms': (time.perf_counter() - start) * 1000
+    }
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_clustering_model(n_clusters: int = 3) -> SpotClusteringModel:
+    """进程内共享的各簇数聚类模型"""
+    model = _models.get(n_clusters)
+    if model is None:
+        with _models_lock:
+            model = _models.get(n_clusters)
+            if model is None:
+                model = _models[n_clusters] = SpotClusteringModel(n_clusters)
+    return model
+
+if __name__ == '__main__':
+    # 全量重训：python -m backend.services.spot_clustering [簇数]
+    import sys
+    get_clustering_model(int(sys.argv[1]) if len(sys.argv) > 1 else 3).rebuild()
@@ -0,0 +1,194 @@
+import copy
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from backend.config import Config
+from backend.database import Session
+from backend.models import SpotVisitorStats, TouristSpot
+from backend.services.ann_index import ExactIndex, create_index
+from backend.utils.snapshots import build_directory, current_snapshot, publish_snapshot, snapshot_lock
+from backend.utils.versioning import get_table_versions
+
+class SpotFeatureIndex:
+    """景点特征矩阵（价格、评分、最新访客量），按行L2归一化
+
+    特征保存在可替换的检索后端中（精确或IVF近似），快照作为不可变的版本
+    目录持久化到磁盘，由current指针整体切换，并以内存映射方式加载。读取前先比较表版本号，有变化时只重新加载新增
+    或变更的景点。
+    """
+
+    TABLES = ('tourist_spots', 'visitor_data', 'spot_visitor_stats')
+    DIM = 3
+    # 批量查询时每次参与矩阵乘法的查询景点数，限制中间结果内存
+    QUERY_BATCH = 256
+    # 单条IN查询的最大ID数量
+    IN_CLAUSE_BATCH = 1000
+
+    def __init__(self, path: Optional[str] = Config.FEATURE_INDEX_PATH,
+                 kind: str = Config.SIMILARITY_INDEX, session=None):
+        self.path = path
+        self.kind = kind
+        self.session = session or Session
+        self.index = self._new_index()
+        self.versions = None
+        self.refreshed_at = None
+        self._lock = threading.RLock()
+        if path and current_snapshot(path):
+            self.load()
+
+    def refresh(self) -> int:
+        """增量刷新特征矩阵，返回更新的景点数"""
+        with self._lock:
+            versions = get_table_versions(self.session, self.TABLES)
+            if versions == self.versions:
+                return 0
+            if self.refreshed_at is None:
+                return self.rebuild()
+
+            started_at = datetime.now()
+            changed = self._changed_spot_ids()
+
+            # 在副本上修改后整体替换，查询线程看到的始终是一致的索引
+            index = copy.copy(self.index)
+            if self.versions is None or versions['tourist_spots'] != self.versions['tourist_spots']:
+                # 景点表有变更时清理已删除的景点（只读取ID列）
+                current = np.array([row[0] for row in self.session.query(TouristSpot.id)],
+                                   dtype=np.int64)
+                index.remove(np.setdiff1d(np.asarray(index.ids), current))
+
+            new_ids, new_rows = self._load_features(sorted(changed))
+            if len(new_ids):
+                index.add(new_ids, new_rows)
+
+            self.index = index
+            self.versions = versions
+            self.refreshed_at = started_at
+            self.save()
+            return len(new_ids)
+
+    def rebuild(self) -> int:
+        """从数据库全量重建特征矩阵"""
+        with self._lock:
+            started_at = datetime.now()
+            versions = get_table_versions(self.session, self.TABLES)
+            ids, matrix = self._load_features(None)
+            index = self._new_index()
+            index.build(ids, matrix)
+            self.index = index
+            self.versions = versions
+            self.refreshed_at = started_at
+            self.save()
+            logging.info(f"Spot feature index rebuilt: {len(ids)} spots ({self.kind})")
+            return len(ids)
+
+    def query(self, spot_id: int, k: int = 5) -> List[Tuple[int, float]]:
+        """返回与指定景点余弦相似度最高的k个景点(ID, 相似度)"""
+        return self.query_batch([spot_id], k).get(spot_id, [])
+
+    def query_batch(self, spot_ids: Sequence[int], k: int = 5) -> Dict[int, List[Tuple[int, float]]]:
+        """批量查询多个景点的相似景点，不存在的景点不出现在结果中"""
+        index = self.index
+        known, vectors = index.vectors_for(spot_ids)
+        if not len(known) or k <= 0:
+            return {}
+
+        results = {}
+        for start in range(0, len(known), self.QUERY_BATCH):
+            batch = known[start:start + self.QUERY_BATCH]
+            # 多取一个，结果中排除景点自身
+            matches = index.search(vectors[start:start + self.QUERY_BATCH], k + 1)
+            for spot_id, row in zip(batch, matches):
+                results[int(spot_id)] = [(i, score) for i, score in row if i != spot_id][:k]
+        return results
+
+    def save(self):
+        """把索引和状态写入新的版本目录后切换current指针"""
+        if not self.path:
+            return
+        with snapshot_lock(self.path):
+            directory = build_directory(self.path)
+            self.index.save(directory)
+            state = {
+                'kind': self.kind,
+                'versions': self.versions,
+                'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None
+            }
+            with open(os.path.join(directory, 'state.json'), 'w') as f:
+                json.dump(state, f)
+            publish_snapshot(self.path, directory)
+
+    def load(self):
+        """以内存映射方式加载快照，后端类型与配置不一致时忽略快照"""
+        try:
+            snapshot = current_snapshot(self.path)
+            with open(os.path.join(snapshot, 'state.json')) as f:
+                state = json.load(f)
+            if state['kind'] != self.kind:
+                return
+            self.index = ExactIndex.load(snapshot, mmap=True)
+            self.versions = state['versions']
+            self.refreshed_at = datetime.fromisoformat(state['refreshed_at']) if state['refreshed_at'] else None
+        except Exception as e:
+            logging.error(f"Failed to load spot feature index from {self.path}: {e}")
+
+    def _new_index(self) -> ExactIndex:
+        params = {'n_probe': Config.SIMILARITY_N_PROBE} if self.kind == 'ivf' else {}
+        return create_index(self.kind, self.DIM, **params)
+
+    def _changed_spot_ids(self) -> set:
+        """上次刷新后信息变更或有新访客数据的景点"""
+        # 留出少量重叠，避免与刷新同时提交的写入被漏掉
+        since = self.refreshed_at - timedelta(seconds=5)
+        changed = {row[0] for row in self.session.query(TouristSpot.id)
+                   .filter(TouristSpot.updated_at >= since)}
+        changed.update(row[0] for row in self.session.query(SpotVisitorStats.spot_id)
+                       .filter(SpotVisitorStats.updated_at >= since))
+        return changed
+
+    def _load_features(self, spot_ids: Optional[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """读取景点原始特征并归一化；spot_ids为None时读取全部景点"""
+        if spot_ids is None:
+            rows = self._feature_query().all()
+        else:
+            rows = []
+            for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+                batch = spot_ids[i:i + self.IN_CLAUSE_BATCH]
+                rows.extend(self._feature_query().filter(TouristSpot.id.in_(batch)).all())
+
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        raw = np.array([[row[1] or 0, row[2] or 0, row[3] or 0] for row in rows],
+                       dtype=np.float32).reshape(-1, 3)
+        return ids, self._normalize(raw)
+
+    def _feature_query(self):
+        # 最新访客量直接读取维护好的快照表
+        return self.session.query(
+            TouristSpot.id,
+            TouristSpot.price,
+            TouristSpot.rating,
+            SpotVisitorStats.latest_visitor_count
+        ).outerjoin(SpotVisitorStats, SpotVisitorStats.spot_id == TouristSpot.id)
+
+    def _normalize(self, raw: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(raw, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return raw / norms
+
+_feature_index = None
+_feature_index_lock = threading.Lock()
+
+def get_feature_index() -> SpotFeatureIndex:
+    """进程内共享的特征矩阵实例"""
+    global _feature_index
+    if _feature_index is None:
+        with _feature_index_lock:
+            if _feature_index is None:
+                _feature_index = SpotFeatureIndex()
+    return _feature_index
+
+if __name__ == '__main__':
+    get_feature_index().rebuild()
@@ -1,13 +1,14 @@
 from typing import List, Optional
 from datetime import datetime
-from backend.models import Session, User
+from backend.models import User
 from backend.database import Session
+from backend.services.auth import invalidate_user_tokens
 import bcrypt
 import logging
 
 class UserService:
     def __init__(self):
-        self.session = Session()
+        self.session = Session
     
     def get_all_users(self) -> List[User]:
         """
@@ -23,6 +24,27 @@ class UserService:
         if user:
             user.last_login = datetime.now()
             self.session.commit()
+
+    def update_user(self, user_id: int, email: Optional[str] = None, is_admin: Optional[bool] = None,
+                    data_access_level: Optional[int] = None) -> bool:
+        """修改用户的邮箱、管理员标志或权限级别，并使其token缓存失效"""
+        user = self.get_user_by_id(user_id)
+        if not user:
+            return False
+        try:
+            if email is not None:
+                user.email = email
+            if is_admin is not None:
+                user.is_admin = is_admin
+            if data_access_level is not None:
+                user.data_access_level = data_access_level
+            invalidate_user_tokens(self.session, user_id)
+            self.session.commit()
+            return True
+        except Exception as e:
+            self.session.rollback()
+            logging.error(f"Update user error: {e}")
+            return False
     
     def create_user(self, username: str, password: str, email: str, is_admin: bool = False) -> bool:
         """
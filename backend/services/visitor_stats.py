@@ -0,0 +1,160 @@
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+import logging
+from sqlalchemy import and_, delete, func, insert, or_, select
+from backend.database import Session
+from backend.models import SpotVisitorStats, VisitorData, VisitorRollup
+from backend.utils.upsert import upsert
+from backend.utils.versioning import bump_table_versions
+
+class VisitorStatsService:
+    """维护每个景点的最新访客快照（最新访客量、收入和近7/30天合计）
+
+    需要"当前热度"的功能直接读取spot_visitor_stats，一次查询即可，
+    不再逐个景点懒加载全部访客历史。
+    """
+
+    WINDOWS = {'visitors_7d': 7, 'visitors_30d': 30}
+    # 单条IN查询的最大ID数量
+    IN_CLAUSE_BATCH = 1000
+
+    def __init__(self, session=None):
+        self.session = session or Session
+
+    def refresh_spots(self, spot_ids: Iterable[int]) -> int:
+        """重新计算指定景点的快照（由调用方提交事务）
+
+        只读取每个景点最近30天的日汇总和最后一天的访客记录，按主键upsert，
+        并发写入同一景点时不会主键冲突。
+        """
+        spot_ids = sorted(set(spot_ids))
+        written = 0
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            records = self._compute_recent(spot_ids[i:i + self.IN_CLAUSE_BATCH])
+            upsert(self.session.connection(), SpotVisitorStats.__table__, records, ('spot_id',))
+            written += len(records)
+        if written:
+            bump_table_versions(self.session, [SpotVisitorStats.__tablename__])
+        return written
+
+    def backfill(self) -> int:
+        """用窗口查询为所有景点全量重建快照"""
+        try:
+            self.session.execute(delete(SpotVisitorStats.__table__))
+            written = self._write(self._compute(None))
+            bump_table_versions(self.session, [SpotVisitorStats.__tablename__])
+            self.session.commit()
+            logging.info(f"Spot visitor stats backfilled: {written} spots")
+            return written
+        except Exception as e:
+            self.session.rollback()
+            logging.error(f"Visitor stats backfill error: {e}")
+            raise
+
+    def get_stats(self, spot_ids: List[int]) -> Dict[int, SpotVisitorStats]:
+        """批量读取景点快照"""
+        stats = {}
+        for i in range(0, len(spot_ids), self.IN_CLAUSE_BATCH):
+            batch = spot_ids[i:i + self.IN_CLAUSE_BATCH]
+            stats.update((s.spot_id, s) for s in self.session.query(SpotVisitorStats)
+                         .filter(SpotVisitorStats.spot_id.in_(batch)))
+        return stats
+
+    def _compute_recent(self, spot_ids: List[int]) -> List[dict]:
+        """按日汇总中每个景点最后有数据的一天，只读取窗口内的数据计算快照"""
+        window = max(self.WINDOWS.values())
+        latest_days = dict(self.session.query(VisitorRollup.spot_id, func.max(VisitorRollup.period_start))
+                           .filter(VisitorRollup.granularity == 'day', VisitorRollup.spot_id.in_(spot_ids))
+                           .group_by(VisitorRollup.spot_id))
+        if not latest_days:
+            return []
+        stats = {
+            spot_id: {
+                'spot_id': spot_id,
+                'latest_visit_date': None,
+                'latest_visitor_count': 0,
+                'latest_revenue': 0.0,
+                **{name: 0 for name in self.WINDOWS}
+            }
+            for spot_id in latest_days
+        }
+        # 最后一天的原始记录中取最新的一条
+        rows = self.session.query(VisitorData.spot_id, VisitorData.visit_date, VisitorData.id,
+                                  VisitorData.visitor_count, VisitorData.revenue)\
+            .filter(or_(*(and_(VisitorData.spot_id == spot_id, VisitorData.visit_date >= day)
+                          for spot_id, day in latest_days.items())))
+        latest = {}
+        for spot_id, visit_date, row_id, count, revenue in rows:
+            if spot_id not in latest or (visit_date, row_id) > latest[spot_id][:2]:
+                latest[spot_id] = (visit_date, row_id, count, revenue)
+        for spot_id, (visit_date, _, count, revenue) in latest.items():
+            stats[spot_id].update(latest_visit_date=visit_date, latest_visitor_count=count or 0,
+                                  latest_revenue=revenue or 0.0)
+        # 截至最后一天（含）的近7/30天日汇总
+        rows = self.session.query(VisitorRollup.spot_id, VisitorRollup.period_start, VisitorRollup.visitor_count)\
+            .filter(VisitorRollup.granularity == 'day',
+                    or_(*(and_(VisitorRollup.spot_id == spot_id,
+                               VisitorRollup.period_start > day - timedelta(days=window))
+                          for spot_id, day in latest_days.items())))
+        for spot_id, period_start, count in rows:
+            for name, days in self.WINDOWS.items():
+                if period_start > latest_days[spot_id] - timedelta(days=days):
+                    stats[spot_id][name] += count or 0
+        return [record for record in stats.values() if record['latest_visit_date'] is not None]
+
+    def _compute(self, spot_ids: Optional[List[int]]) -> List[dict]:
+        # 每个景点最新的一条访客记录
+        latest = select(
+            VisitorData.spot_id,
+            VisitorData.visit_date,
+            VisitorData.visitor_count,
+            VisitorData.revenue,
+            func.row_number().over(
+                partition_by=VisitorData.spot_id,
+                order_by=(VisitorData.visit_date.desc(), VisitorData.id.desc())
+            ).label('rn')
+        ).where(VisitorData.visit_date.isnot(None))
+        # 每个景点最近有数据的30天（日汇总），滚动合计在其中按日期截取
+        window = max(self.WINDOWS.values())
+        recent = select(
+            VisitorRollup.spot_id,
+            VisitorRollup.period_start,
+            VisitorRollup.visitor_count,
+            func.row_number().over(
+                partition_by=VisitorRollup.spot_id,
+                order_by=VisitorRollup.period_start.desc()
+            ).label('rn')
+        ).where(VisitorRollup.granularity == 'day')
+        if spot_ids is not None:
+            latest = latest.where(VisitorData.spot_id.in_(spot_ids))
+            recent = recent.where(VisitorRollup.spot_id.in_(spot_ids))
+
+        latest = latest.subquery()
+        recent = recent.subquery()
+        stats = {
+            row.spot_id: {
+                'spot_id': row.spot_id,
+                'latest_visit_date': row.visit_date,
+                'latest_visitor_count': row.visitor_count or 0,
+                'latest_revenue': row.revenue or 0.0,
+                **{name: 0 for name in self.WINDOWS}
+            }
+            for row in self.session.execute(select(latest).where(latest.c.rn == 1))
+        }
+        for row in self.session.execute(select(recent).where(recent.c.rn <= window)):
+            record = stats.get(row.spot_id)
+            if record is None:
+                continue
+            latest_day = record['latest_visit_date'].replace(hour=0, minute=0, second=0, microsecond=0)
+            for name, days in self.WINDOWS.items():
+                if row.period_start > latest_day - timedelta(days=days):
+                    record[name] += row.visitor_count or 0
+        return list(stats.values())
+
+    def _write(self, records: List[dict]) -> int:
+        if records:
+            self.session.execute(insert(SpotVisitorStats.__table__), records)
+        return len(records)
+
+if __name__ == '__main__':
+    VisitorStatsService().backfill()
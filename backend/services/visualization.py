@@ -1,18 +1,36 @@
+from typing import Optional
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from backend.config import Config
+from backend.utils.geo import fit_grid_bins, grid_bins
 
 class VisualizationService:
-    def create_heatmap(self, data: pd.DataFrame) -> go.Figure:
-        """创建热力图"""
+    def create_heatmap(self, data: pd.DataFrame, zoom: Optional[int] = None) -> go.Figure:
+        """创建热力图
+
+        坐标点先在服务端按网格聚合，每个网格的访客量求和后作为一个点，
+        发送到浏览器的点数不超过MAP_MAX_FEATURES。
+        """
+        data = data.dropna(subset=['latitude', 'longitude'])
+        bins = self._heatmap_bins(data, zoom)
         fig = go.Figure(data=go.Densitymapbox(
-            lat=data['latitude'],
-            lon=data['longitude'],
-            z=data['visitor_count'],
+            lat=bins['latitude'],
+            lon=bins['longitude'],
+            z=bins['weight'],
             radius=10
         ))
         fig.update_layout(mapbox_style="stamen-terrain")
         return fig
+
+    def _heatmap_bins(self, data: pd.DataFrame, zoom: Optional[int]) -> dict:
+        """按指定缩放级别聚合；未指定时选择点数不超过上限的最大缩放级别"""
+        weights = data['visitor_count'].fillna(0).to_numpy(dtype=float)
+        if zoom is not None:
+            return grid_bins(data['latitude'], data['longitude'], zoom,
+                             Config.MAP_CLUSTER_CELL_PX, weights)
+        return fit_grid_bins(data['latitude'], data['longitude'], Config.MAP_MAX_CLUSTER_ZOOM,
+                             Config.MAP_CLUSTER_CELL_PX, Config.MAP_MAX_FEATURES, weights)[1]
         
     def create_dashboard(self, data: dict) -> list:
         """创建数据大屏"""
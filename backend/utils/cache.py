@@ -1,21 +1,343 @@
-from functools import lru_cache
-from datetime import datetime, timedelta
-from typing import Optional
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Iterable, Optional
+from backend.config import Config
+
+class SQLiteCacheTier:
+    """基于SQLite文件的共享缓存层，供多个worker进程共享计算结果"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expire_at REAL NOT NULL)'
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3连接不能跨线程使用，每个线程各自持有一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[tuple]:
+        """返回(值, 剩余秒数, 字节数)，不存在或已过期返回None"""
+        row = self._connection().execute(
+            'SELECT value, expire_at FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        remaining = row[1] - time.time()
+        if remaining <= 0:
+            return None
+        return pickle.loads(row[0]), remaining, len(row[0])
+
+    def set(self, key: str, payload: bytes, expire_seconds: float):
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expire_at) VALUES (?, ?, ?)',
+            (key, payload, time.time() + expire_seconds)
+        )
+        conn.commit()
+
+    def delete(self, key: str):
+        conn = self._connection()
+        conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        conn.commit()
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM cache_entries')
+        conn.commit()
+
+    def sweep(self) -> int:
+        conn = self._connection()
+        deleted = conn.execute(
+            'DELETE FROM cache_entries WHERE expire_at <= ?', (time.time(),)
+        ).rowcount
+        conn.commit()
+        return deleted
 
 class CacheManager:
-    def __init__(self):
-        self.cache = {}
-        self.expire_time = {}
-    
+    """线程安全的LRU+TTL内存缓存
+
+    同时限制条目数和估算字节数，超出时按最近最少使用淘汰；
+    后台线程定期清理过期条目。可选挂载SQLite共享层，
+    本地未命中时从共享层读取。
+    """
+
+    def __init__(self, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 sweep_interval: Optional[float] = None,
+                 shared_path: Optional[str] = None,
+                 shared: bool = True):
+        self.max_entries = max_entries or Config.CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.CACHE_MAX_BYTES
+        self.sweep_interval = sweep_interval or Config.CACHE_SWEEP_INTERVAL
+        shared_path = shared_path or Config.CACHE_SHARED_PATH
+        self.shared = SQLiteCacheTier(shared_path) if shared and shared_path else None
+
+        # key -> (value, 过期时间, 字节数)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'shared_hits': 0
+        }
+        self._stop = threading.Event()
+        self._sweeper = None
+
     def set(self, key: str, value: any, expire_seconds: int = 3600):
-        self.cache[key] = value
-        self.expire_time[key] = datetime.now() + timedelta(seconds=expire_seconds)
-    
+        payload = self._serialize(value)
+        size = len(payload) if payload is not None else sys.getsizeof(value)
+        if size > self.max_bytes:
+            logging.warning(f"Cache value for {key} exceeds byte budget, not cached")
+            return
+
+        self._store_local(key, value, expire_seconds, size)
+        self._ensure_sweeper()
+
+        if self.shared and payload is not None:
+            try:
+                self.shared.set(key, payload, expire_seconds)
+            except sqlite3.Error as e:
+                logging.error(f"Shared cache write error: {e}")
+
     def get(self, key: str) -> Optional[any]:
-        if key not in self.cache:
-            return None
-        if datetime.now() > self.expire_time[key]:
-            del self.cache[key]
-            del self.expire_time[key]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.monotonic() <= entry[1]:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[0]
+                self._remove(key)
+                self._stats['expirations'] += 1
+
+        if self.shared:
+            try:
+                found = self.shared.get(key)
+            except sqlite3.Error as e:
+                logging.error(f"Shared cache read error: {e}")
+                found = None
+            if found is not None:
+                value, remaining, size = found
+                self._store_local(key, value, remaining, size)
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+        if self.shared:
+            self.shared.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.shared:
+            self.shared.clear()
+
+    def sweep(self) -> int:
+        """清理所有已过期条目，返回清理数量"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry[1] < now]
+            for key in expired:
+                self._remove(key)
+            self._stats['expirations'] += len(expired)
+        if self.shared:
+            try:
+                self.shared.sweep()
+            except sqlite3.Error as e:
+                logging.error(f"Shared cache sweep error: {e}")
+        return len(expired)
+
+    def stats(self) -> dict:
+        """命中、未命中、淘汰等统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        """停止后台清理线程"""
+        self._stop.set()
+
+    def _store_local(self, key: str, value: any, expire_seconds: float, size: int):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + expire_seconds, size)
+            self._bytes += size
+            self._evict()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[2]
+            self._stats['evictions'] += 1
+
+    def _serialize(self, value: any) -> Optional[bytes]:
+        # ORM对象等无法序列化的值只保存在本地缓存中
+        try:
+            return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
             return None
-        return self.cache[key] 
\ No newline at end of file
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(
+                target=_sweep_loop,
+                args=(weakref.ref(self), self._stop, self.sweep_interval),
+                name='cache-sweeper',
+                daemon=True
+            )
+            self._sweeper.start()
+
+def _sweep_loop(cache_ref, stop: threading.Event, interval: float):
+    # 只持有弱引用，缓存对象被回收后线程自动退出
+    while not stop.wait(interval):
+        cache = cache_ref()
+        if cache is None:
+            return
+        cache.sweep()
+        del cache
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache() -> CacheManager:
+    """进程内共享的默认缓存实例"""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = CacheManager()
+    return _default_cache
+
+def cached(ttl: int = 3600, stale_ttl: int = 0,
+           key: Optional[Callable[..., str]] = None,
+           tables: Iterable[str] = ()):
+    """服务方法结果缓存装饰器
+
+    同一个key缺失时只允许一个调用方重新计算，其余调用方等待其结果；
+    stale_ttl大于0时，结果过期后的stale_ttl秒内直接返回旧值，
+    并在后台只启动一次刷新，避免缓存失效瞬间大量请求同时打到数据库。
+
+    缓存实例优先使用服务对象的cache_manager属性，否则使用默认缓存。
+
+    Args:
+        ttl: 结果保持新鲜的秒数
+        stale_ttl: 过期后仍可返回旧值的秒数
+        key: 自定义key函数，参数与被装饰方法相同
+        tables: 结果依赖的表，表版本号变化后使用新的key，旧结果不再命中
+    """
+    def decorator(func):
+        inflight = {}
+        inflight_lock = threading.Lock()
+
+        def make_key(self, args, kwargs) -> str:
+            if key:
+                return key(self, *args, **kwargs)
+            parts = [type(self).__name__, func.__name__]
+            parts += [repr(arg) for arg in args]
+            parts += [f"{name}={value!r}" for name, value in sorted(kwargs.items())]
+            return ':'.join(parts)
+
+        def versioned_key(self, args, kwargs) -> str:
+            cache_key = make_key(self, args, kwargs)
+            if tables:
+                from backend.utils.versioning import get_table_versions
+                versions = get_table_versions(self.session, tables)
+                cache_key += ':v' + ','.join(str(versions[name]) for name in sorted(versions))
+            return cache_key
+
+        def compute(cache, cache_key, self, args, kwargs):
+            try:
+                value = func(self, *args, **kwargs)
+                cache.set(cache_key, (value, time.time() + ttl), ttl + stale_ttl)
+                return value
+            finally:
+                with inflight_lock:
+                    inflight.pop(cache_key).set()
+
+        def refresh(cache, cache_key, self, args, kwargs):
+            try:
+                compute(cache, cache_key, self, args, kwargs)
+            except Exception as e:
+                logging.error(f"Background refresh of {cache_key} failed: {e}")
+            finally:
+                # 后台线程使用自己的scoped会话，刷新结束后归还连接
+                from backend.database import Session
+                Session.remove()
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, 'cache_manager', None) or get_default_cache()
+            cache_key = versioned_key(self, args, kwargs)
+            while True:
+                entry = cache.get(cache_key)
+                if entry is not None:
+                    value, fresh_until = entry
+                    if time.time() < fresh_until:
+                        return value
+                    # 已过期但在容忍期内：返回旧值，后台只刷新一次
+                    with inflight_lock:
+                        if cache_key not in inflight:
+                            inflight[cache_key] = threading.Event()
+                            threading.Thread(
+                                target=refresh,
+                                args=(cache, cache_key, self, args, kwargs),
+                                daemon=True
+                            ).start()
+                    return value
+
+                with inflight_lock:
+                    event = inflight.get(cache_key)
+                    if event is None:
+                        inflight[cache_key] = threading.Event()
+                if event is None:
+                    return compute(cache, cache_key, self, args, kwargs)
+                # 等待正在计算的调用方完成后重新读取缓存；
+                # 如果它失败了，等待者中会有一个接手重新计算
+                event.wait()
+        return wrapper
+    return decorator
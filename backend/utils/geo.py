@@ -0,0 +1,92 @@
+from typing import Optional
+import numpy as np
+
+# 地球平均半径（公里）
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_matrix(points: np.ndarray, others: Optional[np.ndarray] = None) -> np.ndarray:
+    """批量计算球面距离矩阵（公里）
+
+    Args:
+        points: (n, 2) 的 [纬度, 经度] 数组（角度）
+        others: (m, 2) 的 [纬度, 经度] 数组，为None时计算points两两之间的距离
+
+    Returns:
+        (n, m) 距离矩阵
+    """
+    a = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    b = a if others is None else np.radians(np.asarray(others, dtype=np.float64).reshape(-1, 2))
+    lat1, lon1 = a[:, 0:1], a[:, 1:2]
+    lat2, lon2 = b[:, 0], b[:, 1]
+    h = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    # 浮点误差可能让h略大于1
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+# Web墨卡托投影的纬度上限，瓦片边长（像素）
+MERCATOR_MAX_LATITUDE = 85.05112878
+TILE_SIZE = 256
+
+def lonlat_to_pixel(latitudes, longitudes, zoom: int) -> tuple:
+    """经纬度转换为指定缩放级别下的Web墨卡托全局像素坐标(x, y)"""
+    lat = np.radians(np.clip(np.asarray(latitudes, dtype=np.float64),
+                             -MERCATOR_MAX_LATITUDE, MERCATOR_MAX_LATITUDE))
+    lon = np.asarray(longitudes, dtype=np.float64)
+    scale = TILE_SIZE * 2 ** zoom
+    x = (lon + 180.0) / 360.0 * scale
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * scale
+    # 右边界和下边界归入最后一个像素
+    return np.clip(x, 0, scale - 1e-9), np.clip(y, 0, scale - 1e-9)
+
+def tile_bounds(zoom: int, x: int, y: int) -> tuple:
+    """瓦片的经纬度范围(south, west, north, east)"""
+    n = 2 ** zoom
+
+    def latitude(row):
+        return float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * row / n)))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
+
+def grid_bins(latitudes, longitudes, zoom: int, cell_px: int, weights=None) -> dict:
+    """按缩放级别下cell_px像素的网格聚合坐标点
+
+    网格与瓦片对齐（cell_px需整除TILE_SIZE），同一网格不会跨瓦片。
+
+    Returns:
+        {'cells': 每个网格的(列, 行), 'latitude'/'longitude': 网格内点的质心,
+         'count': 点数, 'weight': 权重和, 'inverse': 每个点所属网格的下标}
+    """
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    x, y = lonlat_to_pixel(lat, lon, zoom)
+    # 行列号合成一个整数键，一维unique比按行unique快得多
+    n = TILE_SIZE * 2 ** zoom // cell_px
+    keys, inverse, counts = np.unique((x // cell_px).astype(np.int64) * n + (y // cell_px).astype(np.int64),
+                                      return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    weights = np.ones(len(lat)) if weights is None else np.asarray(weights, dtype=np.float64)
+    return {
+        'cells': np.column_stack([keys // n, keys % n]),
+        'latitude': np.bincount(inverse, lat, len(keys)) / counts,
+        'longitude': np.bincount(inverse, lon, len(keys)) / counts,
+        'count': counts,
+        'weight': np.bincount(inverse, weights, len(keys)),
+        'inverse': inverse
+    }
+
+def fit_grid_bins(latitudes, longitudes, max_zoom: int, cell_px: int,
+                  max_cells: int, weights=None) -> tuple:
+    """选择聚合后网格数不超过max_cells的最大缩放级别（不超过max_zoom）
+
+    网格数随缩放级别单调增加，从低到高尝试，超过上限时返回上一级的结果。
+
+    Returns:
+        (缩放级别, grid_bins结果)
+    """
+    fitted = (0, grid_bins(latitudes, longitudes, 0, cell_px, weights))
+    for zoom in range(1, max_zoom + 1):
+        bins = grid_bins(latitudes, longitudes, zoom, cell_px, weights)
+        if len(bins['count']) > max_cells:
+            break
+        fitted = (zoom, bins)
+    return fitted
@@ -0,0 +1,93 @@
+import gzip
+import hashlib
+import math
+from datetime import date, datetime
+from functools import wraps
+from typing import Iterable
+from flask import request, Response
+from backend.database import Session
+from backend.utils.versioning import get_table_versions
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的响应不压缩
+COMPRESS_MIN_SIZE = 1024
+
+def conditional(tables: Iterable[str]):
+    """基于表版本号的ETag条件请求装饰器
+
+    ETag由请求路径、参数、当前用户和相关表的版本号计算，
+    数据未变化时直接返回304，不执行视图函数。
+    """
+    tables = tuple(tables)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            user = args[0] if args else None
+            versions = get_table_versions(Session, tables)
+            raw = '|'.join([
+                request.full_path,
+                str(getattr(user, 'id', '')),
+                ','.join(f"{name}={version}" for name, version in sorted(versions.items()))
+            ])
+            etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = func(*args, **kwargs)
+                if isinstance(response, tuple) or response.status_code != 200:
+                    return response
+            # 压缩后内容编码不同，使用弱ETag
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def compress_response(response: Response) -> Response:
+    """按Accept-Encoding对较大的JSON响应进行brotli或gzip压缩"""
+    if response.direct_passthrough or response.is_streamed \
+            or response.status_code != 200 \
+            or response.mimetype != 'application/json' \
+            or 'Content-Encoding' in response.headers:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(data))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
+
+def to_json_safe(value):
+    """把分析结果中的时间戳键、NaN和numpy标量转换为可JSON序列化的值"""
+    if isinstance(value, dict):
+        return {_json_key(k): to_json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_safe(v) for v in value]
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _json_key(key) -> str:
+    if isinstance(key, (datetime, date)):
+        return key.isoformat()
+    return str(key)
@@ -0,0 +1,76 @@
+import fcntl
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# 指向当前快照目录的指针文件和重建锁文件
+CURRENT_POINTER = 'current'
+LOCK_FILE = '.lock'
+
+@contextmanager
+def file_lock(path: str):
+    """跨进程（及进程内各线程）的排他文件锁，用于串行化快照的重建"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def snapshot_lock(root: str):
+    return file_lock(os.path.join(root, LOCK_FILE))
+
+def current_snapshot(root: str) -> Optional[str]:
+    """当前快照目录的完整路径，没有快照时返回None"""
+    try:
+        with open(os.path.join(root, CURRENT_POINTER)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, name) if name else None
+
+def build_directory(root: str) -> str:
+    """新建本进程专用的临时构建目录，写完后交给publish_snapshot发布"""
+    path = os.path.join(root, f'.build-{os.getpid()}-{time.time_ns()}')
+    os.makedirs(path)
+    return path
+
+def publish_snapshot(root: str, build_dir: str, keep: int = 3, min_age: float = 600) -> str:
+    """把构建目录发布为新的不可变版本目录并切换current指针，调用方需持有snapshot_lock
+
+    版本号取磁盘上已有的最大版本号加一；旧版本保留keep个，且只清理
+    被替换超过min_age秒的版本，正在读取旧版本的进程不受影响。
+
+    Returns:
+        新快照目录的完整路径
+    """
+    versions = [int(name[1:]) for name in os.listdir(root)
+                if name.startswith('v') and name[1:].isdigit()]
+    name = f'v{max(versions, default=0) + 1}'
+    target = os.path.join(root, name)
+    os.rename(build_dir, target)
+    previous = current_snapshot(root)
+    if previous and os.path.isdir(previous):
+        # 旧版本的修改时间记为被替换的时间，清理时按此计算保留时长
+        os.utime(previous)
+    pointer = os.path.join(root, CURRENT_POINTER)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(name)
+    os.replace(pointer + '.tmp', pointer)
+    prune_snapshots(root, keep, min_age)
+    return target
+
+def prune_snapshots(root: str, keep: int = 3, min_age: float = 600):
+    """删除current之外较旧的版本目录"""
+    current = os.path.basename(current_snapshot(root) or '')
+    versions = sorted((int(name[1:]) for name in os.listdir(root)
+                       if name.startswith('v') and name[1:].isdigit() and name != current),
+                      reverse=True)
+    now = time.time()
+    for version in versions[max(keep - 1, 0):]:
+        path = os.path.join(root, f'v{version}')
+        if now - os.path.getmtime(path) > min_age:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,37 @@
+from typing import Callable, List, Optional, Sequence, Union
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+def upsert(connection, table, rows: List[dict], keys: Sequence[str],
+           updates: Optional[Union[dict, Callable]] = None):
+    """按主键或唯一键批量插入，已存在的行更新其余列（MySQL/PostgreSQL/SQLite）
+
+    并发写入同一键时不会因主键冲突失败，后提交的值生效。
+
+    Args:
+        updates: 已存在的行要更新的{列名: 表达式}（如table.c.version + 1），默认用插入的值；
+            也可以是函数，参数为待插入行的列集合（MySQL的inserted/其他方言的excluded），
+            如lambda new: {'count': table.c.count + new.count}
+    """
+    if not rows:
+        return
+    columns = [name for name in rows[0] if name not in keys]
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        if callable(updates):
+            updates = updates(stmt.inserted)
+        # 没有需要更新的列时把键更新为自身，相当于忽略重复行
+        stmt = stmt.on_duplicate_key_update(
+            updates or {name: stmt.inserted[name] for name in (columns or keys[:1])})
+    elif dialect in ('postgresql', 'sqlite'):
+        stmt = (postgresql if dialect == 'postgresql' else sqlite).insert(table)
+        if callable(updates):
+            updates = updates(stmt.excluded)
+        if updates or columns:
+            stmt = stmt.on_conflict_do_update(index_elements=list(keys),
+                                              set_=updates or {name: stmt.excluded[name] for name in columns})
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(keys))
+    else:
+        raise NotImplementedError(f"Upsert is not supported for {dialect}")
+    connection.execute(stmt, rows)
@@ -0,0 +1,66 @@
+import logging
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Iterable
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession, scoped_session
+from backend.models import TableVersion
+from backend.utils.upsert import upsert
+
+# 会话info中记录本事务内有变更、提交后需要递增版本号的表
+PENDING_KEY = 'pending_table_versions'
+
+def bump_table_versions(session, table_names: Iterable[str]):
+    """标记表在调用方的事务中有变更，事务提交后再递增版本号
+
+    版本号在提交后用独立的短事务更新，不在写入事务中持有table_versions
+    的行锁，多个写入事务不会因此串行。
+    """
+    if isinstance(session, scoped_session):
+        session = session()
+    session.info.setdefault(PENDING_KEY, set()).update(table_names)
+
+def increment_table_versions(connection, table_names: Iterable[str]):
+    """在给定连接上立即递增表的版本号，第一次变更时插入版本号1"""
+    table = TableVersion.__table__
+    now = datetime.now()
+    upsert(connection, table,
+           [{'table_name': name, 'version': 1, 'updated_at': now} for name in sorted(set(table_names))],
+           ('table_name',), updates={'version': table.c.version + 1, 'updated_at': now})
+
+def get_table_versions(session, table_names: Iterable[str]) -> Dict[str, int]:
+    """读取表的当前版本号，从未变更过的表为0"""
+    names = sorted(set(table_names))
+    rows = session.query(TableVersion.table_name, TableVersion.version)\
+        .filter(TableVersion.table_name.in_(names)).all()
+    versions = dict.fromkeys(names, 0)
+    versions.update(rows)
+    return versions
+
+@event.listens_for(OrmSession, 'after_flush')
+def _track_orm_changes(session, flush_context):
+    # ORM写入自动标记涉及的表；Core批量写入需自行调用bump_table_versions
+    tables = {
+        obj.__table__.name
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if hasattr(obj, '__table__')
+    }
+    tables.discard(TableVersion.__tablename__)
+    if tables:
+        bump_table_versions(session, tables)
+
+@event.listens_for(OrmSession, 'after_commit')
+def _bump_committed_versions(session):
+    tables = session.info.pop(PENDING_KEY, None)
+    if not tables:
+        return
+    try:
+        with session.get_bind().begin() as connection:
+            increment_table_versions(connection, tables)
+    except Exception as e:
+        # 数据已提交，版本号更新失败只会让缓存晚一些失效
+        logging.error(f"Failed to bump table versions {sorted(tables)}: {e}")
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_pending_versions(session):
+    session.info.pop(PENDING_KEY, None)
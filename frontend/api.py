@@ -5,6 +5,8 @@ class APIClient:
     def __init__(self, base_url: str):
         self.base_url = base_url
         self.session = requests.Session()
+        # url -> (ETag, 上次响应内容)，数据未变化时服务端返回304直接复用
+        self._etag_cache = {}
     
     def set_token(self, token: str):
         self.session.headers.update({
@@ -26,15 +28,46 @@ class APIClient:
             return False
         return True
     
-    def get_spots(self):
+    def _conditional_get(self, path: str, params: dict = None):
+        """带If-None-Match的GET请求，304时返回本地保存的上次结果"""
+        request = requests.Request('GET', f'{self.base_url}{path}', params=params).prepare()
+        url = request.url
+        headers = {}
+        cached = self._etag_cache.get(url)
+        if cached:
+            headers['If-None-Match'] = cached[0]
         try:
-            response = self.session.get(f'{self.base_url}/api/spots')
+            response = self.session.get(url, headers=headers)
+            if response.status_code == 304 and cached:
+                return cached[1]
             if self._handle_error(response):
-                return response.json()
+                data = response.json()
+                etag = response.headers.get('ETag')
+                if etag:
+                    self._etag_cache[url] = (etag, data)
+                return data
         except requests.RequestException as e:
             st.error(f"网络请求错误: {str(e)}")
             return None
     
+    def get_spots(self, limit: int = 100, after_id: int = None, fields: str = None):
+        params = {'limit': limit}
+        if after_id is not None:
+            params['after_id'] = after_id
+        if fields:
+            params['fields'] = fields
+        return self._conditional_get('/api/spots', params)
+
+    def get_location_distribution(self):
+        return self._conditional_get('/api/analysis/location-distribution')
+
+    def get_price_analysis(self):
+        return self._conditional_get('/api/analysis/price')
+
+    def get_time_series(self, spot_id: int = None):
+        params = {'spot_id': spot_id} if spot_id is not None else None
+        return self._conditional_get('/api/analysis/time-series', params)
+    
     def create_spot(self, data: dict):
         try:
             response = self.session.post(
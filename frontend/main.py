@@ -13,6 +13,7 @@ from backend.services.user_service import UserService
 from backend.services.route_planning import RoutePlanningService
 from backend.services.data_manager import DataManager
 from backend.services.auth import AuthService
+from backend.database import Session
 
 # 创建服务实例
 permission_service = DataPermissionService()
@@ -342,8 +343,7 @@ def show_spot_recommend():
     # 实现景点推荐的逻辑
 
 def show_route_plan():
-    st.title("路线规划")
-    # 实现路线规划的逻辑
+    show_route_planning()
 
 def show_similarity():
     st.title("相似度分析")
@@ -378,22 +378,45 @@ def show_route_planning():
         get_all_spots()
     )
     
+    col1, col2 = st.columns(2)
+    with col1:
+        n_days = st.number_input("游览天数", min_value=1, max_value=14, value=1)
+    with col2:
+        day_start, day_end = st.slider("每日游览时间", 0.0, 24.0, (9.0, 18.0), step=0.5)
+    
     if st.button("规划路线") and selected_spots:
-        route = route_planning_service.plan_optimal_route(
+        itinerary = route_planning_service.plan_itinerary(
             [s.id for s in selected_spots],
-            start_point=(30.5, 114.3)  # 默认起点
+            start_point=(30.5, 114.3),  # 默认起点
+            n_days=int(n_days),
+            day_start=day_start,
+            day_end=day_end
         )
         
         # 显示地图
         m = folium.Map(location=[30.5, 114.3], zoom_start=12)
         
-        # 添加路线
-        coordinates = [(s.latitude, s.longitude) for s in route['spots']]
-        folium.PolyLine(coordinates, weight=2, color='red').add_to(m)
+        # 每天的路线用不同颜色
+        colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'cadetblue']
+        for day in itinerary['days']:
+            coordinates = [(30.5, 114.3)] + [(s['latitude'], s['longitude']) for s in day['spots']]
+            folium.PolyLine(coordinates, weight=2,
+                            color=colors[(day['day'] - 1) % len(colors)]).add_to(m)
         
         # 显示总距离和预计用时
-        st.metric("总距离", f"{route['total_distance']:.1f}公里")
-        st.metric("预计用时", f"{len(selected_spots) * 2}小时")
+        st.metric("总距离", f"{itinerary['total_distance']:.1f}公里")
+        st.metric("预计用时", f"{itinerary['total_hours']:.1f}小时")
+        
+        for day in itinerary['days']:
+            st.write(f"### 第{day['day']}天（{day['hours']:.1f}小时，{day['distance']:.1f}公里）")
+            for s in day['spots']:
+                st.write(f"- {_format_hour(s['start'])}-{_format_hour(s['leave'])} {s['name']}")
+        
+        if itinerary['unscheduled']:
+            st.warning(f"有{len(itinerary['unscheduled'])}个景点在时间限制内无法安排")
+
+def _format_hour(hour: float) -> str:
+    return f"{int(hour):02d}:{int(round(hour % 1 * 60)) % 60:02d}"
 
 def show_real_time_dashboard():
     st.title("实时监控大屏")
@@ -515,4 +538,8 @@ def get_all_spots():
         return []
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        # 每次脚本运行结束后释放当前线程的数据库会话
+        Session.remove()
\ No newline at end of file
@@ -0,0 +1,17 @@
+import os
+import tempfile
+import pytest
+
+# backend.database在导入时连接DATABASE_URL，测试使用临时SQLite文件
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+
+from backend.database import Session, engine
+from backend.models import Base
+
+@pytest.fixture
+def session():
+    """每个测试使用新建的空表"""
+    Base.metadata.create_all(engine)
+    yield Session
+    Session.remove()
+    Base.metadata.drop_all(engine)
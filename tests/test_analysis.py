@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from backend.models import TouristSpot
+from backend.services.analysis import AnalysisService
+
+@pytest.fixture
+def spots(session):
+    rng = np.random.default_rng(0)
+    rows = [TouristSpot(id=i + 1, name=f'spot{i}', location='ABC'[i % 3],
+                        price=None if i % 7 == 0 else float(rng.uniform(-20, 600)),
+                        rating=float(rng.uniform(0, 5)))
+            for i in range(120)]
+    session.add_all(rows)
+    session.commit()
+    return rows
+
+def _prices(spots, location=None):
+    return [s.price for s in spots if s.price is not None and location in (None, s.location)]
+
+@pytest.mark.parametrize('window_functions', [True, False])
+def test_location_medians(spots, window_functions, monkeypatch):
+    service = AnalysisService()
+    monkeypatch.setattr(service, '_supports_window_functions', lambda: window_functions)
+    medians = service._location_price_medians()
+    for location in 'ABC':
+        assert medians[location] == pytest.approx(np.median(_prices(spots, location)))
+
+@pytest.mark.parametrize('q', [0.0, 0.25, 0.5, 0.9, 1.0])
+def test_price_percentile_matches_numpy(spots, q):
+    assert AnalysisService().get_price_percentile(q) == pytest.approx(np.percentile(_prices(spots), q * 100))
+
+def test_price_bands_include_values_below_first_edge(spots):
+    bands = AnalysisService().get_price_bands()
+    prices = np.array(_prices(spots))
+    assert bands['<0'] == int((prices < 0).sum())
+    assert sum(bands.values()) == len(prices)
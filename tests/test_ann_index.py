@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from backend.services.ann_index import ExactIndex, IVFIndex, create_index
+
+def _vectors(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.fixture
+def data():
+    return np.arange(100, 1100, dtype=np.int64), _vectors(1000)
+
+def _ids(results):
+    return [[spot_id for spot_id, _ in row] for row in results]
+
+def test_exact_search_returns_sorted_top_k(data):
+    ids, vectors = data
+    index = ExactIndex(16)
+    index.build(ids, vectors)
+    result = index.search(vectors[:3], 5)
+    for row, query_id in zip(result, ids[:3]):
+        assert row[0][0] == query_id
+        scores = [score for _, score in row]
+        assert scores == sorted(scores, reverse=True)
+
+def test_ivf_probing_all_lists_matches_exact(data):
+    ids, vectors = data
+    exact, ivf = ExactIndex(16), IVFIndex(16, n_lists=20)
+    exact.build(ids, vectors)
+    ivf.build(ids, vectors)
+    queries = _vectors(20, seed=1)
+    assert _ids(ivf.search(queries, 10, n_probe=20)) == _ids(exact.search(queries, 10))
+
+def test_ivf_recall_grows_with_n_probe(data):
+    ids, vectors = data
+    exact, ivf = ExactIndex(16), IVFIndex(16, n_lists=20)
+    exact.build(ids, vectors)
+    ivf.build(ids, vectors)
+    queries = _vectors(50, seed=2)
+    truth = [set(row) for row in _ids(exact.search(queries, 10))]
+
+    def recall(n_probe):
+        found = _ids(ivf.search(queries, 10, n_probe=n_probe))
+        return np.mean([len(t & set(f)) / 10 for t, f in zip(truth, found)])
+
+    assert recall(1) <= recall(4) <= recall(20) == 1.0
+
+def test_ivf_add_and_remove(data):
+    ids, vectors = data
+    ivf = IVFIndex(16, n_lists=10)
+    ivf.build(ids[:900], vectors[:900])
+    ivf.add(ids[900:], vectors[900:])
+    assert len(ivf) == 1000
+    assert ivf.search(vectors[950], 1, n_probe=10)[0][0][0] == ids[950]
+
+    ivf.remove(ids[950:960])
+    assert len(ivf) == 990
+    found = {spot_id for spot_id, _ in ivf.search(vectors[950], 20, n_probe=10)[0]}
+    assert not found & set(ids[950:960].tolist())
+
+def test_ivf_save_and_load_roundtrip(data, tmp_path):
+    ids, vectors = data
+    ivf = create_index('ivf', 16, n_lists=10, n_probe=3)
+    ivf.build(ids, vectors)
+    ivf.save(str(tmp_path / 'index'))
+    loaded = IVFIndex.load(str(tmp_path / 'index'))
+    assert isinstance(loaded, IVFIndex) and loaded.n_probe == 3
+    queries = _vectors(5, seed=3)
+    assert _ids(loaded.search(queries, 5)) == _ids(ivf.search(queries, 5))
+
+def test_unknown_index_kind():
+    with pytest.raises(ValueError):
+        create_index('hnsw', 16)
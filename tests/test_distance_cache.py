@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from backend.config import Config
+from backend.services.distance_cache import DistanceCache, plan_route_task
+from backend.utils.geo import haversine_matrix
+
+START = (30.5, 110.5)
+
+@pytest.fixture
+def points():
+    return np.arange(1, 201), np.random.default_rng(0).uniform([30, 110], [31, 111], size=(200, 2))
+
+@pytest.fixture(autouse=True)
+def growth(monkeypatch):
+    monkeypatch.setattr(Config, 'ROUTE_DISTANCE_CACHE_MIN_GROWTH', 50)
+    monkeypatch.setattr(Config, 'ROUTE_DISTANCE_CACHE_GROWTH_RATIO', 0.25)
+
+def _expected(coordinates):
+    nodes = np.vstack([START, coordinates])
+    return haversine_matrix(nodes)
+
+def test_small_growth_is_computed_without_rebuilding(points, tmp_path):
+    ids, coordinates = points
+    cache = DistanceCache(str(tmp_path))
+    assert cache.ensure(ids[:100], coordinates[:100])
+    snapshot = cache.snapshot
+
+    # 新增40个景点、移动一个已缓存景点：少于阈值，不重建
+    moved = coordinates.copy()
+    moved[5] += 0.1
+    assert not cache.ensure(ids[:140], moved[:140])
+    assert cache.snapshot == snapshot
+
+    route = [6, 120, 3, 139, 50]
+    rows = np.asarray(route) - 1
+    np.testing.assert_allclose(cache.route_matrix(route, START, moved[rows]), _expected(moved[rows]), atol=1e-3)
+
+def test_large_growth_rebuilds_and_reuses_cached_distances(points, tmp_path):
+    ids, coordinates = points
+    cache = DistanceCache(str(tmp_path))
+    cache.ensure(ids[:100], coordinates[:100])
+    assert cache.ensure(ids, coordinates)
+    assert len(cache) == 200 and cache.covers(ids, coordinates)
+    np.testing.assert_allclose(cache.matrix, haversine_matrix(coordinates), atol=1e-3)
+
+    # 另一个进程打开同一目录时读到已发布的快照
+    assert DistanceCache(str(tmp_path)).snapshot == cache.snapshot
+
+def test_plan_route_task_with_uncached_spots(points, tmp_path):
+    ids, coordinates = points
+    cache = DistanceCache(str(tmp_path))
+    cache.ensure(ids[:100], coordinates[:100])
+    route = [10, 150, 20, 160]
+    rows = np.asarray(route) - 1
+    result = plan_route_task(cache, (route, coordinates[rows], START, True, 0.1))
+    assert sorted(result['route']) == sorted(route)
+    order = [0] + [route.index(i) + 1 for i in result['route']] + [0]
+    dist = _expected(coordinates[rows])
+    assert result['total_distance'] == pytest.approx(dist[order[:-1], order[1:]].sum(), rel=1e-5)
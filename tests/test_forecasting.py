@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from backend.models import TouristSpot, VisitorRollup
+from backend.services.forecasting import BatchForecaster, backtest_batch, design_matrix, fit_batch
+
+HISTORY = 84
+
+def _series(rng, n):
+    X = design_matrix(np.arange(HISTORY), HISTORY)
+    coef = rng.normal(size=(n, X.shape[1])) * 10
+    coef[:, 0] += 100
+    return X, coef, coef @ X.T
+
+def test_recovers_noise_free_series_with_gaps():
+    rng = np.random.default_rng(0)
+    X, coef, values = _series(rng, 50)
+    mask = rng.random(values.shape) > 0.3
+    fitted, r2 = fit_batch(np.where(mask, values, np.nan), mask, X, ridge=1e-9)
+    np.testing.assert_allclose(fitted, coef, rtol=1e-5, atol=1e-4)
+    np.testing.assert_allclose(r2, 1.0, atol=1e-8)
+
+def test_matches_per_series_ridge_solution():
+    rng = np.random.default_rng(1)
+    X, _, values = _series(rng, 20)
+    values = values + rng.normal(scale=5, size=values.shape)
+    mask = rng.random(values.shape) > 0.5
+    fitted, _ = fit_batch(values, mask, X, ridge=0.5)
+    penalty = np.full(X.shape[1], 0.5)
+    penalty[0] = 1e-9
+    for i in range(len(values)):
+        Xi, yi = X[mask[i]], values[i, mask[i]]
+        expected = np.linalg.solve(Xi.T @ Xi + np.diag(penalty), Xi.T @ yi)
+        np.testing.assert_allclose(fitted[i], expected, rtol=1e-8, atol=1e-8)
+
+def test_sparse_series_falls_back_to_mean():
+    X = design_matrix(np.arange(HISTORY), HISTORY)
+    values = np.zeros((1, HISTORY))
+    mask = np.zeros((1, HISTORY), dtype=bool)
+    values[0, 40], mask[0, 40] = 30.0, True
+    coef, r2 = fit_batch(values, mask, X)
+    assert (coef @ X.T)[0, 40] == pytest.approx(30.0, rel=1e-3)
+    assert r2[0] == 0.0
+
+def test_backtest_without_holdout_observations_is_nan():
+    rng = np.random.default_rng(2)
+    X, _, values = _series(rng, 2)
+    mask = np.ones_like(values, dtype=bool)
+    mask[1, -7:] = False
+    mae, mape = backtest_batch(values, mask, X, holdout=7)
+    assert mae[0] == pytest.approx(0.0, abs=1e-2) and np.isnan(mae[1]) and np.isnan(mape[1])
+
+def test_forecast_aligns_each_spot_on_its_last_day(session):
+    session.add_all([TouristSpot(id=i, name=f'spot{i}') for i in (1, 2)])
+    end = datetime(2024, 6, 30)
+    for spot_id, last in ((1, end), (2, end - timedelta(days=10))):
+        for day in range(60):
+            session.add(VisitorRollup(spot_id=spot_id, granularity='day', period_start=last - timedelta(days=day),
+                                      visitor_count=50 + 10 * ((last - timedelta(days=day)).weekday() == 5),
+                                      revenue=0))
+    session.commit()
+
+    result = BatchForecaster(history_days=HISTORY, horizon=14, session=session).forecast()
+    assert result['spot_ids'].tolist() == [1, 2]
+    assert result['data_through'] == [end, end - timedelta(days=10)]
+    assert result['start_dates'] == [end + timedelta(days=1), end - timedelta(days=9)]
+    for spot, start in enumerate(result['start_dates']):
+        saturdays = [(start + timedelta(days=d)).weekday() == 5 for d in range(14)]
+        np.testing.assert_allclose(result['predictions'][spot], np.where(saturdays, 60, 50), atol=0.5)
+    assert result['recent_visitors'].tolist() == [360.0, 360.0]
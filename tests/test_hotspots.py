@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+from backend.services.hotspots import dbscan_haversine, summarize_hotspots
+from backend.utils.geo import EARTH_RADIUS_KM
+
+def _points(seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[30.0, 110.0], [30.2, 110.3], [39.9, 116.4]])
+    clusters = [center + rng.normal(scale=0.01, size=(60, 2)) for center in centers]
+    noise = rng.uniform([29, 109], [41, 118], size=(40, 2))
+    points = np.vstack(clusters + [noise])
+    return points[:, 0], points[:, 1]
+
+def _partition(labels, mask):
+    # 与编号无关的分组：每个簇的成员集合
+    return {frozenset(np.flatnonzero(mask & (labels == label)).tolist()) for label in set(labels[mask]) - {-1}}
+
+@pytest.mark.parametrize('chunk_size', [7, 5000])
+def test_matches_sklearn_haversine_dbscan(chunk_size):
+    latitudes, longitudes = _points()
+    eps_km, min_samples = 2.0, 5
+    labels = dbscan_haversine(latitudes, longitudes, eps_km, min_samples, chunk_size=chunk_size)
+    reference = DBSCAN(eps=eps_km / EARTH_RADIUS_KM, min_samples=min_samples, metric='haversine',
+                       algorithm='ball_tree').fit(np.radians(np.column_stack([latitudes, longitudes])))
+
+    core = np.zeros(len(labels), dtype=bool)
+    core[reference.core_sample_indices_] = True
+    assert _partition(labels, core) == _partition(reference.labels_, core)
+    assert np.array_equal(labels < 0, reference.labels_ < 0)
+
+def test_cluster_across_antimeridian():
+    rng = np.random.default_rng(1)
+    latitudes = rng.normal(0, 0.005, 40)
+    longitudes = np.where(np.arange(40) % 2, 179.998, -179.998) + rng.normal(0, 0.001, 40)
+    labels = dbscan_haversine(latitudes, longitudes, 1.0, 5)
+    assert set(labels) == {0}
+
+    hotspot, = summarize_hotspots(np.arange(40), latitudes, longitudes, labels, 1.0)
+    assert hotspot['size'] == 40
+    assert abs(hotspot['centroid']['longitude']) > 179.9
+    assert hotspot['radius_km'] < 5
+
+def test_all_noise_and_empty_input():
+    assert dbscan_haversine(np.array([0.0, 10.0]), np.array([0.0, 10.0]), 1.0, 2).tolist() == [-1, -1]
+    assert len(dbscan_haversine(np.empty(0), np.empty(0), 1.0, 2)) == 0
+
+def test_summaries_sorted_by_size():
+    latitudes, longitudes = _points()
+    labels = dbscan_haversine(latitudes, longitudes, 2.0, 5)
+    hotspots = summarize_hotspots(np.arange(len(labels)) + 100, latitudes, longitudes, labels, 2.0)
+    sizes = [h['size'] for h in hotspots]
+    assert sizes == sorted(sizes, reverse=True)
+    assert sum(sizes) == int((labels >= 0).sum())
+    assert min(min(h['members']) for h in hotspots) >= 100
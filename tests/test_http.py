@@ -0,0 +1,66 @@
+import gzip
+import json
+import pytest
+from flask import Flask, jsonify
+from backend.utils.http import compress_response, conditional
+from backend.utils.versioning import increment_table_versions
+
+@pytest.fixture
+def client(session):
+    app = Flask(__name__)
+    app.calls = 0
+
+    @app.route('/spots')
+    @conditional(['tourist_spots'])
+    def spots():
+        app.calls += 1
+        return jsonify({'spots': list(range(500))})
+
+    @app.route('/missing')
+    @conditional(['tourist_spots'])
+    def missing():
+        return jsonify({'error': 'not found'}), 404
+
+    app.after_request(compress_response)
+    return app.test_client()
+
+def _bump(session, *tables):
+    with session.get_bind().begin() as connection:
+        increment_table_versions(connection, tables)
+
+def test_etag_returns_304_until_table_changes(client, session):
+    first = client.get('/spots')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    cached = client.get('/spots', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert client.application.calls == 1
+
+    _bump(session, 'tourist_spots')
+    changed = client.get('/spots', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert client.application.calls == 2
+
+def test_etag_ignores_unrelated_tables(client, session):
+    etag = client.get('/spots').headers['ETag']
+    _bump(session, 'visitor_data')
+    assert client.get('/spots', headers={'If-None-Match': etag}).status_code == 304
+
+def test_etag_depends_on_query_string(client):
+    etag = client.get('/spots?page=1').headers['ETag']
+    assert client.get('/spots?page=2', headers={'If-None-Match': etag}).status_code == 200
+
+def test_error_responses_are_not_tagged(client):
+    response = client.get('/missing')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+def test_large_json_is_gzipped(client):
+    response = client.get('/spots', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.get_data()))['spots'][-1] == 499
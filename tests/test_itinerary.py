@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from backend.services.itinerary import ItinerarySolver
+from backend.utils.geo import haversine_matrix
+
+def _solver(n, n_days=2, seed=0, open_hours=None, close_hours=None, visit=1.5):
+    points = np.random.default_rng(seed).uniform([30, 110], [30.3, 110.3], size=(n + 1, 2))
+    travel = haversine_matrix(points) / 30
+    return ItinerarySolver(
+        travel, np.r_[0, np.full(n, visit)],
+        open_hours if open_hours is not None else np.full(n + 1, 8.0),
+        close_hours if close_hours is not None else np.full(n + 1, 18.0),
+        n_days, day_start=8.0, day_end=20.0, seed=seed)
+
+def _assert_feasible(solver, result, n):
+    visited = [node for route in result['days'] for node in route]
+    assert sorted(visited + result['unscheduled']) == list(range(1, n + 1))
+    assert len(result['days']) == solver.n_days
+    for route in result['days']:
+        for stop in solver.schedule(route):
+            assert stop['start'] >= solver.open[stop['node']] - 1e-9
+            assert stop['leave'] <= solver.close[stop['node']] + 1e-9
+        assert solver.day_start + solver.day_duration(route) <= solver.day_end + 1e-9
+
+def test_schedules_all_spots_when_time_allows():
+    solver = _solver(8)
+    result = solver.solve(0.5)
+    _assert_feasible(solver, result, 8)
+    assert result['unscheduled'] == []
+    assert result['objective'] == pytest.approx(sum(solver._day_cost(route) for route in result['days']))
+
+def test_leaves_spots_unscheduled_when_days_are_full():
+    solver = _solver(20, n_days=1)
+    result = solver.solve(0.5)
+    _assert_feasible(solver, result, 20)
+    assert result['unscheduled']
+    assert result['objective'] >= solver.UNSCHEDULED_PENALTY * len(result['unscheduled'])
+
+def test_respects_time_windows():
+    # 景点1只在下午开放，景点2中午关门：同一天内必须先去景点2
+    open_hours = np.array([8.0, 14.0, 8.0])
+    close_hours = np.array([20.0, 18.0, 12.0])
+    solver = _solver(2, n_days=1, open_hours=open_hours, close_hours=close_hours)
+    result = solver.solve(0.2)
+    _assert_feasible(solver, result, 2)
+    assert result['days'] == [[2, 1]]
+
+def test_infeasible_spot_is_unscheduled():
+    close_hours = np.array([20.0, 18.0, 8.5])
+    solver = _solver(2, n_days=1, close_hours=close_hours)
+    result = solver.solve(0.2)
+    assert result['unscheduled'] == [2]
+
+def test_same_seed_gives_same_plan():
+    first = _solver(12, seed=3).solve(10)
+    second = _solver(12, seed=3).solve(10)
+    assert first['days'] == second['days'] and first['objective'] == second['objective']
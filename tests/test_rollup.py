@@ -0,0 +1,107 @@
+from datetime import datetime
+import pytest
+from sqlalchemy.exc import OperationalError
+from backend.models import TableVersion, TouristSpot, VisitorData, VisitorRollup
+from backend.services.data_manager import DataManager
+from backend.services.rollup import RollupService
+from backend.utils.upsert import upsert
+from backend.utils.versioning import get_table_versions, increment_table_versions
+
+def _rollups(session):
+    return {
+        (r.spot_id, r.granularity, r.period_start): (r.visitor_count, r.revenue)
+        for r in session.query(VisitorRollup)
+    }
+
+def _add_spots(session, n=2):
+    session.add_all([TouristSpot(id=i, name=f'spot{i}') for i in range(1, n + 1)])
+    session.commit()
+
+def test_upsert_inserts_then_updates(session):
+    table = TableVersion.__table__
+    now = datetime(2024, 1, 1)
+    with session.get_bind().begin() as connection:
+        upsert(connection, table, [{'table_name': 'a', 'version': 1, 'updated_at': now}], ('table_name',))
+        upsert(connection, table, [{'table_name': 'a', 'version': 5, 'updated_at': now},
+                                   {'table_name': 'b', 'version': 2, 'updated_at': now}], ('table_name',))
+    assert get_table_versions(session, ['a', 'b', 'c']) == {'a': 5, 'b': 2, 'c': 0}
+
+def test_upsert_callable_updates_accumulate(session):
+    table = TableVersion.__table__
+    now = datetime(2024, 1, 1)
+    with session.get_bind().begin() as connection:
+        for _ in range(3):
+            upsert(connection, table, [{'table_name': 'a', 'version': 2, 'updated_at': now}], ('table_name',),
+                   updates=lambda new: {'version': table.c.version + new.version})
+    assert get_table_versions(session, ['a']) == {'a': 6}
+
+def test_increment_table_versions(session):
+    with session.get_bind().begin() as connection:
+        increment_table_versions(connection, ['a', 'b'])
+        increment_table_versions(connection, ['a'])
+    assert get_table_versions(session, ['a', 'b']) == {'a': 2, 'b': 1}
+
+def test_apply_accumulates_existing_periods(session):
+    _add_spots(session)
+    rollups = RollupService(session)
+    rollups.apply([VisitorData(spot_id=1, visit_date=datetime(2024, 1, 5, 10), visitor_count=10, revenue=1.5)])
+    rollups.apply([VisitorData(spot_id=1, visit_date=datetime(2024, 1, 5, 15), visitor_count=5, revenue=0.5),
+                   VisitorData(spot_id=1, visit_date=datetime(2024, 2, 1), visitor_count=7, revenue=1.0),
+                   VisitorData(spot_id=2, visit_date=datetime(2024, 1, 5), visitor_count=3, revenue=0.0)])
+    session.commit()
+
+    result = _rollups(session)
+    assert result[(1, 'day', datetime(2024, 1, 5))] == (15, 2.0)
+    assert result[(1, 'month', datetime(2024, 1, 1))] == (15, 2.0)
+    assert result[(1, 'month', datetime(2024, 2, 1))] == (7, 1.0)
+    assert result[(1, 'quarter', datetime(2024, 1, 1))] == (22, 3.0)
+    assert result[(2, 'quarter', datetime(2024, 1, 1))] == (3, 0.0)
+
+def test_apply_matches_rebuild(session):
+    _add_spots(session, 3)
+    records = [
+        VisitorData(spot_id=1 + i % 3, visit_date=datetime(2024, 1 + i % 6, 1 + i % 28, i % 24),
+                    visitor_count=i, revenue=i * 0.5)
+        for i in range(200)
+    ]
+    session.add_all(records)
+    session.flush()
+    rollups = RollupService(session)
+    for i in range(0, len(records), 30):
+        rollups.apply(records[i:i + 30])
+    session.commit()
+    incremental = _rollups(session)
+
+    rollups.rebuild(batch_size=17)
+    assert _rollups(session) == incremental
+
+def test_add_visitor_data_retries_operational_errors(session, monkeypatch):
+    _add_spots(session)
+    manager = DataManager()
+    calls = []
+    original = RollupService.apply
+
+    def flaky_apply(self, records):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError('UPDATE visitor_rollups', {}, Exception('deadlock'))
+        return original(self, records)
+
+    monkeypatch.setattr(RollupService, 'apply', flaky_apply)
+    assert manager.add_visitor_data([{'spot_id': 1, 'visit_date': datetime(2024, 1, 1),
+                                      'visitor_count': 4, 'revenue': 2.0}]) == 1
+    assert len(calls) == 2
+    assert session.query(VisitorData).count() == 1
+    assert _rollups(session)[(1, 'day', datetime(2024, 1, 1))] == (4, 2.0)
+
+def test_add_visitor_data_raises_after_rollback(session, monkeypatch):
+    _add_spots(session)
+
+    def broken_apply(self, records):
+        raise ValueError('bad record')
+
+    monkeypatch.setattr(RollupService, 'apply', broken_apply)
+    with pytest.raises(ValueError):
+        DataManager().add_visitor_data([{'spot_id': 1, 'visit_date': datetime(2024, 1, 1),
+                                         'visitor_count': 4, 'revenue': 2.0}])
+    assert session.query(VisitorData).count() == 0
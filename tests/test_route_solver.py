@@ -0,0 +1,45 @@
+from itertools import permutations
+import numpy as np
+import pytest
+from backend.services.route_solver import solve_route
+from backend.utils.geo import haversine_matrix
+
+def _length(dist, order, return_to_start):
+    path = [0] + list(order) + ([0] if return_to_start else [])
+    return sum(dist[a, b] for a, b in zip(path, path[1:]))
+
+def _optimum(dist, return_to_start):
+    return min(_length(dist, order, return_to_start) for order in permutations(range(1, len(dist))))
+
+def _random_points(n, seed):
+    return np.random.default_rng(seed).uniform([30, 110], [31, 111], size=(n, 2))
+
+@pytest.mark.parametrize('return_to_start', [True, False])
+def test_visits_every_node_once(return_to_start):
+    dist = haversine_matrix(_random_points(40, 0))
+    order = solve_route(dist, 0.2, return_to_start)
+    assert sorted(order) == list(range(1, 40))
+
+@pytest.mark.parametrize('return_to_start', [True, False])
+def test_finds_circle_order(return_to_start):
+    # 圆上等距的点：最优路线沿圆周行走，回到起点时为周长，否则少走一条弦
+    angles = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+    points = np.column_stack([30 + 0.5 * np.sin(angles), 110 + 0.5 * np.cos(angles)])
+    ring = haversine_matrix(points)
+    perimeter = sum(ring[i, (i + 1) % 12] for i in range(12))
+    shuffled = np.vstack([points[:1], np.random.default_rng(1).permutation(points[1:])])
+    dist = haversine_matrix(shuffled)
+    order = solve_route(dist, 0.5, return_to_start)
+    expected = perimeter if return_to_start else perimeter - ring[0, 1]
+    assert _length(dist, order, return_to_start) == pytest.approx(expected, rel=1e-3)
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('return_to_start', [True, False])
+def test_close_to_brute_force_optimum(seed, return_to_start):
+    dist = haversine_matrix(_random_points(8, seed))
+    order = solve_route(dist, 0.2, return_to_start)
+    assert _length(dist, order, return_to_start) <= _optimum(dist, return_to_start) * 1.05 + 1e-9
+
+def test_trivial_inputs():
+    assert solve_route(np.zeros((1, 1))) == []
+    assert solve_route(np.array([[0, 1], [1, 0]])) == [1]
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+from backend.models import SpotVisitorStats, TouristSpot
+from backend.services.data_manager import DataManager
+from backend.services.visitor_stats import VisitorStatsService
+from backend.utils.versioning import get_table_versions
+
+COLUMNS = ('latest_visit_date', 'latest_visitor_count', 'latest_revenue', 'visitors_7d', 'visitors_30d')
+
+def _snapshots(session):
+    session.expire_all()
+    return {s.spot_id: tuple(getattr(s, c) for c in COLUMNS) for s in session.query(SpotVisitorStats)}
+
+def test_incremental_refresh_matches_backfill(session):
+    session.add_all([TouristSpot(id=i, name=f'spot{i}') for i in (1, 2, 3)])
+    session.commit()
+    manager = DataManager()
+    start = datetime(2024, 3, 1)
+    for day in range(45):
+        manager.add_visitor_data([
+            {'spot_id': 1 + (day + i) % 3, 'visit_date': start + timedelta(days=day, hours=i),
+             'visitor_count': day * 10 + i, 'revenue': float(day + i)}
+            for i in range(3) if (day + i) % 4
+        ])
+    incremental = _snapshots(session)
+    assert set(incremental) == {1, 2, 3}
+
+    VisitorStatsService(session).backfill()
+    assert _snapshots(session) == incremental
+
+def test_refresh_spots_upserts_and_bumps_version(session):
+    session.add(TouristSpot(id=1, name='spot1'))
+    session.commit()
+    manager = DataManager()
+    manager.add_visitor_data([{'spot_id': 1, 'visit_date': datetime(2024, 1, 1),
+                               'visitor_count': 5, 'revenue': 1.0}])
+    version = get_table_versions(session, [SpotVisitorStats.__tablename__])
+    manager.add_visitor_data([{'spot_id': 1, 'visit_date': datetime(2024, 1, 3),
+                               'visitor_count': 7, 'revenue': 2.0}])
+
+    assert get_table_versions(session, [SpotVisitorStats.__tablename__]) != version
+    assert _snapshots(session) == {1: (datetime(2024, 1, 3), 7, 2.0, 12, 12)}